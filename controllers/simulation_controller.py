@@ -4,34 +4,85 @@ Simulation Controller (Refactored)
 ใช้ Composition pattern กับ modules ที่แยกออกมา
 """
 
+import copy
 import os
-import json
 import joblib
+from functools import cached_property
+import numpy as np
 
 from loguru import logger
 
+try:
+    import orjson
+
+    def _parse_json(data):
+        return orjson.loads(data)
+except ImportError:  # fallback เมื่อไม่ได้ติดตั้ง orjson
+    import json
+
+    def _parse_json(data):
+        return json.loads(data)
+
 from core.settings import settings
-from utils.grid_utils import GridUtils
+from utils.grid_utils import GridUtils, NEIGHBORS8
 from utils.display_manager import DisplayManager, SimulationRenderer
 from utils.pathfinding import PathFinder
 from utils.deadlock_resolver import DeadlockResolver
-from utils.robot_manager import RobotManager
+from utils.robot_manager import RobotManager, PositionWindow
+from utils.robot_table import RobotTable, STATE_CODES
 from utils.route_analyzer import RouteAnalyzer, RouteCache
 
 
+# (path, mtime_ns, size) -> parsed config (ห้ามแก้ไข: _load_config คืน deep copy ให้แต่ละ controller)
+_CONFIG_CACHE = {}
+
+
 class SimulationController:
+    # methods ของ sub-modules ที่ผูกเข้ากับ controller โดยตรง (ไม่มี wrapper frame)
+    PATHFINDER_METHODS = (
+        "predict_future_positions", "get_dynamic_traffic_cost",
+        "build_deadlock_features", "smart_astar", "smooth_path",
+        "is_narrow_passage", "reserve_robot_path", "clear_robot_reservations",
+        "can_enter_dropoff", "can_enter_pickup", "get_robot_priority",
+        "get_priority_order",
+    )
+    RESOLVER_METHODS = (
+        "get_robot_importance", "get_emergency_move",
+        "trace_wait_chain", "detect_deadlock_group", "resolve_deadlock_group",
+        "decide_who_yields", "find_yield_position", "find_retreat_path",
+        "make_decisive_action", "get_critical_paths", "is_in_critical_path",
+        "find_evacuation_spot", "is_near_active_dropoff",
+    )
+    MANAGER_METHODS = (
+        "get_traffic_density", "request_package", "detect_oscillation",
+        "clear_oscillation_history", "cleanup_orphaned_assignments",
+        "reassign_stuck_packages", "force_idle_robots_to_work",
+        "fix_robot_states", "update_mode_timers", "force_reset_stuck_state",
+        "get_blocked_for_robot",
+    )
+
+    # path ที่สั้นกว่านี้ไม่ต้อง smooth
+    SMOOTH_MIN_LENGTH = 4
+
     def __init__(self, config_path):
-        self.obstacles = set()
+        self.obstacles = frozenset()
+        self.obstacle_grid = None
+        self.rows = self.cols = 0
         self.corridor_map = {}
-        self.robots = []
+        self.robots = RobotTable()
+        self.occupancy = None
         self.packages = {}
+        self.delivered_count = 0
+        # container ของ phase 5-6 ใช้ซ้ำทุก step (ล้างด้วย begin_step_moves)
+        self.reserved_positions = set()
+        self.planned_moves = {}
         self.config_data = self._load_config(config_path)
         
         # Load settings from config if available
         self._load_settings_from_config()
         
         # Display Manager for activity tracking
-        self.display = DisplayManager()
+        self.display = DisplayManager(visible=not settings.HEADLESS)
         
         # Initialize Logic
         self._init_obstacles()
@@ -42,14 +93,11 @@ class SimulationController:
 
         self.logger = logger
 
-        # Load deadlock model
-        self.deadlock_model = joblib.load(settings.DEADLOCK_MODEL_PATH)
-
         # Initialize modules
         self._init_modules()
         
         # Renderer for display
-        self.renderer = SimulationRenderer(self.display)
+        self.renderer = SimulationRenderer(self.display, self.obstacle_grid, self.corridor_map)
 
     def _init_modules(self):
         """Initialize all sub-modules"""
@@ -69,9 +117,9 @@ class SimulationController:
             self.corridor_map, 
             self.robots, 
             self.packages,
-            self.deadlock_model,
-            self.route_analyzer,
-            self.route_cache
+            route_analyzer=self.route_analyzer,
+            route_cache=self.route_cache,
+            model_loader=lambda: self.deadlock_model
         )
         
         self.deadlock_resolver = DeadlockResolver(
@@ -89,53 +137,84 @@ class SimulationController:
             self.pathfinder
         )
 
+        self._bind_methods(self.pathfinder, self.PATHFINDER_METHODS)
+        self._bind_methods(self.deadlock_resolver, self.RESOLVER_METHODS)
+        self._bind_methods(self.robot_manager, self.MANAGER_METHODS)
+        self.update_pathfinder_step = self.pathfinder.update_step
+        # id -> robot ผ่าน dict ของ RobotTable โดยตรง (O(1) ไม่มี wrapper frame)
+        self.get_robot_by_id = self.robots.by_id.get
+
+    def _bind_methods(self, module, names):
+        """ผูก bound method ของ module เข้าเป็น attribute ของ controller"""
+        for name in names:
+            setattr(self, name, getattr(module, name))
+
+    @cached_property
+    def deadlock_model(self):
+        """โหลด deadlock model เมื่อใช้งานครั้งแรก (arrays ถูก mmap แบบ read-only)"""
+        return joblib.load(settings.DEADLOCK_MODEL_PATH, mmap_mode='r')
+
     def _load_settings_from_config(self):
         """โหลด settings จาก JSON config"""
-        config_settings = self.config_data.get('settings', {})
-        if 'rows' in config_settings:
-            settings.ROWS = config_settings['rows']
-        if 'cols' in config_settings:
-            settings.COLS = config_settings['cols']
-        if 'sleep' in config_settings:
-            settings.SLEEP = config_settings['sleep']
-        if 'max_wait' in config_settings:
-            settings.MAX_WAIT = config_settings['max_wait']
-        if 'max_steps' in config_settings:
-            settings.MAX_STEPS = config_settings['max_steps']
+        settings.apply_overrides(self.config_data.get('settings', {}))
 
     def _load_config(self, path):
         """อ่านไฟล์ JSON Config"""
         if not os.path.exists(path):
             print(f"Error: Config file '{path}' not found.")
             exit(1)
-            
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        if key not in _CONFIG_CACHE:
+            with open(path, 'rb') as f:
+                _CONFIG_CACHE[key] = _parse_json(f.read())
+        # controller เขียนค่าที่แปลงแล้ว (_pos, _pickup, ...) ลง config จึงต้องได้ชุดของตัวเอง
+        return copy.deepcopy(_CONFIG_CACHE[key])
 
     def _init_obstacles(self):
-        for wall in self.config_data.get('walls', []):
-            self.obstacles.update(GridUtils.create_wall(wall))
+        """สร้าง obstacle bitmap (uint8) และ frozenset สำหรับ modules ที่ใช้ tuple"""
+        rows, cols = settings.ROWS, settings.COLS
+        self.rows, self.cols = rows, cols
+        self.obstacle_grid = np.zeros((rows, cols), dtype=np.uint8)
+
+        walls = [GridUtils.wall_cells(wall) for wall in self.config_data.get('walls', [])]
+        if not walls:
+            self.obstacles = frozenset()
+            return
+
+        cells = np.vstack(walls)
+        inside = (
+            (cells[:, 0] >= 0) & (cells[:, 0] < rows)
+            & (cells[:, 1] >= 0) & (cells[:, 1] < cols)
+        )
+        self.obstacle_grid[cells[inside, 0], cells[inside, 1]] = 1
+        self.obstacles = frozenset(map(tuple, cells.tolist()))
 
     def _compute_corridor_map(self):
-        for r in range(settings.ROWS):
-            for c in range(settings.COLS):
-                if (r, c) in self.obstacles:
-                    self.corridor_map[(r, c)] = 0
-                    continue
-                
-                open_neighbors = 0
-                for dr in [-1, 0, 1]:
-                    for dc in [-1, 0, 1]:
-                        if dr == 0 and dc == 0:
-                            continue
-                        nr, nc = r + dr, c + dc
-                        if GridUtils.in_bounds(nr, nc) and (nr, nc) not in self.obstacles:
-                            open_neighbors += 1
-                
-                self.corridor_map[(r, c)] = open_neighbors
+        """นับช่องว่างรอบตัว (8 ทิศ) ของทุก cell ด้วย NumPy ในครั้งเดียว"""
+        rows, cols = settings.ROWS, settings.COLS
+        free = 1 - self.obstacle_grid
+
+        # Convolution กับ kernel 3x3 (ไม่นับตรงกลาง) บน grid ที่ pad ขอบด้วย 0
+        padded = np.pad(free, 1)
+        counts = np.zeros((rows, cols), dtype=np.uint8)
+        for dr, dc in NEIGHBORS8:
+            counts += padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+        counts *= free
+
+        self.corridor_grid = counts
+        self.corridor_map.update(
+            ((r, c), score)
+            for r, row in enumerate(counts.tolist())
+            for c, score in enumerate(row)
+        )
 
     def _init_robots(self):
         """โหลดข้อมูล Robot รองรับเฉพาะ Dictionary Format"""
+        self.robots.attach_grid(settings.ROWS, settings.COLS)
+        self.occupancy = self.robots.occupancy
+
         for i, config in enumerate(self.config_data.get('robots', [])):
             if not isinstance(config, dict):
                 print(f"Skipping invalid robot config (must be dict): {config}")
@@ -150,6 +229,7 @@ class SimulationController:
                 continue
 
             pos = GridUtils.parse_pos(pos_input)
+            config["_pos"] = pos
             
             self.robots.append({
                 "id": robot_id,
@@ -170,7 +250,7 @@ class SimulationController:
                 "stuck_count": 0,
                 "last_decision_step": 0,
                 "failed_paths": set(),
-                "position_history": [],
+                "position_history": PositionWindow(settings.OSCILLATION_WINDOW),
                 "evac_start_step": 0,
                 "yield_start_step": 0,
             })
@@ -184,6 +264,8 @@ class SimulationController:
             name = config.get("name", f"P{i+1}")
             pickup = GridUtils.parse_pos(config.get("pickup"))
             dropoff = GridUtils.parse_pos(config.get("dropoff"))
+            config["_pickup"] = pickup
+            config["_dropoff"] = dropoff
 
             self.packages[i] = {
                 "name": name,
@@ -194,40 +276,33 @@ class SimulationController:
             }
 
     def _validate_config(self):
-        errors = []
+        """ตรวจ bounds และกำแพงของทุกตำแหน่งที่โหลดมาในครั้งเดียวด้วย NumPy"""
+        # ตรวจเฉพาะ config แบบ dict ที่ _init_robots/_init_packages โหลดจริง
+        labels, positions = [], []
         for config in self.config_data.get('robots', []):
-            if isinstance(config, dict):
-                name = config.get("name", "Unknown")
-                pos_input = config.get("pos")
-            else:
-                name, pos_input = config
-                
-            pos = GridUtils.parse_pos(pos_input)
-            if not GridUtils.in_bounds(*pos):
-                errors.append(f"Robot {name}: position {pos} out of bounds")
-            if pos in self.obstacles:
-                errors.append(f"Robot {name}: position {pos} is inside a wall")
-        
+            if isinstance(config, dict) and "_pos" in config:
+                labels.append(f"Robot {config.get('name', 'Unknown')}: position")
+                positions.append(config["_pos"])
+
         for config in self.config_data.get('packages', []):
-            if isinstance(config, dict):
+            if isinstance(config, dict) and "_pickup" in config:
                 name = config.get("name", "Unknown")
-                pickup_input = config.get("pickup")
-                dropoff_input = config.get("dropoff")
-            else:
-                name, pickup_input, dropoff_input = config
-                
-            pickup = GridUtils.parse_pos(pickup_input)
-            dropoff = GridUtils.parse_pos(dropoff_input)
-            
-            if not GridUtils.in_bounds(*pickup):
-                errors.append(f"Package {name}: pickup {pickup} out of bounds")
-            if pickup in self.obstacles:
-                errors.append(f"Package {name}: pickup {pickup} is inside a wall")
-            
-            if not GridUtils.in_bounds(*dropoff):
-                errors.append(f"Package {name}: dropoff {dropoff} out of bounds")
-            if dropoff in self.obstacles:
-                errors.append(f"Package {name}: dropoff {dropoff} is inside a wall")
+                labels.append(f"Package {name}: pickup")
+                positions.append(config["_pickup"])
+                labels.append(f"Package {name}: dropoff")
+                positions.append(config["_dropoff"])
+
+        errors = []
+        if positions:
+            pos_arr = np.array(positions, dtype=np.int64).reshape(-1, 2)
+            rows_idx, cols_idx = pos_arr[:, 0], pos_arr[:, 1]
+            oob = (rows_idx < 0) | (rows_idx >= self.rows) | (cols_idx < 0) | (cols_idx >= self.cols)
+            in_wall = np.zeros(len(pos_arr), dtype=bool)
+            in_wall[~oob] = self.obstacle_grid[rows_idx[~oob], cols_idx[~oob]].astype(bool)
+
+            for i in np.flatnonzero(oob | in_wall):
+                reason = "out of bounds" if oob[i] else "is inside a wall"
+                errors.append(f"{labels[i]} {positions[i]} {reason}")
         
         if errors:
             print("Configuration Errors:")
@@ -236,142 +311,32 @@ class SimulationController:
             print("\nPlease fix the configuration before running.")
             exit(1)
 
-    # ======================
-    # DELEGATOR METHODS
-    # ======================
-    
-    # PathFinder delegators
-    def predict_future_positions(self, robot, steps=3):
-        return self.pathfinder.predict_future_positions(robot, steps)
-
-    def get_dynamic_traffic_cost(self, pos, robot, future_predictions):
-        return self.pathfinder.get_dynamic_traffic_cost(pos, robot, future_predictions)
-
-    def build_deadlock_features(self, robot, curr, nxt):
-        return self.pathfinder.build_deadlock_features(robot, curr, nxt)
-
-    def smart_astar(self, start, goal, blocked, robot):
-        return self.pathfinder.smart_astar(start, goal, blocked, robot)
-
-    def smooth_path(self, path, robot):
-        return self.pathfinder.smooth_path(path, robot)
-
-    def is_narrow_passage(self, pos):
-        return self.pathfinder.is_narrow_passage(pos)
-
-    def update_pathfinder_step(self, step):
-        """อัพเดท current step ให้ pathfinder สำหรับ Time-Space A*"""
-        self.pathfinder.update_step(step)
-
-    def reserve_robot_path(self, robot, path):
-        """จอง path สำหรับ robot ใน reservation table"""
-        self.pathfinder.reserve_robot_path(robot, path)
-
-    def clear_robot_reservations(self, robot):
-        """ล้าง reservations ของ robot"""
-        self.pathfinder.clear_robot_reservations(robot)
-
-    # DeadlockResolver delegators
-    def get_robot_by_id(self, robot_id):
-        return self.deadlock_resolver.get_robot_by_id(robot_id)
-
-    def get_robot_importance(self, robot):
-        return self.deadlock_resolver.get_robot_importance(robot)
-
-    def get_emergency_move(self, robot):
-        return self.deadlock_resolver.get_emergency_move(robot)
-
-    def trace_wait_chain(self, start_robot, max_depth=10):
-        return self.deadlock_resolver.trace_wait_chain(start_robot, max_depth)
-
-    def detect_deadlock_group(self):
-        return self.deadlock_resolver.detect_deadlock_group()
-
-    def resolve_deadlock_group(self, group):
-        return self.deadlock_resolver.resolve_deadlock_group(group)
-
-    def decide_who_yields(self, robot1, robot2):
-        return self.deadlock_resolver.decide_who_yields(robot1, robot2)
-
-    def find_yield_position(self, robot, yield_to_robot):
-        return self.deadlock_resolver.find_yield_position(robot, yield_to_robot)
-
-    def find_retreat_path(self, robot, steps=3):
-        return self.deadlock_resolver.find_retreat_path(robot, steps)
-
-    def make_decisive_action(self, robot):
-        return self.deadlock_resolver.make_decisive_action(robot)
-
-    def get_critical_paths(self):
-        return self.deadlock_resolver.get_critical_paths()
-
-    def is_in_critical_path(self, robot, critical_paths):
-        return self.deadlock_resolver.is_in_critical_path(robot, critical_paths)
-
-    def find_evacuation_spot(self, robot, critical_paths, reserved):
-        return self.deadlock_resolver.find_evacuation_spot(robot, critical_paths, reserved)
-
-    def is_near_active_dropoff(self, robot, radius=3):
-        return self.deadlock_resolver.is_near_active_dropoff(robot, radius)
-
-    # RobotManager delegators
-    def get_traffic_density(self, pos, robot_id):
-        return self.robot_manager.get_traffic_density(pos, robot_id)
-
-    def request_package(self, robot):
-        return self.robot_manager.request_package(robot)
-
-    def detect_oscillation(self, robot, window=5):
-        return self.robot_manager.detect_oscillation(robot, window)
-
-    def clear_oscillation_history(self, robot):
-        return self.robot_manager.clear_oscillation_history(robot)
-
-    def cleanup_orphaned_assignments(self):
-        return self.robot_manager.cleanup_orphaned_assignments()
-
-    def reassign_stuck_packages(self):
-        return self.robot_manager.reassign_stuck_packages()
-
-    def force_idle_robots_to_work(self):
-        return self.robot_manager.force_idle_robots_to_work()
-
-    def fix_robot_states(self):
-        return self.robot_manager.fix_robot_states()
-
-    def force_reset_stuck_state(self, robot, current_step):
-        return self.robot_manager.force_reset_stuck_state(robot, current_step)
-
-    def get_blocked_for_robot(self, robot, reserved_positions):
-        return self.robot_manager.get_blocked_for_robot(robot, reserved_positions)
-
     # ======================
     # HELPER & RULES (kept in controller)
     # ======================
     def is_safe_cell(self, pos):
         r, c = pos
-        if not GridUtils.in_bounds(r, c):
-            return False
-        if pos in self.obstacles:
+        if not (0 <= r < self.rows and 0 <= c < self.cols):
             return False
-        return True
-
-    def can_enter_dropoff(self, robot, pos):
-        return self.pathfinder.can_enter_dropoff(robot, pos)
+        return pos not in self.obstacles
 
-    def can_enter_pickup(self, robot, pos):
-        return self.pathfinder.can_enter_pickup(robot, pos)
+    def _occupant_at(self, pos):
+        """index ของ robot ที่อยู่ที่ pos หรือ -1 ถ้าว่าง/นอก grid"""
+        r, c = pos
+        if not (0 <= r < self.rows and 0 <= c < self.cols):
+            return -1
+        return self.occupancy[r, c]
 
     def is_collision_free(self, robot, pos):
-        for other in self.robots:
-            if other["id"] != robot["id"] and other["pos"] == pos:
-                return False
-        return True
+        occupant = self._occupant_at(pos)
+        return occupant < 0 or occupant == self.robots.index_of(robot["id"])
 
     def is_valid_move(self, robot, pos, reserved_positions=None):
-        if not self.is_safe_cell(pos):
+        r, c = pos
+        if not (0 <= r < self.rows and 0 <= c < self.cols) or pos in self.obstacles:
             return False
-        if not self.is_collision_free(robot, pos):
+        occupant = self.occupancy[r, c]
+        if occupant >= 0 and occupant != self.robots.index_of(robot["id"]):
             return False
         if not self.can_enter_dropoff(robot, pos):
             return False
@@ -381,22 +346,84 @@ class SimulationController:
             return False
         return True
 
-    def get_robot_priority(self, robot):
-        return self.pathfinder.get_robot_priority(robot)
-
-    def is_swap(self, rb, nxt, planned_moves):
-        for oid, onxt in planned_moves.items():
-            if oid == rb["id"]: continue
-            other = self.get_robot_by_id(oid)
-            if other and onxt == rb["pos"] and nxt == other["pos"]:
-                return True
-        return False
+    def can_commit(self, robot, nxt, reserved_positions, planned_moves):
+        """
+        ตรวจว่า robot ย้ายไป nxt ได้ในรอบนี้หรือไม่ (รวม is_valid_move + ตรวจการสลับตำแหน่ง)
+        คืน None ถ้าย้ายได้ หรือเหตุผลที่ย้ายไม่ได้ ("RESERVED", "SWAP",
+        "OCCUPIED", "INVALID", "DROPOFF", "PICKUP") โดยเช็คตัวที่ถูกที่สุดก่อน
+        """
+        if nxt in reserved_positions:
+            return "RESERVED"
+        occupant = self._occupant_at(nxt)
+        if occupant >= 0:
+            other = self.robots[occupant]
+            if other["id"] != robot["id"]:
+                if planned_moves.get(other["id"]) == robot["pos"]:
+                    return "SWAP"
+                return "OCCUPIED"
+        r, c = nxt
+        if not (0 <= r < self.rows and 0 <= c < self.cols) or nxt in self.obstacles:
+            return "INVALID"
+        if not self.can_enter_dropoff(robot, nxt):
+            return "DROPOFF"
+        if not self.can_enter_pickup(robot, nxt):
+            return "PICKUP"
+        return None
+
+    def final_check_candidates(self, wait_threshold):
+        """
+        robots ที่ต้องตรวจใน Final Path Check: ยังไม่อยู่ที่ home หรือรอเกิน wait_threshold
+        (กรองด้วย NumPy ครั้งเดียว แทนการเทียบ tuple ทีละตัว) เรียงตามลำดับใน self.robots
+        """
+        robots = self.robots
+        mask = ~robots.at_home() | (robots.wait_count > wait_threshold)
+        return [robots[i] for i in np.flatnonzero(mask).tolist()]
+
+    def begin_step_moves(self):
+        """ล้างตำแหน่งที่จองและการเดินที่วางแผนไว้ของ step ก่อน คืน (reserved_positions, planned_moves)"""
+        self.reserved_positions.clear()
+        self.planned_moves.clear()
+        return self.reserved_positions, self.planned_moves
+
+    def plan_path(self, robot, target, blocked, fallback=False):
+        """
+        หา path จากตำแหน่งปัจจุบันไปยัง target (smart_astar + smooth_path)
+        ข้าม smooth_path สำหรับ path สั้นหรือ target ที่อยู่ใกล้ (ไม่มีอะไรให้ smooth)
+        fallback=True: ถ้าหาไม่เจอ ลองใหม่โดย block เฉพาะ obstacles และ robot ตัวอื่น
+        """
+        path = self.smart_astar(robot["pos"], target, blocked, robot)
+        if len(path) > self.SMOOTH_MIN_LENGTH and GridUtils.manhattan(robot["pos"], target) > 3:
+            path = self.smooth_path(path, robot)
+
+        if not path and fallback:
+            blocked_minimal = set(self.obstacles)
+            for other in self.robots:
+                if other["id"] != robot["id"]:
+                    blocked_minimal.add(other["pos"])
+            path = self.plan_path(robot, target, blocked_minimal)
+        return path
+
+    def mark_delivered(self, pid):
+        """เปลี่ยน package เป็น DELIVERED และนับจำนวนที่ส่งแล้ว"""
+        pkg = self.packages[pid]
+        if pkg["status"] != "DELIVERED":
+            self.delivered_count += 1
+        pkg["status"] = "DELIVERED"
+
+    def all_tasks_complete(self):
+        """ส่งครบทุก package และ robot ทุกตัวว่าง (HOME ต้องอยู่ที่ home แล้ว)"""
+        if self.delivered_count != len(self.packages):
+            return False
+        counts = self.robots.state_counts
+        if counts[STATE_CODES["IDLE"]] + counts[STATE_CODES["HOME"]] != len(self.robots):
+            return False
+        return all(rb["pos"] == rb["home"] for rb in self.robots if rb["state"] == "HOME")
 
     # ======================
     # RENDER (delegated)
     # ======================
     def render(self, step):
-        self.renderer.render(step, self.robots, self.packages, self.obstacles, self.corridor_map)
+        self.renderer.render(step, self.robots, self.packages)
 
     def render_final_statistics(self, total_steps):
         self.renderer.render_final_statistics(total_steps, self.robots, self.packages)
\ No newline at end of file
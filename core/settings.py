@@ -5,6 +5,20 @@
 import os
 
 class Settings:
+    __slots__ = (
+        "BASE_DIR", "PATTERN_DIR", "DEADLOCK_MODEL_PATH", "LOG_DIR", "ROWS",
+        "COLS", "SLEEP", "MAX_WAIT", "MAX_STEPS", "TURN_PENALTY",
+        "TRAFFIC_PENALTY", "CORRIDOR_BONUS", "PREDICTION_STEPS",
+        "SMOOTHING_WEIGHT", "DECISION_WAIT_THRESHOLD", "FORCE_MOVE_THRESHOLD",
+        "DEADLOCK_THRESHOLD", "YIELD_THRESHOLD", "REASSIGN_THRESHOLD",
+        "OSCILLATION_WINDOW", "IDLE_RECHECK_INTERVAL", "ORPHAN_CHECK_INTERVAL",
+        "PENALTY_DECAY_RATE", "TRAFFIC_WEIGHT", "CONFLICT_WEIGHT",
+        "MAX_CELL_PENALTY", "YIELD_ZONE_DURATION", "PRIORITY_ZONE_DURATION",
+        "MIN_PRIORITY_DIFF", "YIELD_DISTANCE_THRESHOLD", "CONGESTION_RADIUS",
+        "CONGESTION_THRESHOLD", "USE_TIME_SPACE_ASTAR", "TIME_HORIZON",
+        "MAX_WAIT_ACTIONS", "WAIT_COST", "HEADLESS",
+    )
+
     def __init__(self):
         self.BASE_DIR = os.path.dirname(os.path.abspath(__file__))
         self.PATTERN_DIR = os.path.join(self.BASE_DIR, "../data/pattern_1.json")
@@ -15,6 +29,7 @@ class Settings:
         self.ROWS = 26
         self.COLS = 80
         self.SLEEP = 0.5
+        self.HEADLESS = False            # True = ไม่ render และไม่หน่วงเวลา (เช่น รันเก็บ log สำหรับ train)
         self.MAX_WAIT = 300
         self.MAX_STEPS = 1000
 
@@ -30,6 +45,7 @@ class Settings:
         self.YIELD_THRESHOLD = 3               # จำนวน wait ก่อนพิจารณา yield
 
         self.REASSIGN_THRESHOLD = 30           # จำนวน wait ก่อน reassign package
+        self.OSCILLATION_WINDOW = 5            # จำนวนตำแหน่งล่าสุดที่ใช้ตรวจการเดินวนซ้ำ
         self.IDLE_RECHECK_INTERVAL = 1         # ทุกๆ N steps ให้ IDLE robot ลองหา package ใหม่
         self.ORPHAN_CHECK_INTERVAL = 1         # ทุกๆ N steps ให้ตรวจ orphaned packages
 
@@ -54,4 +70,24 @@ class Settings:
         self.MAX_WAIT_ACTIONS = 5        # จำนวนครั้งสูงสุดที่ WAIT ติดต่อกัน
         self.WAIT_COST = 1.2             # cost ของการ WAIT (สูงกว่า MOVE เล็กน้อย)
 
-settings = Settings()
\ No newline at end of file
+    # key ใน JSON config -> ชื่อ setting
+    CONFIG_OVERRIDES = {
+        'rows': 'ROWS',
+        'cols': 'COLS',
+        'sleep': 'SLEEP',
+        'max_wait': 'MAX_WAIT',
+        'max_steps': 'MAX_STEPS',
+        'headless': 'HEADLESS',
+    }
+
+    def apply_overrides(self, config_settings):
+        """
+        เขียนค่าจาก JSON config ทับ settings เดิม (แก้ object เดิม ไม่สร้างใหม่
+        เพราะทุก module import `settings` ตัวเดียวกันไว้แล้ว)
+        """
+        for key, attr in self.CONFIG_OVERRIDES.items():
+            if key in config_settings:
+                setattr(self, attr, config_settings[key])
+        return self
+
+settings = Settings()
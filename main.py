@@ -1,10 +1,13 @@
 from loguru import logger
 from datetime import datetime
+import atexit
+import signal
 import time
 import os
 from controllers.simulation_controller import SimulationController
 from core.settings import settings
 from utils.grid_utils import GridUtils
+from utils.log_sink import RobotLogSink
 
 # ======================
 # LOGGER SETUP
@@ -20,7 +23,8 @@ logger.remove()
 logger.add(
     os.path.join(LOG_DIR, "system.log"),
     level="INFO",
-    format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}"
+    format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}",
+    enqueue=True
 )
 
 def main():
@@ -30,17 +34,51 @@ def main():
 
     print(f"Loading config from: {settings.PATTERN_DIR}")
     sim = SimulationController(settings.PATTERN_DIR)
+
+    # sink เดียวเขียนไฟล์ของทุก robot ผ่าน background thread (enqueue)
+    robot_sink = RobotLogSink(LOG_DIR, [rb["name"] for rb in sim.robots])
+    robot_sink_id = logger.add(
+        robot_sink,
+        level="INFO",
+        format="{time:YYYY-MM-DD HH:mm:ss} | {message}",
+        filter=RobotLogSink.accepts,
+        enqueue=True
+    )
+    robot_loggers = {rb["id"]: logger.bind(robot=rb["name"]) for rb in sim.robots}
+
+    # กันข้อความค้างใน buffer หาย: atexit สำรอง และแปลง SIGTERM เป็น SystemExit ให้ finally ทำงาน
+    atexit.register(robot_sink.close)
+    previous_sigterm = signal.signal(signal.SIGTERM, _exit_on_signal)
+
+    try:
+        run_simulation(sim, robot_loggers)
+    finally:
+        # รอให้ข้อความที่ค้างใน queue ถูกเขียนให้หมดก่อนปิดไฟล์
+        logger.remove(robot_sink_id)
+        robot_sink.close()
+        logger.complete()
+        signal.signal(signal.SIGTERM, previous_sigterm)
+        atexit.unregister(robot_sink.close)
+
+
+def _exit_on_signal(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+def run_simulation(sim, robot_loggers):
     step = 0
 
-    robot_loggers = {}
-    for rb in sim.robots:
-        robot_logger = logger.bind(robot=rb["name"])
-        robot_logger.add(
-            os.path.join(LOG_DIR, f"{rb['name']}.log"),
-            level="INFO",
-            format="{time:YYYY-MM-DD HH:mm:ss} | {message}"
-        )
-        robot_loggers[rb["id"]] = robot_logger
+    # ค่าคงที่จาก settings (ไม่เปลี่ยนระหว่างรัน) เก็บเป็น local
+    orphan_interval = settings.ORPHAN_CHECK_INTERVAL
+    idle_interval = settings.IDLE_RECHECK_INTERVAL
+    yield_threshold = settings.YIELD_THRESHOLD
+    max_steps = settings.MAX_STEPS
+    sleep_time = settings.SLEEP
+    headless = settings.HEADLESS
+    # headless: ข้ามการสร้างข้อความ activity ต่อการเดินแต่ละครั้ง (ไม่มีใครเห็น)
+    show_activity = sim.display.visible
+    # เวลาที่ step ถัดไปควรเริ่ม: step ที่ช้ากว่า SLEEP จะไม่ทำให้ step ต่อๆ ไปช้าสะสม
+    next_deadline = time.monotonic()
     
     while True:
         step += 1
@@ -51,13 +89,13 @@ def main():
         # 1. Maintenance & Cleanup
         sim.fix_robot_states()
         
-        if step % settings.ORPHAN_CHECK_INTERVAL == 0:
+        if step % orphan_interval == 0:
             sim.cleanup_orphaned_assignments()
         
-        if step % settings.IDLE_RECHECK_INTERVAL == 0:
+        if step % idle_interval == 0:
             sim.reassign_stuck_packages()
-            sim.force_idle_robots_to_work()
         
+        # เรียกครั้งเดียวต่อ step (หลัง reassign) - เรียกซ้ำทันทีจะไม่มีงานเหลือให้ทำ
         sim.force_idle_robots_to_work()
         
         # 2. Deadlock Detection & Resolution
@@ -69,8 +107,10 @@ def main():
         
         # 3. Critical Path & Evacuation Logic
         critical_paths = sim.get_critical_paths()
+        # เริ่ม/ล้างตัวจับเวลา EVACUATING และ YIELDING ของทุก robot พร้อมกัน
+        evac_expired, yield_expired = sim.update_mode_timers(step)
         
-        for rb in sim.robots:
+        for i, rb in enumerate(sim.robots):
             # 1. ตรวจจับการเดินวนซ้ำ
             if sim.detect_oscillation(rb):
                 sim.logger.warning(
@@ -81,40 +121,24 @@ def main():
                 continue
             
             # 2. Timeout สำหรับ EVACUATING (ไม่ควรเกิน 15 steps)
-            if rb["state"] == "EVACUATING":
-                if rb["evac_start_step"] == 0:
-                    rb["evac_start_step"] = step
-                
-                evac_duration = step - rb["evac_start_step"]
-                
-                # ถ้า evac นานเกิน 15 steps หรือถึงจุดหมายแล้ว
-                if evac_duration > 15 or rb["pos"] == rb["evac_target"]:
-                    sim.logger.warning(
-                        f"{rb['name']} EVAC timeout ({evac_duration} steps) - Forcing IDLE"
-                    )
-                    sim.force_reset_stuck_state(rb, step)
-                    continue
-            else:
-                rb["evac_start_step"] = 0
+            # ถ้า evac นานเกิน 15 steps หรือถึงจุดหมายแล้ว
+            if rb["state"] == "EVACUATING" and (evac_expired[i] or rb["pos"] == rb["evac_target"]):
+                sim.logger.warning(
+                    f"{rb['name']} EVAC timeout ({step - rb['evac_start_step']} steps) - Forcing IDLE"
+                )
+                sim.force_reset_stuck_state(rb, step)
+                continue
             
             # 3. Timeout สำหรับ YIELDING mode (ไม่ควนเกิน 10 steps)
-            if rb["decision_mode"] == "YIELDING":
-                if rb["yield_start_step"] == 0:
-                    rb["yield_start_step"] = step
-                
-                yield_duration = step - rb["yield_start_step"]
-                
-                if yield_duration > 10:
-                    sim.logger.warning(
-                        f"{rb['name']} YIELDING timeout ({yield_duration} steps) - Forcing NORMAL"
-                    )
-                    rb["decision_mode"] = "NORMAL"
-                    rb["yield_to"] = None
-                    rb["yield_start_step"] = 0
-                    rb["path"] = []
-                    rb["wait_count"] = 0
-            else:
+            if yield_expired[i]:
+                sim.logger.warning(
+                    f"{rb['name']} YIELDING timeout ({step - rb['yield_start_step']} steps) - Forcing NORMAL"
+                )
+                rb["decision_mode"] = "NORMAL"
+                rb["yield_to"] = None
                 rb["yield_start_step"] = 0
+                rb["path"] = []
+                rb["wait_count"] = 0
 
             if rb["state"] in ["IDLE", "HOME"]:
                 blocking_crit = sim.is_in_critical_path(rb, critical_paths)
@@ -133,12 +157,12 @@ def main():
                             rb["state"] = "EVACUATING"
                             rb["evac_start_step"] = step
                             blocked = sim.get_blocked_for_robot(rb, set())
-                            rb["path"] = sim.smart_astar(rb["pos"], evac_spot, blocked, rb)
+                            rb["path"] = sim.plan_path(rb, evac_spot, blocked)
                             rb["wait_count"] = 0
         
         # 4. Decision Making (Yield/Retreat)
         for rb in sim.robots:
-            if rb["wait_count"] >= settings.YIELD_THRESHOLD:
+            if rb["wait_count"] >= yield_threshold:
                 action_type, action_data = sim.make_decisive_action(rb)
                 
                 if action_type == "YIELD":
@@ -146,9 +170,7 @@ def main():
                         f"YIELD to R{rb['yield_to']} -> {GridUtils.pos_to_str(action_data)}"
                     )
                     blocked = sim.get_blocked_for_robot(rb, set())
-                    rb["path"] = sim.smart_astar(rb["pos"], action_data, blocked, rb)
-                    if rb["path"] and len(rb["path"]) > 2:
-                        rb["path"] = sim.smooth_path(rb["path"], rb)
+                    rb["path"] = sim.plan_path(rb, action_data, blocked)
                     if not rb["path"]:
                         rb["path"] = [action_data]
                     rb["evac_target"] = action_data
@@ -181,9 +203,8 @@ def main():
                     rb["wait_count"] = 0
 
         # 5. Path Planning & Movement Logic
-        sorted_robots = sorted(sim.robots, key=lambda r: sim.get_robot_priority(r), reverse=True)
-        reserved_positions = set()
-        planned_moves = {}
+        sorted_robots = sim.get_priority_order()
+        reserved_positions, planned_moves = sim.begin_step_moves()
 
         for rb in sorted_robots:
             # Planning phase
@@ -203,19 +224,8 @@ def main():
                     # เพื่อให้ Robot ตัวรองรู้ว่าเพื่อนตัวก่อนหน้าจองที่ไหนไปแล้ว
                     blocked = sim.get_blocked_for_robot(rb, reserved_positions)
                     blocked.update(rb["failed_paths"])
-                    rb["path"] = sim.smart_astar(rb["pos"], target, blocked, rb)
-                    if rb["path"] and len(rb["path"]) > 2:
-                        rb["path"] = sim.smooth_path(rb["path"], rb)
-                    
-                    # Fallback กรณีหาทางไม่ได้
-                    if not rb["path"]:
-                        blocked_minimal = set(sim.obstacles)
-                        for other in sim.robots:
-                            if other["id"] != rb["id"]:
-                                blocked_minimal.add(other["pos"])
-                        rb["path"] = sim.smart_astar(rb["pos"], target, blocked_minimal, rb)
-                        if rb["path"] and len(rb["path"]) > 2:
-                            rb["path"] = sim.smooth_path(rb["path"], rb)
+                    # Fallback กรณีหาทางไม่ได้ (fallback=True)
+                    rb["path"] = sim.plan_path(rb, target, blocked, fallback=True)
 
             # Move prediction
             if rb["path"]:
@@ -241,17 +251,13 @@ def main():
                     if pkg["status"] == "PICKED":
                         rb["state"] = "TO_DROPOFF"
                         blocked = sim.get_blocked_for_robot(rb, reserved_positions)
-                        rb["path"] = sim.smart_astar(rb["pos"], pkg["dropoff"], blocked, rb)
-                        if rb["path"] and len(rb["path"]) > 2:
-                            rb["path"] = sim.smooth_path(rb["path"], rb)
+                        rb["path"] = sim.plan_path(rb, pkg["dropoff"], blocked)
                         rb["wait_count"] = 0
                         continue
                     elif pkg["status"] == "WAITING":
                         rb["state"] = "TO_PICKUP"
                         blocked = sim.get_blocked_for_robot(rb, reserved_positions)
-                        rb["path"] = sim.smart_astar(rb["pos"], pkg["pickup"], blocked, rb)
-                        if rb["path"] and len(rb["path"]) > 2:
-                            rb["path"] = sim.smooth_path(rb["path"], rb)
+                        rb["path"] = sim.plan_path(rb, pkg["pickup"], blocked)
                         rb["wait_count"] = 0
                         continue
                 
@@ -259,18 +265,7 @@ def main():
                 if pid is not None:
                     rb["package"] = pid
                     blocked = sim.get_blocked_for_robot(rb, reserved_positions)
-                    rb["path"] = sim.smart_astar(rb["pos"], sim.packages[pid]["pickup"], blocked, rb)
-                    if rb["path"] and len(rb["path"]) > 2:
-                        rb["path"] = sim.smooth_path(rb["path"], rb)
-                    
-                    if not rb["path"]:
-                        blocked_minimal = set(sim.obstacles)
-                        for other in sim.robots:
-                            if other["id"] != rb["id"]:
-                                blocked_minimal.add(other["pos"])
-                        rb["path"] = sim.smart_astar(rb["pos"], sim.packages[pid]["pickup"], blocked_minimal, rb)
-                        if rb["path"] and len(rb["path"]) > 2:
-                            rb["path"] = sim.smooth_path(rb["path"], rb)
+                    rb["path"] = sim.plan_path(rb, sim.packages[pid]["pickup"], blocked, fallback=True)
                     
                     rb["state"] = "TO_PICKUP"
                     rb["decision_mode"] = "NORMAL"
@@ -278,9 +273,7 @@ def main():
                     rb["wait_count"] = 0
                 elif rb["pos"] != rb["home"]:
                     blocked = sim.get_blocked_for_robot(rb, reserved_positions)
-                    rb["path"] = sim.smart_astar(rb["pos"], rb["home"], blocked, rb)
-                    if rb["path"] and len(rb["path"]) > 2:
-                        rb["path"] = sim.smooth_path(rb["path"], rb)
+                    rb["path"] = sim.plan_path(rb, rb["home"], blocked)
                     rb["state"] = "HOME"
                     rb["wait_count"] = 0
 
@@ -293,9 +286,7 @@ def main():
                     rb["wait_count"] = 0
                 elif not rb["path"]:
                     blocked = sim.get_blocked_for_robot(rb, reserved_positions)
-                    rb["path"] = sim.smart_astar(rb["pos"], rb["home"], blocked, rb)
-                    if rb["path"] and len(rb["path"]) > 2:
-                        rb["path"] = sim.smooth_path(rb["path"], rb)
+                    rb["path"] = sim.plan_path(rb, rb["home"], blocked)
 
         # 6. Execute Moves
         for rb in sorted_robots:
@@ -308,9 +299,12 @@ def main():
                 rb["momentum"] = max(0, rb["momentum"] - 1)
                 continue
 
-            if not sim.is_valid_move(rb, nxt, reserved_positions):
+            # is_valid_move ครอบคลุม swap / occupied / reserved อยู่แล้ว
+            # จึงรวมทุกเงื่อนไขไว้ใน can_commit ครั้งเดียว (REASON ต่อท้าย ไม่กระทบ regex ของ train script)
+            reason = sim.can_commit(rb, nxt, reserved_positions, planned_moves)
+            if reason is not None:
                 robot_loggers[rb["id"]].warning(
-                    f"BLOCKED {GridUtils.pos_to_str(rb['pos'])} -> {GridUtils.pos_to_str(nxt)} | WAIT={rb['wait_count']}"
+                    f"BLOCKED {GridUtils.pos_to_str(rb['pos'])} -> {GridUtils.pos_to_str(nxt)} | WAIT={rb['wait_count']} | REASON={reason}"
                 )
                 rb["wait_count"] += 1
                 rb["failed_paths"].add(nxt)
@@ -326,21 +320,6 @@ def main():
                         
                 continue
 
-            if sim.is_swap(rb, nxt, planned_moves):
-                rb["wait_count"] += 1
-                reserved_positions.add(rb["pos"])
-                rb["momentum"] = 0
-                continue
-
-            occupied = any(
-                other["pos"] == nxt for other in sim.robots if other["id"] != rb["id"]
-            )
-            if occupied or nxt in reserved_positions:
-                rb["wait_count"] += 1
-                reserved_positions.add(rb["pos"])
-                rb["momentum"] = max(0, rb["momentum"] - 1)
-                continue
-
             new_dir = GridUtils.get_direction(old_pos, nxt)
             if GridUtils.is_turn(rb["last_dir"], new_dir) and rb["last_dir"] != (0, 0):
                 rb["total_turns"] += 1
@@ -359,7 +338,8 @@ def main():
             reserved_positions.add(nxt)
             rb["wait_count"] = 0
             sim.display.record_move()
-            sim.display.add_activity(f"{rb['name']} moved {GridUtils.pos_to_str(old_pos)} -> {GridUtils.pos_to_str(nxt)}")
+            if show_activity:
+                sim.display.add_activity(f"{rb['name']} moved {GridUtils.pos_to_str(old_pos)} -> {GridUtils.pos_to_str(nxt)}")
             
             if rb["decision_mode"] not in ["NORMAL", "IDLE"]:
                 if rb["state"] != "EVACUATING" or rb["pos"] == rb["evac_target"]:
@@ -375,9 +355,7 @@ def main():
                 target = sim.packages[rb["package"]]["dropoff"]
                 blocked = sim.get_blocked_for_robot(rb, reserved_positions)
                 blocked.update(rb["failed_paths"])
-                rb["path"] = sim.smart_astar(rb["pos"], target, blocked, rb)
-                if rb["path"] and len(rb["path"]) > 2:
-                    rb["path"] = sim.smooth_path(rb["path"], rb)
+                rb["path"] = sim.plan_path(rb, target, blocked)
                 rb["state"] = "TO_DROPOFF"
                 rb["decision_mode"] = "NORMAL"
                 rb["failed_paths"].clear()
@@ -388,15 +366,13 @@ def main():
                 robot_loggers[rb["id"]].info(
                     f"DROPOFF {sim.packages[rb['package']]['name']} @ {GridUtils.pos_to_str(rb['pos'])}"
                 )
-                sim.packages[rb["package"]]["status"] = "DELIVERED"
+                sim.mark_delivered(rb["package"])
                 sim.packages[rb["package"]]["assigned_to"] = None
                 rb["package"] = None
                 target = rb["home"]
                 blocked = sim.get_blocked_for_robot(rb, reserved_positions)
                 blocked.update(rb["failed_paths"])
-                rb["path"] = sim.smart_astar(rb["pos"], target, blocked, rb)
-                if rb["path"] and len(rb["path"]) > 2:
-                    rb["path"] = sim.smooth_path(rb["path"], rb)
+                rb["path"] = sim.plan_path(rb, target, blocked)
                 rb["state"] = "HOME"
                 rb["decision_mode"] = "NORMAL"
                 rb["failed_paths"].clear()
@@ -418,17 +394,16 @@ def main():
                 rb["yield_to"] = None
 
         # 7. Final Path Check
-        for rb in sim.robots:
+        # robot ที่อยู่ home และรอไม่เกิน threshold ไม่เข้าเงื่อนไขใดด้านล่าง จึงกรองทิ้งก่อน
+        for rb in sim.final_check_candidates(yield_threshold):
             if rb["state"] == "IDLE":
                 if rb["package"] is None and rb["pos"] != rb["home"]:
                     blocked = sim.get_blocked_for_robot(rb, reserved_positions)
-                    rb["path"] = sim.smart_astar(rb["pos"], rb["home"], blocked, rb)
-                    if rb["path"] and len(rb["path"]) > 2:
-                        rb["path"] = sim.smooth_path(rb["path"], rb)
+                    rb["path"] = sim.plan_path(rb, rb["home"], blocked)
                     rb["state"] = "HOME"
             
             elif rb["state"] in ["TO_PICKUP", "TO_DROPOFF", "HOME", "EVACUATING"]:
-                if not rb["path"] and rb["wait_count"] > settings.YIELD_THRESHOLD:
+                if not rb["path"] and rb["wait_count"] > yield_threshold:
                     target = None
                     if rb["state"] == "TO_PICKUP" and rb["package"] is not None:
                         target = sim.packages[rb["package"]]["pickup"]
@@ -443,35 +418,28 @@ def main():
                         blocked = sim.get_blocked_for_robot(rb, reserved_positions)
                         for fp in rb["failed_paths"]:
                             blocked.add(fp)
-                        new_path = sim.smart_astar(rb["pos"], target, blocked, rb)
+                        new_path = sim.plan_path(rb, target, blocked)
                         if new_path:
                             rb["path"] = new_path
                             rb["wait_count"] = 0
                             rb["failed_paths"].clear()
 
-        sim.render(step)
+        if not headless:
+            sim.render(step)
         
         # Win Condition
-        delivered = sum(1 for p in sim.packages.values() if p["status"] == "DELIVERED")
-        if delivered == len(sim.packages):
-            all_tasks_complete = True
-            for rb in sim.robots:
-                if rb["state"] not in ["IDLE", "HOME"]:
-                    all_tasks_complete = False
-                    break
-                if rb["state"] == "HOME" and rb["pos"] != rb["home"]:
-                    all_tasks_complete = False
-                    break
-            
-            if all_tasks_complete:
-                sim.render_final_statistics(step)
-                break
+        if sim.all_tasks_complete():
+            sim.render_final_statistics(step)
+            break
         
-        if step > settings.MAX_STEPS:
+        if step > max_steps:
             print("\n=== MAX STEPS REACHED ===")
             break
         
-        time.sleep(settings.SLEEP)
+        if not headless:
+            now = time.monotonic()
+            next_deadline = max(now, next_deadline + sleep_time)
+            time.sleep(next_deadline - now)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -15,16 +15,19 @@ import re
 import glob
 import argparse
 import pickle
+import hashlib
 from datetime import datetime
 from collections import defaultdict
 from typing import List, Dict, Tuple, Optional
 
 import pandas as pd
+from pandas.api.types import union_categoricals
 import numpy as np
-from sklearn.model_selection import train_test_split, cross_val_score
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+from sklearn.model_selection import StratifiedKFold
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import StandardScaler
+from sklearn import config_context
 from sklearn.metrics import (
     classification_report, 
     confusion_matrix, 
@@ -35,6 +38,8 @@ from sklearn.metrics import (
     roc_auc_score
 )
 import joblib
+from joblib import Parallel, delayed
+from sklearn.base import clone
 
 
 # ===========================
@@ -44,6 +49,10 @@ import joblib
 LOGS_BASE_DIR = "logs"
 MODELS_DIR = "models"
 MODEL_OUTPUT_PATH = os.path.join(MODELS_DIR, "deadlock_predictor.pkl")
+FEATURE_CACHE_DIR = ".feature_cache"
+# เพิ่มเมื่อ parsing / features เปลี่ยน เพื่อไม่ให้ใช้ cache เก่า
+FEATURE_CACHE_VERSION = 1
+WINDOW_SIZE = 5
 
 # Regex patterns สำหรับ parse log
 MOVE_PATTERN = re.compile(
@@ -73,6 +82,89 @@ DROPOFF_PATTERN = re.compile(
 # Data Parsing
 # ===========================
 
+# คอลัมน์ของ event ทุกชนิด (เรียงตามลำดับใน DataFrame)
+EVENT_COLUMNS = [
+    'timestamp', 'robot', 'event_type', 'from_row', 'from_col', 'to_row', 'to_col',
+    'state', 'mode', 'wait', 'is_blocked', 'is_deadlock'
+]
+# คอลัมน์ตัวเลข -> dtype ที่แคบที่สุดที่พอ (พิกัด grid ไม่เกิน int16)
+INT_COLUMNS = {
+    'from_row': np.int16, 'from_col': np.int16, 'to_row': np.int16, 'to_col': np.int16,
+    'wait': np.int32,
+}
+# คอลัมน์ข้อความที่มีค่าซ้ำไม่กี่แบบ เก็บเป็น Categorical (int8 codes แทน string ต่อแถว)
+CATEGORY_COLUMNS = ('robot', 'event_type', 'state', 'mode')
+
+# keyword แรกหลัง timestamp -> (regex, {group: คอลัมน์}, ค่าคงที่ของคอลัมน์ที่เหลือ)
+EVENT_SPECS = {
+    'MOVE': (
+        MOVE_PATTERN,
+        {1: 'timestamp', 2: 'from_row', 3: 'from_col', 4: 'to_row', 5: 'to_col', 6: 'state', 7: 'mode'},
+        {'wait': 0, 'is_blocked': False, 'is_deadlock': False},
+    ),
+    'BLOCKED': (
+        BLOCKED_PATTERN,
+        {1: 'timestamp', 2: 'from_row', 3: 'from_col', 4: 'to_row', 5: 'to_col', 6: 'wait'},
+        {'state': 'UNKNOWN', 'mode': 'UNKNOWN', 'is_blocked': True, 'is_deadlock': False},
+    ),
+    # YIELD indicates deadlock-like situation
+    'YIELD': (
+        YIELD_PATTERN,
+        {1: 'timestamp', 3: 'to_row', 4: 'to_col'},
+        {'from_row': 0, 'from_col': 0, 'state': 'YIELDING', 'mode': 'YIELDING',
+         'wait': 0, 'is_blocked': True, 'is_deadlock': True},
+    ),
+    'RETREAT': (
+        RETREAT_PATTERN,
+        {1: 'timestamp', 2: 'to_row', 3: 'to_col'},
+        {'from_row': 0, 'from_col': 0, 'state': 'RETREAT', 'mode': 'RETREAT',
+         'wait': 0, 'is_blocked': True, 'is_deadlock': True},
+    ),
+    'EMERGENCY': (
+        EMERGENCY_PATTERN,
+        {1: 'timestamp', 2: 'to_row', 3: 'to_col'},
+        {'from_row': 0, 'from_col': 0, 'state': 'EMERGENCY', 'mode': 'FORCED',
+         'wait': 0, 'is_blocked': True, 'is_deadlock': True},
+    ),
+}
+
+
+def _combine_patterns(specs):
+    """
+    รวม regex ของทุก event เป็น alternation เดียว (anchor ต้นบรรทัด)
+    คืน (pattern, offset ของ group แรกของแต่ละ event ในผล findall)
+    """
+    offsets = {}
+    alternatives = []
+    n_groups = 0
+    for event_type, (pattern, _, _) in specs.items():
+        offsets[event_type] = n_groups
+        alternatives.append('(?:' + pattern.pattern + ')')
+        n_groups += pattern.groups
+    # [ \t]* แทน line.strip() ของ parser แบบทีละบรรทัด
+    combined = re.compile(r'^[ \t]*(?:' + '|'.join(alternatives) + ')', re.MULTILINE)
+    return combined, offsets
+
+
+COMBINED_PATTERN, COMBINED_OFFSETS = _combine_patterns(EVENT_SPECS)
+
+
+def concat_events(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    ต่อ event DataFrames และเก็บ CATEGORY_COLUMNS เป็น Categorical
+    ถ้าทุก frame เป็น Categorical อยู่แล้ว (เช่นผลของ parse_directory หลาย directory)
+    จะรวม categories ด้วย union_categoricals โดยไม่แปลงกลับเป็น string ก่อน
+    """
+    df = pd.concat([frame.drop(columns=list(CATEGORY_COLUMNS)) for frame in frames], ignore_index=True)
+    for column in CATEGORY_COLUMNS:
+        parts = [frame[column] for frame in frames]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            df[column] = union_categoricals(parts)
+        else:
+            df[column] = pd.concat(parts, ignore_index=True).astype('category')
+    return df[frames[0].columns]
+
+
 class LogParser:
     """Parse robot log files"""
     
@@ -97,115 +189,74 @@ class LogParser:
     
     def _parse_line(self, line: str, robot_name: str, line_num: int) -> Optional[Dict]:
         """Parse single log line"""
-        
-        # MOVE event
-        match = MOVE_PATTERN.match(line)
-        if match:
-            return {
-                'timestamp': match.group(1),
-                'robot': robot_name,
-                'event_type': 'MOVE',
-                'from_row': int(match.group(2)),
-                'from_col': int(match.group(3)),
-                'to_row': int(match.group(4)),
-                'to_col': int(match.group(5)),
-                'state': match.group(6),
-                'mode': match.group(7),
-                'wait': 0,
-                'is_blocked': False,
-                'is_deadlock': False
-            }
-        
-        # BLOCKED event
-        match = BLOCKED_PATTERN.match(line)
-        if match:
-            return {
-                'timestamp': match.group(1),
-                'robot': robot_name,
-                'event_type': 'BLOCKED',
-                'from_row': int(match.group(2)),
-                'from_col': int(match.group(3)),
-                'to_row': int(match.group(4)),
-                'to_col': int(match.group(5)),
-                'state': 'UNKNOWN',
-                'mode': 'UNKNOWN',
-                'wait': int(match.group(6)),
-                'is_blocked': True,
-                'is_deadlock': False
-            }
-        
-        # YIELD event (indicates potential deadlock situation)
-        match = YIELD_PATTERN.match(line)
-        if match:
-            return {
-                'timestamp': match.group(1),
-                'robot': robot_name,
-                'event_type': 'YIELD',
-                'from_row': 0,
-                'from_col': 0,
-                'to_row': int(match.group(3)),
-                'to_col': int(match.group(4)),
-                'state': 'YIELDING',
-                'mode': 'YIELDING',
-                'wait': 0,
-                'is_blocked': True,
-                'is_deadlock': True  # YIELD indicates deadlock-like situation
-            }
-        
-        # RETREAT event
-        match = RETREAT_PATTERN.match(line)
-        if match:
-            return {
-                'timestamp': match.group(1),
-                'robot': robot_name,
-                'event_type': 'RETREAT',
-                'from_row': 0,
-                'from_col': 0,
-                'to_row': int(match.group(2)),
-                'to_col': int(match.group(3)),
-                'state': 'RETREAT',
-                'mode': 'RETREAT',
-                'wait': 0,
-                'is_blocked': True,
-                'is_deadlock': True
-            }
-        
-        # EMERGENCY event
-        match = EMERGENCY_PATTERN.match(line)
-        if match:
-            return {
-                'timestamp': match.group(1),
-                'robot': robot_name,
-                'event_type': 'EMERGENCY',
-                'from_row': 0,
-                'from_col': 0,
-                'to_row': int(match.group(2)),
-                'to_col': int(match.group(3)),
-                'state': 'EMERGENCY',
-                'mode': 'FORCED',
-                'wait': 0,
-                'is_blocked': True,
-                'is_deadlock': True
-            }
-        
-        return None
+        # เลือก regex จาก keyword แรกของข้อความ (ลอง match เพียง pattern เดียวต่อบรรทัด)
+        parts = line.split(" | ", 2)
+        if len(parts) < 2:
+            return None
+        event_type = parts[1].split(" ", 1)[0]
+        spec = EVENT_SPECS.get(event_type)
+        if spec is None:
+            return None
+        
+        pattern, groups, constants = spec
+        match = pattern.match(line)
+        if match is None:
+            return None
+        
+        values = dict(constants, robot=robot_name, event_type=event_type)
+        for group, column in groups.items():
+            value = match.group(group)
+            values[column] = int(value) if column in INT_COLUMNS else value
+        return {column: values[column] for column in EVENT_COLUMNS}
+    
+    def _parse_text(self, text: str, robot_name: str) -> pd.DataFrame:
+        """
+        Parse ทั้งไฟล์ในครั้งเดียวด้วย COMBINED_PATTERN.findall (ทำงานใน C)
+        แล้วประกอบคอลัมน์ด้วย NumPy แทนการสร้าง dict ทีละ event
+        """
+        rows = COMBINED_PATTERN.findall(text)
+        if not rows:
+            return pd.DataFrame(columns=EVENT_COLUMNS)
+        
+        groups_arr = np.array(rows, dtype=object)
+        n = len(rows)
+        columns = {column: np.empty(n, dtype=object) for column in EVENT_COLUMNS}
+        columns['robot'][:] = robot_name
+        
+        for event_type, (pattern, groups, constants) in EVENT_SPECS.items():
+            offset = COMBINED_OFFSETS[event_type]
+            # แถวของ event ชนิดนี้ = แถวที่ group timestamp ของ alternative นี้ไม่ว่าง
+            mask = groups_arr[:, offset] != ""
+            columns['event_type'][mask] = event_type
+            for group, column in groups.items():
+                columns[column][mask] = groups_arr[mask, offset + group - 1]
+            for column, value in constants.items():
+                columns[column][mask] = value
+        
+        for column, dtype in INT_COLUMNS.items():
+            columns[column] = columns[column].astype(dtype)
+        for column in ('is_blocked', 'is_deadlock'):
+            columns[column] = columns[column].astype(bool)
+        return pd.DataFrame(columns)
     
     def parse_directory(self, log_dir: str) -> pd.DataFrame:
         """Parse all robot logs in a directory"""
-        all_events = []
+        frames = []
         
         log_files = glob.glob(os.path.join(log_dir, "R*.log"))
         
         for log_file in log_files:
             robot_name = os.path.basename(log_file).replace('.log', '')
-            events = self.parse_file(log_file, robot_name)
-            all_events.extend(events)
+            with open(log_file, 'r', encoding='utf-8') as f:
+                frame = self._parse_text(f.read(), robot_name)
+            if not frame.empty:
+                frames.append(frame)
         
-        if not all_events:
+        if not frames:
             return pd.DataFrame()
         
-        df = pd.DataFrame(all_events)
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        df = concat_events(frames)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format="%Y-%m-%d %H:%M:%S", cache=True)
         df = df.sort_values('timestamp').reset_index(drop=True)
         
         return df
@@ -215,6 +266,81 @@ class LogParser:
 # Feature Engineering
 # ===========================
 
+# event ที่ใช้เป็น sample และ event ที่ถือว่าเป็นสัญญาณ deadlock
+FEATURE_EVENTS = ['MOVE', 'BLOCKED']
+DEADLOCK_EVENTS = ['YIELD', 'RETREAT', 'EMERGENCY']
+# one-hot ของ state / mode (ตามลำดับคอลัมน์ของ features)
+STATE_FEATURES = ['TO_PICKUP', 'TO_DROPOFF', 'HOME', 'IDLE', 'EVACUATING']
+MODE_FEATURES = ['NORMAL', 'YIELDING', 'FORCED']
+
+# รหัส event_type สำหรับคำนวณ window features (-1 = event ชนิดอื่น)
+EVENT_CODES = {'MOVE': 0, 'BLOCKED': 1, 'YIELD': 2, 'RETREAT': 3, 'EMERGENCY': 4}
+FEATURE_CODES = [EVENT_CODES[event] for event in FEATURE_EVENTS]
+
+# คอลัมน์ features (ตามลำดับ) -> dtype ของ array ที่จองไว้ล่วงหน้า
+FEATURE_DTYPES = {
+    'from_row': np.int16, 'from_col': np.int16, 'to_row': np.int16, 'to_col': np.int16,
+    'dir_row': np.int16, 'dir_col': np.int16,
+    'wait': np.int32,
+    **{f'state_{state}': np.int8 for state in STATE_FEATURES},
+    **{f'mode_{mode}': np.int8 for mode in MODE_FEATURES},
+    'recent_blocks': np.int16, 'recent_moves': np.int16,
+    'is_deadlock': np.bool_,
+}
+# ลำดับคอลัมน์ของ X (ทุก feature ยกเว้น target)
+FEATURE_COLUMNS = [name for name in FEATURE_DTYPES if name != 'is_deadlock']
+# float32: tree models ของ sklearn ใช้ float32 ภายในอยู่แล้ว (ไม่ต้องแปลงซ้ำทุก fit)
+# และตรงกับ feature matrix ที่ Pathfinder สร้างตอน inference (ค่าเป็นจำนวนเต็มเล็ก แทนได้ตรงทุกค่า)
+FEATURE_MATRIX_DTYPE = np.float32
+DEADLOCK_CODES = [EVENT_CODES[event] for event in DEADLOCK_EVENTS]
+
+
+def category_codes(values: pd.Series) -> Tuple[np.ndarray, pd.Index]:
+    """คืน (codes, categories) ของคอลัมน์ (-1 = ค่าว่าง) ใช้ codes ของ Categorical ได้ทันทีถ้ามี"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    return pd.factorize(values)
+
+
+def encode_events(event_type: pd.Series) -> np.ndarray:
+    """แปลง event_type เป็นรหัส int8 ตาม EVENT_CODES (แปลงเฉพาะค่าที่ไม่ซ้ำแล้ว index ด้วย codes)"""
+    codes, uniques = category_codes(event_type)
+    lookup = np.array([EVENT_CODES.get(event, -1) for event in uniques] + [-1], dtype=np.int8)
+    return lookup[codes]
+
+
+def compute_window_features(robot_codes: np.ndarray, event_codes: np.ndarray, window: int,
+                            at: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    คำนวณ window features ทั้งหมดด้วย prefix sum และ reverse scan (O(N) ไม่ขึ้นกับ window)
+    robot_codes ต้องเรียงแบบไม่ลดลง (events ของ robot เดียวกันอยู่ติดกัน)
+    at: ตำแหน่งที่ต้องการผลลัพธ์ (None = ทุก event) window ยังนับ events ทุกตัวรอบตำแหน่งนั้น
+    
+    Returns:
+        recent_blocks, recent_moves: จำนวน BLOCKED / MOVE ใน window events ก่อนหน้า
+        deadlock_soon: มี deadlock event ใน window events ถัดไป (รวม event ปัจจุบัน)
+    """
+    n = len(event_codes)
+    idx = np.arange(n) if at is None else at
+    # ขอบเขตของ robot แต่ละตัว: window ไม่ข้ามไปยัง events ของ robot อื่น
+    robots = robot_codes[idx]
+    lo = np.maximum(np.searchsorted(robot_codes, robots, side='left'), idx - window)
+    hi = np.minimum(np.searchsorted(robot_codes, robots, side='right'), idx + window)
+    
+    def prefix(hits):
+        total = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(hits, out=total[1:])
+        return total
+    
+    blocks = prefix(event_codes == EVENT_CODES['BLOCKED'])
+    moves = prefix(event_codes == EVENT_CODES['MOVE'])
+    
+    # index ของ deadlock event ถัดไป (รวมตัวเอง) ด้วย reverse cumulative min (n = ไม่มี)
+    next_deadlock = np.where(np.isin(event_codes, DEADLOCK_CODES), np.arange(n), n)
+    next_deadlock = np.minimum.accumulate(next_deadlock[::-1])[::-1]
+    return blocks[idx] - blocks[lo], moves[idx] - moves[lo], next_deadlock[idx] < hi
+
+
 class FeatureEngineer:
     """สร้าง features สำหรับ ML model"""
     
@@ -222,88 +348,78 @@ class FeatureEngineer:
         self.window_size = window_size
     
     def create_features(self, df: pd.DataFrame) -> pd.DataFrame:
-        """สร้าง features จาก raw events"""
+        """สร้าง features จาก raw events (คำนวณทั้ง DataFrame ทีละคอลัมน์)"""
         
         if df.empty:
             return pd.DataFrame()
         
-        features = []
+        # เรียง events ตาม robot (ลำดับที่พบครั้งแรก) โดยคงลำดับเดิมภายใน robot แต่ละตัว
+        codes, _ = pd.factorize(df['robot'])
+        order = np.argsort(codes, kind='stable')
         
-        for robot in df['robot'].unique():
-            robot_df = df[df['robot'] == robot].copy()
-            robot_features = self._create_robot_features(robot_df)
-            features.extend(robot_features)
+        # sample = เฉพาะ MOVE/BLOCKED ถ้าไม่มีเลยไม่ต้องคำนวณอะไรต่อ
+        event_codes = encode_events(df['event_type'])[order]
+        mask = np.isin(event_codes, FEATURE_CODES)
+        samples = np.flatnonzero(mask)
+        if len(samples) == 0:
+            return pd.DataFrame()
+        rows = order[samples]  # ตำแหน่งใน df ของ sample แต่ละแถว
         
-        return pd.DataFrame(features)
-    
-    def _create_robot_features(self, robot_df: pd.DataFrame) -> List[Dict]:
-        """สร้าง features สำหรับ robot เดียว"""
-        features = []
+        # window ย้อนหลัง/ล่วงหน้านับรวม event ทุกชนิด แต่คำนวณผลเฉพาะตำแหน่งของ sample
+        recent_blocks, recent_moves, deadlock_soon = compute_window_features(
+            codes[order], event_codes, self.window_size, at=samples
+        )
         
-        for i in range(len(robot_df)):
-            row = robot_df.iloc[i]
-            
-            # Skip invalid rows
-            if row['event_type'] not in ['MOVE', 'BLOCKED']:
-                continue
-            
-            feature = {
-                # Basic position features
-                'from_row': row['from_row'],
-                'from_col': row['from_col'],
-                'to_row': row['to_row'],
-                'to_col': row['to_col'],
-                
-                # Movement direction
-                'dir_row': row['to_row'] - row['from_row'],
-                'dir_col': row['to_col'] - row['from_col'],
-                
-                # Current state
-                'wait': row['wait'],
-                
-                # State encoding
-                'state_TO_PICKUP': 1 if row['state'] == 'TO_PICKUP' else 0,
-                'state_TO_DROPOFF': 1 if row['state'] == 'TO_DROPOFF' else 0,
-                'state_HOME': 1 if row['state'] == 'HOME' else 0,
-                'state_IDLE': 1 if row['state'] == 'IDLE' else 0,
-                'state_EVACUATING': 1 if row['state'] == 'EVACUATING' else 0,
-                
-                # Mode encoding
-                'mode_NORMAL': 1 if row['mode'] == 'NORMAL' else 0,
-                'mode_YIELDING': 1 if row['mode'] == 'YIELDING' else 0,
-                'mode_FORCED': 1 if row['mode'] == 'FORCED' else 0,
-                
-                # Historical features (look back)
-                'recent_blocks': self._count_recent_events(robot_df, i, 'BLOCKED'),
-                'recent_moves': self._count_recent_events(robot_df, i, 'MOVE'),
-                
-                # Target
-                'is_deadlock': row['is_deadlock'] or self._will_deadlock_soon(robot_df, i)
-            }
-            
-            features.append(feature)
+        # จอง array ของทุกคอลัมน์ครั้งเดียว แล้วเติมค่าทีละคอลัมน์ (ไม่สร้าง dict ต่อแถว)
+        out = {name: np.empty(len(rows), dtype=dtype) for name, dtype in FEATURE_DTYPES.items()}
         
-        return features
-    
-    def _count_recent_events(self, df: pd.DataFrame, current_idx: int, event_type: str) -> int:
-        """นับ events ล่าสุด"""
-        start_idx = max(0, current_idx - self.window_size)
-        window = df.iloc[start_idx:current_idx]
-        return len(window[window['event_type'] == event_type])
-    
-    def _will_deadlock_soon(self, df: pd.DataFrame, current_idx: int) -> bool:
-        """ตรวจสอบว่าจะเกิด deadlock ใน window ถัดไปหรือไม่"""
-        end_idx = min(len(df), current_idx + self.window_size)
-        future = df.iloc[current_idx:end_idx]
+        # Basic position features / Current state
+        for column in ('from_row', 'from_col', 'to_row', 'to_col', 'wait'):
+            out[column][:] = df[column].to_numpy()[rows]
+        
+        # Movement direction
+        np.subtract(out['to_row'], out['from_row'], out=out['dir_row'])
+        np.subtract(out['to_col'], out['from_col'], out=out['dir_col'])
+        
+        # State / Mode encoding
+        self._fill_one_hot(out, 'state', df['state'], STATE_FEATURES, rows)
+        self._fill_one_hot(out, 'mode', df['mode'], MODE_FEATURES, rows)
         
-        deadlock_events = ['YIELD', 'RETREAT', 'EMERGENCY']
-        return any(future['event_type'].isin(deadlock_events))
+        # Historical features (look back)
+        out['recent_blocks'][:] = recent_blocks
+        out['recent_moves'][:] = recent_moves
+        
+        # Target
+        np.logical_or(df['is_deadlock'].to_numpy(bool)[rows], deadlock_soon, out=out['is_deadlock'])
+        
+        return pd.DataFrame(out, copy=False)
+    
+    @staticmethod
+    def _fill_one_hot(out: Dict, prefix: str, values: pd.Series, categories: List[str], rows: np.ndarray):
+        """เติม one-hot ของ categories ลง out[f'{prefix}_{category}'] โดยเทียบรหัสจาก factorize"""
+        codes, uniques = category_codes(values)
+        codes = codes[rows]
+        lookup = {value: code for code, value in enumerate(uniques)}
+        for category in categories:
+            np.equal(codes, lookup.get(category, -2), out=out[f'{prefix}_{category}'])
 
 
 # ===========================
 # Model Training
 # ===========================
 
+# models ที่ train บน features ที่ผ่าน StandardScaler (tree models ใช้ค่าดิบ)
+SCALED_MODELS = ('LogisticRegression',)
+
+
+def _fit_and_score(model, X: np.ndarray, y: np.ndarray, train: np.ndarray, test: np.ndarray) -> float:
+    """fit สำเนาของ model บน fold train แล้วคืน F1 บน fold test (เหมือน cross_val_score ต่อ fold)"""
+    model = clone(model)
+    with config_context(assume_finite=True):
+        model.fit(X[train], y[train])
+        return f1_score(y[test], model.predict(X[test]), zero_division=0)
+
+
 class DeadlockModelTrainer:
     """Train deadlock prediction model"""
     
@@ -316,8 +432,8 @@ class DeadlockModelTrainer:
                 random_state=42,
                 n_jobs=-1
             ),
-            'GradientBoosting': GradientBoostingClassifier(
-                n_estimators=100,
+            'HistGradientBoosting': HistGradientBoostingClassifier(
+                max_iter=100,
                 max_depth=5,
                 learning_rate=0.1,
                 random_state=42
@@ -335,10 +451,13 @@ class DeadlockModelTrainer:
     def prepare_data(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
         """เตรียมข้อมูลสำหรับ training"""
         
-        # Feature columns (exclude target)
-        self.feature_columns = [col for col in df.columns if col != 'is_deadlock']
+        # Feature columns (exclude target) ตาม schema ที่ FeatureEngineer สร้าง
+        self.feature_columns = list(FEATURE_COLUMNS)
         
-        X = df[self.feature_columns].values
+        # เติมลง array C-contiguous ที่จองไว้ครั้งเดียว (การเลือกแถวของแต่ละ fold อ่านหน่วยความจำต่อเนื่อง)
+        X = np.empty((len(df), len(FEATURE_COLUMNS)), dtype=FEATURE_MATRIX_DTYPE)
+        for j, column in enumerate(FEATURE_COLUMNS):
+            X[:, j] = df[column].to_numpy()
         y = df['is_deadlock'].astype(int).values
         
         return X, y
@@ -346,29 +465,33 @@ class DeadlockModelTrainer:
     def train(self, X: np.ndarray, y: np.ndarray) -> Dict:
         """Train และเลือก model ที่ดีที่สุด"""
         
-        # Split data
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42, stratify=y
-        )
+        # Split data (80/20 แบบ stratified = fold แรกของ 5 folds)
+        skf = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
+        train_idx, test_idx = next(skf.split(X, y))
+        X_train, X_test = X.take(train_idx, axis=0), X.take(test_idx, axis=0)
+        y_train, y_test = y.take(train_idx), y.take(test_idx)
         
-        # Scale features
-        X_train_scaled = self.scaler.fit_transform(X_train)
-        X_test_scaled = self.scaler.transform(X_test)
+        # Scale ครั้งเดียวเฉพาะเมื่อมี model ที่ต้องใช้ (ข้อมูลมาจาก features ที่เป็นตัวเลขจำกัดเสมอ
+        # จึงข้ามการตรวจ NaN/inf ของ sklearn ได้)
+        splits = {False: (X_train, X_test)}
+        if any(name in SCALED_MODELS for name in self.models):
+            with config_context(assume_finite=True):
+                splits[True] = (self.scaler.fit_transform(X_train), self.scaler.transform(X_test))
         
         results = {}
         
         for name, model in self.models.items():
+            scaled = name in SCALED_MODELS
             print(f"\n🔄 Training {name}...")
             
             # Train
-            if name == 'LogisticRegression':
-                model.fit(X_train_scaled, y_train)
-                y_pred = model.predict(X_test_scaled)
-                y_proba = model.predict_proba(X_test_scaled)[:, 1]
-            else:
-                model.fit(X_train, y_train)
-                y_pred = model.predict(X_test)
-                y_proba = model.predict_proba(X_test)[:, 1]
+            fit_X, eval_X = splits[scaled]
+            with config_context(assume_finite=True):
+                model.fit(fit_X, y_train)
+                proba = model.predict_proba(eval_X)
+            # binary: ใช้ threshold 0.5 แทนการเรียก predict อีกรอบ (ได้ค่าเดียวกับ predict)
+            y_proba = proba[:, 1]
+            y_pred = model.classes_[(y_proba > 0.5).astype(np.intp)]
             
             # Evaluate
             accuracy = accuracy_score(y_test, y_pred)
@@ -417,8 +540,12 @@ class DeadlockModelTrainer:
             'trained_at': datetime.now().isoformat()
         }
         
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        joblib.dump(model_data, output_path)
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        # เขียนลงไฟล์ชั่วคราวแล้ว rename (atomic) simulation จะไม่โหลดไฟล์ที่เขียนไม่ครบ
+        # ไม่บีบอัด เพื่อให้ simulation โหลดแบบ mmap_mode ได้
+        tmp_path = output_path + '.tmp'
+        joblib.dump(model_data, tmp_path, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, output_path)
         
         print(f"\n💾 Model saved to: {output_path}")
     
@@ -426,10 +553,24 @@ class DeadlockModelTrainer:
         """Perform cross-validation"""
         print(f"\n📊 Performing {cv}-fold cross-validation...")
         
+        # แบ่ง folds ครั้งเดียว (shuffle แบบเดียวกับ train split) ใช้ index ชุดเดียวกันกับทุก model
+        folds = list(StratifiedKFold(n_splits=cv, shuffle=True, random_state=42).split(X, y))
+        
+        # รันทุกคู่ (model, fold) ใน thread pool เดียว (fit/predict ของ sklearn ปล่อย GIL)
+        # แบ่ง cores ให้ model ที่ใช้ n_jobs เอง เพื่อให้จำนวน threads รวมไม่เกิน cpu_count
+        n_workers = min(len(self.models) * len(folds), os.cpu_count() or 1)
+        inner_jobs = max(1, (os.cpu_count() or 1) // n_workers)
+        tasks = []
+        for model in self.models.values():
+            if model.get_params().get('n_jobs') is not None:
+                model = clone(model).set_params(n_jobs=inner_jobs)
+            tasks.extend(delayed(_fit_and_score)(model, X, y, train, test) for train, test in folds)
+        fold_scores = Parallel(n_jobs=n_workers, backend='threading')(tasks)
+        all_scores = np.array(fold_scores).reshape(len(self.models), len(folds))
+        
         cv_results = {}
         
-        for name, model in self.models.items():
-            scores = cross_val_score(model, X, y, cv=cv, scoring='f1')
+        for name, scores in zip(self.models, all_scores):
             cv_results[name] = {
                 'mean': scores.mean(),
                 'std': scores.std(),
@@ -444,17 +585,71 @@ class DeadlockModelTrainer:
 # Main Function
 # ===========================
 
+def augment_samples(features_df: pd.DataFrame, samples: pd.DataFrame,
+                    copies: int = 5) -> pd.DataFrame:
+    """ทำสำเนา samples `copies` รอบพร้อม noise ±1 ที่ wait / recent_blocks (ไม่ติดลบ)"""
+    augmented = samples.iloc[np.tile(np.arange(len(samples)), copies)].reset_index(drop=True)
+    for column in ('wait', 'recent_blocks'):
+        values = augmented[column].to_numpy()
+        noise = np.random.randint(-1, 2, size=len(values))
+        augmented[column] = np.maximum(0, values + noise).astype(values.dtype)
+    return pd.concat([features_df, augmented], ignore_index=True)
+
+
 def find_all_log_dirs(base_dir: str) -> List[str]:
-    """หา log directories ทั้งหมด"""
-    log_dirs = []
+    """หา log directories ทั้งหมด (scandir: is_dir ใช้ข้อมูลจาก readdir ไม่ต้อง stat ทีละ entry)"""
+    if not os.path.isdir(base_dir):
+        return []
+    
+    with os.scandir(base_dir) as entries:
+        return sorted(entry.path for entry in entries if entry.is_dir())
+
+
+def build_features(log_dirs: List[str], window_size: int) -> Optional[pd.DataFrame]:
+    """Parse logs ทุก directory แล้วสร้าง features (None ถ้าไม่มีข้อมูล)"""
     
-    if os.path.exists(base_dir):
-        for entry in os.listdir(base_dir):
-            full_path = os.path.join(base_dir, entry)
-            if os.path.isdir(full_path):
-                log_dirs.append(full_path)
+    # Parse logs
+    print("\n📖 Parsing log files...")
+    log_parser = LogParser()
+    
+    all_events = []
+    for log_dir in log_dirs:
+        df = log_parser.parse_directory(log_dir)
+        if not df.empty:
+            all_events.append(df)
+            print(f"   ✅ {log_dir}: {len(df)} events")
+    
+    if not all_events:
+        print("❌ No events found in logs!")
+        return None
+    
+    events_df = concat_events(all_events)
+    print(f"\n📊 Total events: {len(events_df)}")
+    
+    # Feature engineering
+    print("\n🔧 Creating features...")
+    feature_engineer = FeatureEngineer(window_size=window_size)
+    features_df = feature_engineer.create_features(events_df)
+    
+    if features_df.empty:
+        print("❌ No features created!")
+        return None
     
-    return sorted(log_dirs)
+    return features_df
+
+
+def feature_cache_path(cache_dir: str, log_dirs: List[str], window_size: int) -> str:
+    """
+    path ของ features cache สำหรับ log_dirs ชุดนี้
+    key รวมขนาด/mtime ของทุก log file จึงเปลี่ยนเมื่อ log ถูกเขียนเพิ่ม
+    """
+    key = [FEATURE_CACHE_VERSION, window_size]
+    for log_dir in sorted(log_dirs):
+        for log_file in sorted(glob.glob(os.path.join(log_dir, "R*.log"))):
+            stat = os.stat(log_file)
+            key.append((os.path.abspath(log_file), stat.st_size, stat.st_mtime_ns))
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, f"features_{digest}.pkl")
 
 
 def main():
@@ -463,6 +658,8 @@ def main():
     parser.add_argument('--all-logs', action='store_true', help='Use all log directories')
     parser.add_argument('--output', type=str, default=MODEL_OUTPUT_PATH, help='Output model path')
     parser.add_argument('--cv', type=int, default=5, help='Cross-validation folds')
+    parser.add_argument('--cache-dir', type=str, default=FEATURE_CACHE_DIR, help='Feature cache directory')
+    parser.add_argument('--no-cache', action='store_true', help='Always re-parse logs')
     
     args = parser.parse_args()
     
@@ -486,32 +683,18 @@ def main():
     
     print(f"\n📁 Using log directories: {log_dirs}")
     
-    # Parse logs
-    print("\n📖 Parsing log files...")
-    log_parser = LogParser()
-    
-    all_events = []
-    for log_dir in log_dirs:
-        df = log_parser.parse_directory(log_dir)
-        if not df.empty:
-            all_events.append(df)
-            print(f"   ✅ {log_dir}: {len(df)} events")
-    
-    if not all_events:
-        print("❌ No events found in logs!")
-        return
-    
-    events_df = pd.concat(all_events, ignore_index=True)
-    print(f"\n📊 Total events: {len(events_df)}")
-    
-    # Feature engineering
-    print("\n🔧 Creating features...")
-    feature_engineer = FeatureEngineer(window_size=5)
-    features_df = feature_engineer.create_features(events_df)
-    
-    if features_df.empty:
-        print("❌ No features created!")
-        return
+    # Features (โหลดจาก cache ถ้า logs ไม่เปลี่ยนตั้งแต่ครั้งก่อน)
+    cache_path = None if args.no_cache else feature_cache_path(args.cache_dir, log_dirs, WINDOW_SIZE)
+    if cache_path and os.path.exists(cache_path):
+        print(f"\n💾 Loading cached features: {cache_path}")
+        features_df = joblib.load(cache_path)
+    else:
+        features_df = build_features(log_dirs, WINDOW_SIZE)
+        if features_df is None:
+            return
+        if cache_path:
+            os.makedirs(args.cache_dir, exist_ok=True)
+            joblib.dump(features_df, cache_path)
     
     print(f"   ✅ Created {len(features_df)} samples with {len(features_df.columns)-1} features")
     
@@ -531,20 +714,8 @@ def main():
         deadlock_samples = features_df[features_df['is_deadlock'] == True]
         
         if len(deadlock_samples) > 0:
-            # Simple augmentation: duplicate with slight noise
-            augmented = []
-            for _ in range(5):  # 5x augmentation
-                for _, row in deadlock_samples.iterrows():
-                    new_row = row.copy()
-                    # Add small noise to numeric features
-                    new_row['wait'] = max(0, new_row['wait'] + np.random.randint(-1, 2))
-                    new_row['recent_blocks'] = max(0, new_row['recent_blocks'] + np.random.randint(-1, 2))
-                    augmented.append(new_row)
-            
-            if augmented:
-                augmented_df = pd.DataFrame(augmented)
-                features_df = pd.concat([features_df, augmented_df], ignore_index=True)
-                print(f"   ✅ Augmented to {len(features_df)} samples")
+            features_df = augment_samples(features_df, deadlock_samples)
+            print(f"   ✅ Augmented to {len(features_df)} samples")
     
     # Train model
     print("\n🎯 Training models...")
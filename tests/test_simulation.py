@@ -21,6 +21,7 @@ from core.settings import settings
 from utils.grid_utils import GridUtils
 from utils.display_manager import DisplayManager, ANSIColors, SimulationRenderer
 from utils.penalty_map import DynamicPenaltyMap, CellPenalty
+from utils.robot_table import RobotTable, STATE_CODES
 
 
 class TestGridUtils:
@@ -63,6 +64,12 @@ class TestGridUtils:
         assert GridUtils.manhattan((0, 0), (3, 4)) == 7
         assert GridUtils.manhattan((5, 5), (5, 5)) == 0
         assert GridUtils.manhattan((0, 0), (10, 10)) == 20
+
+    def test_manhattan_many(self):
+        """ทดสอบ Manhattan distance แบบ batch"""
+        points = [(0, 0), (3, 4), (5, 5)]
+        dist = GridUtils.manhattan_many(points, (5, 5))
+        assert dist.tolist() == [GridUtils.manhattan(p, (5, 5)) for p in points]
     
     def test_create_wall_horizontal(self):
         """ทดสอบการสร้าง wall แนวนอน"""
@@ -87,6 +94,12 @@ class TestGridUtils:
         """ทดสอบ wall format ที่ไม่ถูกต้อง"""
         with pytest.raises(ValueError):
             GridUtils.create_wall([1, 2, 3])  # ไม่ครบ 4 ค่า
+
+    def test_wall_cells_array(self):
+        """ทดสอบ wall_cells คืน ndarray (K, 2) ตรงกับ create_wall"""
+        cells = GridUtils.wall_cells([2, 4, 0, 3])  # ใส่สลับตำแหน่ง
+        assert cells.shape == (6, 2)
+        assert set(map(tuple, cells.tolist())) == GridUtils.create_wall([0, 3, 2, 4])
     
     def test_get_direction(self):
         """ทดสอบการหาทิศทาง"""
@@ -101,6 +114,25 @@ class TestGridUtils:
         assert GridUtils.is_turn((1, 0), (1, 0)) == False  # ตรง
         assert GridUtils.is_turn((0, 0), (1, 0)) == False  # เริ่มต้น
 
+    def test_module_level_helpers(self):
+        """ทดสอบว่าฟังก์ชันระดับ module เป็นตัวเดียวกับ staticmethod ของ GridUtils"""
+        from utils import grid_utils
+        assert GridUtils.manhattan is grid_utils.manhattan
+        assert GridUtils.in_bounds is grid_utils.in_bounds
+        assert GridUtils.is_turn is grid_utils.is_turn
+        assert grid_utils.manhattan((1, 2), (4, 0)) == 5
+        assert not grid_utils.in_bounds(settings.ROWS, 0)
+
+    def test_neighbors_by_preference(self):
+        """ทดสอบลำดับทิศที่คำนวณไว้ (preferred ก่อน แล้ว last_dir ที่เหลือคงลำดับ NEIGHBORS4)"""
+        from utils.grid_utils import NEIGHBORS4, NEIGHBORS4_BY_PREFERENCE
+        assert NEIGHBORS4_BY_PREFERENCE[((0, 0), (0, 0))] == NEIGHBORS4
+        assert NEIGHBORS4_BY_PREFERENCE[((0, 0), (0, 1))] == ((0, 1), (-1, 0), (1, 0), (0, -1))
+        assert NEIGHBORS4_BY_PREFERENCE[((1, 0), (0, 1))] == ((1, 0), (0, 1), (-1, 0), (0, -1))
+        assert NEIGHBORS4_BY_PREFERENCE[((1, 0), (1, 0))] == ((1, 0), (-1, 0), (0, -1), (0, 1))
+        for order in NEIGHBORS4_BY_PREFERENCE.values():
+            assert sorted(order) == sorted(NEIGHBORS4)
+
 
 class TestDisplayManager:
     """ทดสอบ DisplayManager class"""
@@ -157,7 +189,26 @@ class TestDisplayManager:
         activities = dm.get_activities()
         assert len(activities) == 3
         assert "Test 4" in activities[-1]
-    
+
+    def test_get_recent(self):
+        """ทดสอบว่า get_recent คืน n รายการล่าสุดเรียงจากเก่าไปใหม่"""
+        dm = DisplayManager(max_activities=8)
+        assert dm.get_recent(6) == []
+        for i in range(10):
+            dm.add_activity(f"Test {i}")
+        recent = dm.get_recent(3)
+        assert recent == dm.get_activities()[-3:]
+        assert "Test 9" in recent[-1]
+        assert dm.get_recent(20) == dm.get_activities()
+
+    def test_add_activity_hidden(self):
+        """ทดสอบว่า display ที่ไม่แสดงผลไม่เก็บ activity แต่ยังนับสถิติ"""
+        dm = DisplayManager(visible=False)
+        dm.add_activity("Test 1")
+        dm.record_move()
+        assert dm.get_activities() == []
+        assert dm.total_moves == 1
+
     def test_elapsed_time(self):
         """ทดสอบการคำนวณเวลา"""
         dm = DisplayManager()
@@ -165,6 +216,174 @@ class TestDisplayManager:
         assert elapsed >= 0
 
 
+class TestSimulationRenderer:
+    """ทดสอบ SimulationRenderer"""
+
+    def test_base_grid_from_obstacle_grid(self):
+        """ทดสอบว่า grid พื้นหลังถูกสร้างจาก obstacle_grid ตอน init"""
+        import numpy as np
+        grid = np.zeros((3, 4), dtype=np.uint8)
+        grid[1, 2] = 1
+        renderer = SimulationRenderer(DisplayManager(), grid, {})
+        assert len(renderer.base_grid) == 3
+        assert ANSIColors.BG_WALL in renderer.base_grid[1][2]
+        assert ANSIColors.BG_WALL not in renderer.base_grid[0][0]
+
+    def test_render_writes_only_changed_cells(self, monkeypatch, capsys):
+        """ทดสอบว่า frame ถัดไปเขียนเฉพาะช่องที่เปลี่ยนด้วย cursor addressing"""
+        import os
+        import shutil
+        import numpy as np
+        monkeypatch.setattr(shutil, "get_terminal_size", lambda *a: os.terminal_size((300, 100)))
+        dm = DisplayManager()
+        renderer = SimulationRenderer(dm, np.zeros((settings.ROWS, settings.COLS), dtype=np.uint8), {})
+        renderer.diff_enabled = True
+        robot = {"name": "R1", "pos": (2, 3), "state": "IDLE", "package": None,
+                 "path": [], "wait_count": 0, "decision_mode": "NORMAL"}
+        dm.get_elapsed_time = lambda: 0.0
+        renderer.render(1, [robot], {})
+        first = capsys.readouterr().out
+        assert first.startswith("\033[H\033[J")
+        renderer.render(1, [robot], {})
+        assert "\033[H\033[J" not in capsys.readouterr().out
+        robot["pos"] = (2, 4)
+        renderer.render(1, [robot], {})
+        out = capsys.readouterr().out
+        grid_line = 7  # header 5 บรรทัด + หัวคอลัมน์ แล้วจึงเป็นแถว 0
+        assert f"\033[{grid_line + 2};13H" in out and f"\033[{grid_line + 2};16H" in out
+        assert len(out) < len(first) // 5
+
+    def test_static_templates_are_reused(self, capsys):
+        """ทดสอบว่าช่อง robot และ label ของ grid ถูกสร้างครั้งเดียวแล้วใช้ซ้ำ"""
+        import numpy as np
+        dm = DisplayManager()
+        renderer = SimulationRenderer(dm, np.zeros((settings.ROWS, settings.COLS), dtype=np.uint8), {})
+        renderer.diff_enabled = False
+        robot = {"name": "R12", "pos": (1, 1), "state": "TO_PICKUP", "package": None,
+                 "path": [], "wait_count": 0, "decision_mode": "NORMAL"}
+        dm.get_elapsed_time = lambda: 0.0
+        renderer.render(1, [robot], {})
+        cell = renderer._robot_cells[("R12", "TO_PICKUP")]
+        labels = renderer._labels_for(settings.ROWS, settings.COLS)
+        renderer.render(2, [robot], {})
+        assert renderer._robot_cells[("R12", "TO_PICKUP")] is cell
+        assert renderer._labels_for(settings.ROWS, settings.COLS) is labels
+        C = renderer.C
+        assert cell == f"{C.BG_PICKUP}{C.BOLD}{C.WHITE}{'12':^3}{C.ENDC}"
+        assert len(labels[1]) == settings.ROWS
+        assert cell in capsys.readouterr().out
+
+    def test_base_grid_places_walls(self):
+        """ทดสอบว่ากำแพงถูกวางตรงตำแหน่ง และตำแหน่งนอก grid ถูกข้าม"""
+        import numpy as np
+        renderer = SimulationRenderer(DisplayManager(), None, {})
+        base = renderer._build_base_grid({(0, 1), (2, 3), (-1, 0), (5, 9)}, 3, 4)
+        wall = f"{renderer.C.BG_WALL}   {renderer.C.ENDC}"
+        assert isinstance(base, list) and len(base) == 3 and all(len(row) == 4 for row in base)
+        assert {(r, c) for r in range(3) for c in range(4) if base[r][c] == wall} == {(0, 1), (2, 3)}
+        grid = np.zeros((3, 4), dtype=np.uint8)
+        grid[0, 1] = grid[2, 3] = 1
+        assert SimulationRenderer(DisplayManager(), grid, {}).base_grid == base
+        assert renderer._build_base_grid((), 2, 2) == [[base[0][0]] * 2] * 2
+
+    def test_render_state_and_status_counts(self, capsys):
+        """ทดสอบจำนวน robot ตาม state และจำนวน package ที่ส่งแล้วในแถบสถิติ"""
+        import re
+        import numpy as np
+        dm = DisplayManager()
+        dm.get_elapsed_time = lambda: 0.0
+        renderer = SimulationRenderer(dm, np.zeros((settings.ROWS, settings.COLS), dtype=np.uint8), {})
+        renderer.diff_enabled = False
+        robots = [{"name": f"R{i}", "pos": (0, i), "state": state, "package": None, "path": [],
+                   "wait_count": 0, "decision_mode": "NORMAL"}
+                  for i, state in enumerate(["IDLE", "IDLE", "TO_DROPOFF", "EVACUATING"])]
+        packages = {i: {"name": f"P{i}", "status": status, "pickup": (5, i), "dropoff": (6, i)}
+                    for i, status in enumerate(["DELIVERED", "WAITING", "DELIVERED"])}
+        renderer.render(1, robots, packages)
+        out = re.sub(r"\033\[[0-9;]*[A-Za-z]", "", capsys.readouterr().out)
+        assert "Robots: IDLE=2 | TO_PICKUP=0 | DELIVERING=1 | HOME=0 | EVAC=1" in out
+        assert "Progress: 2/3" in out
+
+    def test_render_package_status_lines(self, capsys):
+        """ทดสอบรายชื่อ package แยกตามสถานะ (WAITING แสดง 8 ตัวแรก, DELIVERED แสดง 8 ตัวล่าสุด)"""
+        import re
+        import numpy as np
+        dm = DisplayManager()
+        dm.get_elapsed_time = lambda: 0.0
+        renderer = SimulationRenderer(dm, np.zeros((settings.ROWS, settings.COLS), dtype=np.uint8), {})
+        renderer.diff_enabled = False
+        statuses = ["WAITING"] * 10 + ["PICKED"] + ["DELIVERED"] * 9
+        packages = {i: {"name": f"P{i}", "status": status, "pickup": (5, i), "dropoff": (6, i)}
+                    for i, status in enumerate(statuses)}
+        renderer.render(1, [], packages)
+        out = re.sub(r"\033\[[0-9;]*[A-Za-z]", "", capsys.readouterr().out)
+        assert "WAITING (10): P0, P1, P2, P3, P4, P5, P6, P7 +2 more" in out
+        assert "IN TRANSIT (1): P10" in out
+        assert "DELIVERED (9): P12, P13, P14, P15, P16, P17, P18, P19 (+1 earlier)" in out
+        assert "Progress: 9/20" in out
+
+    def test_final_statistics_single_write(self, monkeypatch):
+        """ทดสอบว่าสรุปผลตอนจบถูกเขียนออกด้วย write ครั้งเดียว"""
+        import io
+        import sys
+        import numpy as np
+        dm = DisplayManager()
+        dm.get_elapsed_time = lambda: 65.0
+        renderer = SimulationRenderer(dm, np.zeros((settings.ROWS, settings.COLS), dtype=np.uint8), {})
+        writes = []
+        out = io.StringIO()
+        monkeypatch.setattr(sys, "stdout", out)
+        monkeypatch.setattr(out, "write", lambda text: writes.append(text) or len(text))
+        renderer.render_final_statistics(10, [{"total_turns": 2}], {1: {"status": "DELIVERED"}})
+        assert len(writes) == 1
+        assert "SIMULATION COMPLETE" in writes[0] and writes[0].endswith("\n")
+
+
+class TestRobotLogSink:
+    """ทดสอบ RobotLogSink (แยก log ตาม robot)"""
+
+    def test_dispatch_by_robot(self, tmp_path):
+        """ทดสอบว่าข้อความไปลงไฟล์ของ robot ที่ bind ไว้เท่านั้น"""
+        from loguru import logger
+        from utils.log_sink import RobotLogSink
+        sink = RobotLogSink(str(tmp_path), ["R1", "R2"])
+        sink_id = logger.add(sink, format="{message}", filter=RobotLogSink.accepts, enqueue=True)
+        try:
+            logger.bind(robot="R1").info("hello R1")
+            logger.bind(robot="R2").info("hello R2")
+            logger.info("system only")
+        finally:
+            logger.remove(sink_id)
+            sink.close()
+        assert (tmp_path / "R1.log").read_text(encoding="utf-8") == "hello R1\n"
+        assert (tmp_path / "R2.log").read_text(encoding="utf-8") == "hello R2\n"
+
+    def test_lines_are_batched_until_flush(self, tmp_path):
+        """ทดสอบว่าข้อความถูกพักไว้จนกว่าจะ flush"""
+        from loguru import logger
+        from utils.log_sink import RobotLogSink
+        sink = RobotLogSink(str(tmp_path), ["R1"], flush_interval=3600)
+        sink_id = logger.add(sink, format="{message}", filter=RobotLogSink.accepts)
+        try:
+            for i in range(3):
+                logger.bind(robot="R1").info(f"line {i}")
+            assert (tmp_path / "R1.log").read_text(encoding="utf-8") == ""
+            sink.flush()
+            assert (tmp_path / "R1.log").read_text(encoding="utf-8") == "line 0\nline 1\nline 2\n"
+        finally:
+            logger.remove(sink_id)
+            sink.close()
+
+    def test_close_is_idempotent(self, tmp_path):
+        """ทดสอบว่า close ซ้ำได้ (ใช้ร่วมกับ atexit) และข้อความค้างถูกเขียนครบ"""
+        from utils.log_sink import RobotLogSink
+        sink = RobotLogSink(str(tmp_path), ["R1"], flush_interval=3600)
+        sink.pending["R1"].append("pending\n")
+        sink.close()
+        sink.close()
+        assert (tmp_path / "R1.log").read_text(encoding="utf-8") == "pending\n"
+
+
 class TestANSIColors:
     """ทดสอบ ANSIColors class"""
     
@@ -287,6 +506,24 @@ class TestSettings:
         assert settings.PATTERN_DIR is not None
         assert settings.DEADLOCK_MODEL_PATH is not None
 
+    def test_apply_overrides(self):
+        """ทดสอบการเขียนค่าจาก config ทับ settings เดิม"""
+        from core.settings import Settings
+        local = Settings()
+        result = local.apply_overrides({"rows": 12, "max_steps": 50, "unknown": 1})
+        assert result is local
+        assert local.ROWS == 12
+        assert local.MAX_STEPS == 50
+        with pytest.raises(AttributeError):
+            local.NOT_A_SETTING = 1
+
+    def test_headless_override(self):
+        """ทดสอบว่า headless ปิดไว้โดย default และเปิดได้จาก config"""
+        from core.settings import Settings
+        local = Settings()
+        assert local.HEADLESS is False
+        assert local.apply_overrides({"headless": True}).HEADLESS is True
+
 
 class TestCellPenalty:
     """ทดสอบ CellPenalty dataclass"""
@@ -312,6 +549,101 @@ class TestCellPenalty:
         assert cell.yield_zone == True
 
 
+class TestCellBitmap:
+    """ทดสอบ CellBitmap"""
+
+    def test_membership_and_border(self):
+        """ทดสอบ add/contains/clear และขอบนอก grid"""
+        from utils.cell_bitmap import CellBitmap
+        bits = CellBitmap(3, 4, [(0, 0), (2, 3), (5, 5)], border=True)
+        assert (0, 0) in bits and (2, 3) in bits
+        assert (1, 1) not in bits
+        assert (-1, 0) in bits and (0, 4) in bits  # ขอบ
+        assert (5, 5) not in bits  # นอก grid ถูกข้าม
+        bits.clear()
+        assert (0, 0) not in bits and (-1, 0) in bits
+        assert (1, 1) not in CellBitmap(3, 4).copy()
+
+    def test_neighbor_counts(self):
+        """ทดสอบการนับช่องที่ตั้งค่าใน 4 ทิศ (ขอบนอก grid ไม่นับ)"""
+        from utils.cell_bitmap import CellBitmap
+        bits = CellBitmap(3, 4, [(0, 1), (1, 0), (2, 3)])
+        counts = bits.neighbor_counts()
+        for r in range(3):
+            for c in range(4):
+                expected = sum((r + dr, c + dc) in bits for dr, dc in ((1, 0), (-1, 0), (0, 1), (0, -1)))
+                assert counts[bits.index((r, c))] == expected
+        assert counts[bits.index((0, 0))] == 2
+
+
+class TestRobotTable:
+    """ทดสอบ RobotTable (Structure-of-Arrays)"""
+
+    def _make_robot(self, robot_id, pos):
+        return {"id": robot_id, "pos": pos, "home": pos, "state": "IDLE",
+                "package": None, "wait_count": 0}
+
+    def test_append_keeps_dict_interface(self):
+        """ทดสอบว่า robot ยังใช้งานแบบ dict ได้"""
+        table = RobotTable()
+        robot = table.append(self._make_robot(1, (2, 3)))
+        assert table[0] is robot
+        assert robot["pos"] == (2, 3)
+        assert table.by_id[1] is robot
+
+    def test_write_through(self):
+        """ทดสอบว่าการแก้ค่าใน dict อัพเดท arrays"""
+        table = RobotTable()
+        robot = table.append(self._make_robot(1, (2, 3)))
+        robot["pos"] = (4, 5)
+        robot["state"] = "TO_PICKUP"
+        robot["package"] = 7
+        robot["wait_count"] += 2
+        assert tuple(table.pos[0]) == (4, 5)
+        assert table.state[0] == STATE_CODES["TO_PICKUP"]
+        assert table.package[0] == 7
+        assert table.wait_count[0] == 2
+
+    def test_at_home(self):
+        """ทดสอบ mask ของ robot ที่อยู่ที่ home"""
+        table = RobotTable()
+        table.append(self._make_robot(1, (2, 3)))
+        moved = table.append(self._make_robot(2, (4, 5)))
+        moved["pos"] = (4, 6)
+        assert table.at_home().tolist() == [True, False]
+
+    def test_grow(self):
+        """ทดสอบการขยาย arrays เมื่อเกิน capacity"""
+        table = RobotTable(capacity=2)
+        for i in range(5):
+            table.append(self._make_robot(i + 1, (i, i)))
+        assert len(table.pos) == 5
+        assert tuple(table.pos[4]) == (4, 4)
+        assert table.index_of(5) == 4
+
+    def test_state_counts(self):
+        """ทดสอบการนับจำนวน robot ในแต่ละ state"""
+        table = RobotTable()
+        robot = table.append(self._make_robot(1, (0, 0)))
+        table.append(self._make_robot(2, (1, 1)))
+        assert table.state_counts[STATE_CODES["IDLE"]] == 2
+        robot["state"] = "TO_PICKUP"
+        assert table.state_counts[STATE_CODES["IDLE"]] == 1
+        assert table.state_counts[STATE_CODES["TO_PICKUP"]] == 1
+
+    def test_occupancy_follows_moves(self):
+        """ทดสอบว่า occupancy grid อัพเดทเมื่อ robot เคลื่อนที่"""
+        table = RobotTable()
+        table.append(self._make_robot(1, (0, 0)))
+        robot = table.append(self._make_robot(2, (1, 1)))
+        table.attach_grid(5, 5)
+        assert table.occupancy[1, 1] == 1
+        robot["pos"] = (1, 2)
+        assert table.occupancy[1, 1] == -1
+        assert table.occupancy[1, 2] == 1
+        assert table.occupancy[0, 0] == 0
+
+
 # ===========================
 # Integration Tests
 # ===========================
@@ -325,6 +657,55 @@ class TestSimulationControllerIntegration:
         from controllers.simulation_controller import SimulationController
         return SimulationController(settings.PATTERN_DIR)
     
+    def test_config_cache_not_shared(self, controller):
+        """ทดสอบว่าการแก้ config ของ controller หนึ่งไม่กระทบ controller ที่โหลดไฟล์เดียวกันภายหลัง"""
+        from controllers.simulation_controller import SimulationController
+        assert "_pos" in controller.config_data["robots"][0]
+        controller.config_data["robots"][0]["pos"] = [0, 0]
+        controller.config_data["robots"].append({"name": "EXTRA", "pos": [1, 1]})
+        fresh = SimulationController(settings.PATTERN_DIR)
+        assert fresh.config_data is not controller.config_data
+        assert len(fresh.robots) == len(controller.robots)
+        assert fresh.robots[0]["pos"] == controller.robots[0]["pos"]
+
+    def test_plan_path_fallback(self, controller):
+        """ทดสอบว่า plan_path ใช้ fallback เมื่อ blocked ปิดทุกทาง"""
+        other = controller.robots[0]
+        r, c = other["pos"]
+        target = next(
+            (r + dr, c + dc) for dr in range(3, 10) for dc in range(-3, 4)
+            if controller.is_safe_cell((r + dr, c + dc))
+            and controller._occupant_at((r + dr, c + dc)) < 0
+        )
+        neighbors = {(r + dr, c + dc) for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1))}
+        assert controller.plan_path(other, target, neighbors) == []
+        path = controller.plan_path(other, target, neighbors, fallback=True)
+        assert path and path[-1] == target
+
+    def test_can_commit_matches_is_valid_move(self, controller):
+        """ทดสอบว่า can_commit ให้ผลตรงกับ is_valid_move และแยก SWAP ได้"""
+        a, b = controller.robots[0], controller.robots[1]
+        reserved = {(controller.rows - 1, controller.cols - 1)}
+        for rb in (a, b):
+            r, c = rb["pos"]
+            for cell in [(r + dr, c + dc) for dr in range(-2, 3) for dc in range(-2, 3)] + list(reserved):
+                ok = controller.can_commit(rb, cell, reserved, {}) is None
+                assert ok == controller.is_valid_move(rb, cell, reserved)
+
+        planned = {b["id"]: a["pos"]}
+        assert controller.can_commit(a, b["pos"], set(), planned) == "SWAP"
+        assert controller.can_commit(a, b["pos"], set(), {}) == "OCCUPIED"
+        assert controller.can_commit(a, (-1, 0), set(), {}) == "INVALID"
+
+    def test_begin_step_moves_reuses_containers(self, controller):
+        """ทดสอบว่า begin_step_moves ล้างและคืน container เดิม"""
+        reserved, planned = controller.begin_step_moves()
+        reserved.add((0, 0))
+        planned[1] = (0, 0)
+        again = controller.begin_step_moves()
+        assert again[0] is reserved and again[1] is planned
+        assert not reserved and not planned
+
     def test_init_robots(self, controller):
         """ทดสอบการ init robots"""
         assert len(controller.robots) > 0
@@ -343,10 +724,44 @@ class TestSimulationControllerIntegration:
             assert "dropoff" in pkg
             assert "status" in pkg
     
+    def test_validate_config_rejects_bad_positions(self, tmp_path, capsys):
+        """ทดสอบว่า config ที่มีตำแหน่งในกำแพง/นอก grid ถูกปฏิเสธ"""
+        import json
+        from controllers.simulation_controller import SimulationController
+        config = {
+            "settings": {"rows": 10, "cols": 10},
+            "walls": [[1, 1, 1, 5]],
+            "robots": [{"id": 1, "name": "R1", "pos": [1, 2]}],
+            "packages": [{"name": "P1", "pickup": [3, 3], "dropoff": [20, 3]}],
+        }
+        path = tmp_path / "bad.json"
+        path.write_text(json.dumps(config))
+        rows, cols = settings.ROWS, settings.COLS
+        try:
+            with pytest.raises(SystemExit):
+                SimulationController(str(path))
+        finally:
+            settings.ROWS, settings.COLS = rows, cols
+        out = capsys.readouterr().out
+        assert "Robot R1: position (1, 2) is inside a wall" in out
+        assert "Package P1: dropoff (20, 3) out of bounds" in out
+
     def test_init_obstacles(self, controller):
         """ทดสอบการ init obstacles"""
         assert len(controller.obstacles) > 0
-    
+
+    def test_obstacle_grid_matches_obstacles(self, controller):
+        """ทดสอบว่า obstacle_grid ตรงกับ obstacles ที่อยู่ใน grid"""
+        grid = controller.obstacle_grid
+        assert grid.shape == (settings.ROWS, settings.COLS)
+        in_bounds = {
+            (r, c) for r, c in controller.obstacles
+            if 0 <= r < settings.ROWS and 0 <= c < settings.COLS
+        }
+        assert int(grid.sum()) == len(in_bounds)
+        for r, c in in_bounds:
+            assert grid[r, c] == 1
+
     def test_is_safe_cell(self, controller):
         """ทดสอบ is_safe_cell"""
         # ตำแหน่งว่าง
@@ -419,12 +834,40 @@ class TestPathFinderIntegration:
         predictions = pathfinder.predict_future_positions(robot, steps=3)
         assert isinstance(predictions, dict)
     
+    def test_has_clear_line_bresenham(self):
+        """ทดสอบว่า has_clear_line ตรวจเฉพาะช่องระหว่างทางตามเส้น Bresenham"""
+        from utils.pathfinding import PathFinder
+        robot = {"package": None, "state": "IDLE"}
+        pf = PathFinder({(2, 2), (4, 1)}, {}, [], {})
+        assert pf.has_clear_line((0, 0), (0, 4), robot)
+        assert not pf.has_clear_line((2, 0), (2, 4), robot)  # (2, 2) ขวางกลางทาง
+        assert pf.has_clear_line((2, 0), (2, 2), robot)  # ปลายทางไม่ถูกตรวจ
+        assert not pf.has_clear_line((0, 0), (3, 3), robot)  # เส้นทแยงผ่าน (2, 2)
+        assert not pf.has_clear_line((3, 0), (5, 1), robot)  # ช่องกลางของเส้นคือ (4, 1)
+        assert pf.has_clear_line((5, 0), (3, 0), robot)
+        assert not pf.has_clear_line((0, 0), (3, 4), robot)  # ไกลเกิน 5
+        pf.packages[0] = {"pickup": (1, 3), "dropoff": (7, 7), "status": "WAITING"}
+        assert not pf.has_clear_line((1, 1), (1, 5), robot)
+
     def test_is_narrow_passage(self, pathfinder):
         """ทดสอบการตรวจจับทางแคบ"""
         # ต้องหาตำแหน่งที่เป็นทางแคบจริง
         result = pathfinder.is_narrow_passage((0, 0))
         assert isinstance(result, bool)
 
+    def test_priority_order_matches_sorted(self, pathfinder):
+        """ทดสอบว่าลำดับ priority แบบ vectorized ตรงกับ sorted เดิม"""
+        robots = pathfinder.robots
+        robots[0]["state"] = "TO_DROPOFF"
+        robots[0]["path"] = [(0, 0)] * 7
+        robots[1]["wait_count"] = 4
+        robots[-1]["momentum"] = 2
+        expected = sorted(robots, key=pathfinder.get_robot_priority, reverse=True)
+        assert pathfinder.get_priority_order() == expected
+        assert pathfinder.compute_priority_vector().tolist() == [
+            pathfinder.get_robot_priority(rb) for rb in robots
+        ]
+
 
 class TestDeadlockResolverIntegration:
     """ทดสอบ DeadlockResolver แบบ Integration"""
@@ -441,6 +884,37 @@ class TestDeadlockResolverIntegration:
         robot = resolver.robots[0]
         importance = resolver.get_robot_importance(robot)
         assert isinstance(importance, (int, float))
+
+    def test_robot_importances_match_scalar(self, resolver):
+        """ทดสอบว่า importance แบบ vectorized ตรงกับ get_robot_importance ทีละตัว"""
+        robots = resolver.robots
+        carrier = robots[0]
+        carrier["package"] = next(iter(resolver.packages))
+        carrier["state"] = "TO_DROPOFF"
+        carrier["path"] = [(1, 1)] * 7
+        robots[1]["wait_count"] = 3
+        robots[1]["momentum"] = 2
+        indices = list(range(len(robots)))
+        expected = [resolver.get_robot_importance(rb) for rb in robots]
+        assert resolver.robot_importances(indices).tolist() == expected
+
+    def test_score_importances_kernel(self, resolver):
+        """ทดสอบ kernel คะแนนความสำคัญกับ state/path/package หลายแบบ"""
+        from utils.deadlock_resolver import score_importances
+        rb = {"momentum": 1, "wait_count": 2}
+        states, carrying, path_len, expected = [], [], [], []
+        for state in list(STATE_CODES) + ["UNKNOWN"]:
+            for package in (None, 1):
+                for length in (0, 3, 700):
+                    rb.update(state=state, package=package, path=[(0, 0)] * length)
+                    states.append(STATE_CODES.get(state, -1))
+                    carrying.append(state == "TO_DROPOFF" and package is not None)
+                    path_len.append(length)
+                    expected.append(resolver.get_robot_importance(rb))
+        n = len(states)
+        scores = score_importances(states, carrying, path_len, [1] * n, [2] * n)
+        assert scores.dtype.name == "int32"
+        assert scores.tolist() == expected
     
     def test_get_emergency_move(self, resolver):
         """ทดสอบการหา emergency move"""
@@ -449,6 +923,125 @@ class TestDeadlockResolverIntegration:
         # อาจได้ None หรือ tuple
         assert move is None or isinstance(move, tuple)
 
+    def test_is_near_active_dropoff_matches_scan(self, resolver):
+        """ทดสอบว่า near-dropoff bitmap ให้ผลเหมือนการไล่ทุก robot"""
+        carrier = resolver.robots[0]
+        pid = next(iter(resolver.packages))
+        dropoff = resolver.packages[pid]["dropoff"]
+        carrier["package"] = pid
+        carrier["state"] = "TO_DROPOFF"
+        probe = {"pos": None}
+        for dr in range(-4, 5):
+            for dc in range(-4, 5):
+                probe["pos"] = (dropoff[0] + dr, dropoff[1] + dc)
+                for radius in (2, 3):
+                    expected = abs(dr) + abs(dc) <= radius
+                    assert resolver.is_near_active_dropoff(probe, radius) == expected
+        carrier["state"] = "IDLE"
+        probe["pos"] = dropoff
+        assert not resolver.is_near_active_dropoff(probe, 2)
+
+    def test_detect_deadlock_cycle(self):
+        """ทดสอบการหา cycle ใน wait-for graph และ deadlock group ของ robot 3 ตัว"""
+        from utils.deadlock_resolver import DeadlockResolver
+        assert DeadlockResolver.find_wait_cycles([1, 2, 0, 0, -1]) == {
+            0: ([0, 1, 2], 0), 1: ([0, 1, 2], 1), 2: ([0, 1, 2], 2)
+        }
+        wait = settings.DECISION_WAIT_THRESHOLD + 1
+        cells = [(0, 0), (0, 1), (1, 1)]
+        robots = [
+            {"id": i + 1, "pos": cells[i], "path": [cells[(i + 1) % 3]], "wait_count": wait}
+            for i in range(3)
+        ]
+        robots.append({"id": 4, "pos": (1, 0), "path": [(0, 0)], "wait_count": wait})
+        groups = DeadlockResolver(set(), {}, RobotTable(robots), {}).detect_deadlock_group()
+        assert groups and all(sorted(g) == [1, 2, 3] for g in groups)
+
+    def test_trace_wait_chain_stops_at_cycle(self):
+        """ทดสอบว่า wait chain หยุดเมื่อวนกลับมาที่ robot ที่อยู่ใน chain แล้ว"""
+        from utils.deadlock_resolver import DeadlockResolver
+        cells = [(0, 0), (0, 1), (1, 1)]
+        robots = RobotTable({"id": i + 1, "pos": cells[i], "path": [cells[(i + 1) % 3]]} for i in range(3))
+        resolver = DeadlockResolver(set(), {}, robots, {})
+        assert resolver.trace_wait_chain(robots[0]) == [1, 2, 3, 1]
+        robots[2]["path"] = []
+        assert resolver.trace_wait_chain(robots[0]) == [1, 2, 3]
+
+    def test_is_safe_cell_matches_bounds_and_obstacles(self, resolver):
+        """ทดสอบว่า is_safe_cell ตรงกับ in_bounds และ obstacles"""
+        for r in range(-1, settings.ROWS + 1):
+            for c in range(-1, settings.COLS + 1):
+                expected = GridUtils.in_bounds(r, c) and (r, c) not in resolver.obstacles
+                assert resolver.is_safe_cell((r, c)) == expected
+
+    def test_find_retreat_path_stops_at_blockers(self):
+        """ทดสอบว่าการถอยหลังหยุดที่ขอบ grid, obstacle และ robot ตัวอื่น"""
+        from utils.deadlock_resolver import DeadlockResolver
+        robots = RobotTable([
+            {"id": 1, "pos": (5, 5), "path": [], "last_dir": (0, 1)},
+            {"id": 2, "pos": (5, 2), "path": [], "last_dir": (0, 0)},
+        ])
+        robot = robots[0]
+        resolver = DeadlockResolver({(5, 3)}, {}, robots, {})
+        assert resolver.find_retreat_path(robot) == [(5, 4)]
+        resolver = DeadlockResolver(set(), {}, robots, {})
+        assert resolver.find_retreat_path(robot) == [(5, 4), (5, 3)]
+        robot["pos"], robot["last_dir"] = (1, 5), (1, 0)
+        assert resolver.find_retreat_path(robot) == [(0, 5)]
+
+    def test_decision_table_matches_thresholds(self, resolver):
+        """ทดสอบว่าตาราง dispatch เลือก handler ตามช่วง wait ของ thresholds"""
+        from bisect import bisect_right
+        expected = [
+            (settings.YIELD_THRESHOLD, resolver._decide_wait),
+            (settings.DECISION_WAIT_THRESHOLD, resolver._decide_yield),
+            (settings.FORCE_MOVE_THRESHOLD, resolver._decide_repath),
+            (settings.DEADLOCK_THRESHOLD, resolver._decide_retreat),
+        ]
+        for wait in range(settings.DEADLOCK_THRESHOLD + 3):
+            handler = resolver._decision_handlers[bisect_right(resolver._decision_bounds, wait)]
+            want = next((h for limit, h in expected if wait < limit), resolver._decide_deadlock)
+            assert handler == want
+        robot = resolver.robots[0]
+        robot["wait_count"] = settings.YIELD_THRESHOLD - 1
+        assert resolver.make_decisive_action(robot) == ("WAIT", None)
+
+    def test_critical_paths_follow_path_changes(self, resolver):
+        """ทดสอบว่า critical paths ที่ cache ไว้ตาม pop(0) และการแทน path"""
+        carrier = resolver.robots[0]
+        carrier["package"] = next(iter(resolver.packages))
+        carrier["state"] = "TO_DROPOFF"
+        carrier["path"] = [(1, 1), (1, 2), (1, 3)]
+        first = resolver.get_critical_paths()[carrier["id"]]
+        assert resolver.get_critical_paths()[carrier["id"]] is first
+        carrier["path"].pop(0)
+        assert resolver.get_critical_paths()[carrier["id"]] == {(1, 2), (1, 3)}
+        carrier["path"] = [(2, 2), (2, 3)]
+        assert resolver.get_critical_paths()[carrier["id"]] == {(2, 2), (2, 3)}
+        carrier["state"] = "IDLE"
+        assert carrier["id"] not in resolver.get_critical_paths()
+
+    def test_critical_union_reused_until_path_changes(self, resolver):
+        """ทดสอบว่า union ของ critical paths ถูกใช้ซ้ำจนกว่า path จะเปลี่ยน"""
+        carrier = resolver.robots[0]
+        carrier["package"] = next(iter(resolver.packages))
+        carrier["state"] = "TO_DROPOFF"
+        carrier["path"] = [(1, 1), (1, 2)]
+        union = resolver._critical_union(resolver.get_critical_paths())
+        assert resolver._critical_union(resolver.get_critical_paths()) is union
+        carrier["path"] = [(2, 2)]
+        assert resolver._critical_union(resolver.get_critical_paths()) == {(2, 2)}
+
+    def test_other_robot_at_follows_moves(self, resolver):
+        """ทดสอบว่า position index ตามการย้ายตำแหน่งของ robot"""
+        first, second = resolver.robots[0], resolver.robots[1]
+        assert resolver._other_robot_at(second["pos"], first) is second
+        assert resolver._other_robot_at(first["pos"], first) is None
+        old_pos = second["pos"]
+        second["pos"] = first["pos"]
+        assert resolver._other_robot_at(old_pos, first) is None
+        assert resolver._other_robot_at(first["pos"], first) is second
+
 
 class TestRobotManagerIntegration:
     """ทดสอบ RobotManager แบบ Integration"""
@@ -472,6 +1065,62 @@ class TestRobotManagerIntegration:
         result = manager.detect_oscillation(robot)
         assert isinstance(result, bool)
 
+    def test_position_history_is_bounded(self, manager):
+        """ทดสอบว่า position_history เก็บไม่เกิน OSCILLATION_WINDOW"""
+        robot = manager.robots[0]
+        for _ in range(settings.OSCILLATION_WINDOW * 3):
+            manager.detect_oscillation(robot)
+        assert len(robot["position_history"]) == settings.OSCILLATION_WINDOW
+        assert manager.detect_oscillation(robot) == True
+
+    def test_position_window_counts(self):
+        """ทดสอบการนับตำแหน่งไม่ซ้ำของ PositionWindow เมื่อมีการตัดค่าเก่า"""
+        from utils.robot_manager import PositionWindow
+        window = PositionWindow(3, [(0, 0), (0, 1), (0, 0)])
+        assert window.unique_count() == 2
+        window.append((0, 2))
+        window.append((0, 3))
+        assert list(window) == [(0, 0), (0, 2), (0, 3)]
+        assert window.unique_count() == 3
+        window.clear()
+        assert len(window) == 0 and window.unique_count() == 0
+
+    def test_blocked_for_robot_follows_moves(self, manager):
+        """ทดสอบว่า blocked set อัพเดทเมื่อ robot ขยับ (แม้จะ cache ไว้)"""
+        robot, other = manager.robots[0], manager.robots[1]
+        reserved = (settings.ROWS - 1, settings.COLS - 1)
+        blocked = manager.get_blocked_for_robot(robot, {reserved})
+        assert other["pos"] in blocked
+        assert robot["pos"] not in blocked
+        assert reserved in blocked
+        assert manager.obstacles <= blocked
+
+        old = other["pos"]
+        other["pos"] = robot["pos"]
+        blocked = manager.get_blocked_for_robot(robot, set())
+        assert old not in blocked or old in manager.obstacles
+        assert robot["pos"] not in blocked
+
+    def test_update_mode_timers(self, manager):
+        """ทดสอบตัวจับเวลา EVACUATING/YIELDING แบบ vectorized"""
+        evac, yielding = manager.robots[0], manager.robots[1]
+        evac["state"] = "EVACUATING"
+        yielding["decision_mode"] = "YIELDING"
+
+        evac_expired, yield_expired = manager.update_mode_timers(5)
+        assert evac["evac_start_step"] == 5
+        assert yielding["yield_start_step"] == 5
+        assert manager.robots.evac_start_step[0] == 5
+        assert not any(evac_expired) and not any(yield_expired)
+
+        evac_expired, yield_expired = manager.update_mode_timers(21)
+        assert evac_expired[0] and yield_expired[1]
+
+        evac["state"] = "IDLE"
+        manager.update_mode_timers(22)
+        assert evac["evac_start_step"] == 0
+        assert yielding["yield_start_step"] == 5
+
 
 # ===========================
 # Performance Tests
@@ -595,6 +1244,21 @@ class TestReservationTable:
         # timestep 15 ยังอยู่
         assert rt.is_reserved((6, 6), 15)
 
+    def test_clear_old_incremental(self):
+        """ทดสอบการล้าง old reservations ทีละ step ตามที่ simulation เรียก"""
+        from utils.time_space_astar import ReservationTable
+        rt = ReservationTable()
+        rt.reserve_path(robot_id=1, path=[(1, 1), (1, 2), (1, 3)], start_time=0)
+        for step in range(3):
+            rt.clear_old(step)
+        assert sorted(rt.reservations) == list(range(2, 3 + settings.TIME_HORIZON))
+        assert rt.robot_reservations[1][0] == ((1, 3), 2)
+        rt.reserve(robot_id=2, position=(4, 4), timestep=1)
+        rt.clear_old(2)
+        assert not rt.is_reserved((4, 4), 1)
+        rt.clear_robot(1)
+        assert all(not slot for slot in rt.reservations.values())
+
 
 class TestTimeSpaceAStar:
     """ทดสอบ TimeSpaceAStar class"""
@@ -642,7 +1306,81 @@ class TestTimeSpaceAStar:
         )
         
         assert path == []  # ไม่ต้องเดินไปไหน
-    
+
+    def test_cell_tables_match_obstacles(self):
+        """ทดสอบว่าตารางทางแคบ/corridor ตรงกับ obstacles และ corridor_map"""
+        from utils.time_space_astar import TimeSpaceAStar
+        from utils.grid_utils import NEIGHBORS4
+        obstacles = {(0, 1), (2, 0), (2, 2), (-1, 5)}
+        corridor_map = {(1, 1): 7, (3, 3): 2}
+        ts = TimeSpaceAStar(obstacles, corridor_map, [], {})
+        for r in range(-1, 5):
+            for c in range(-1, 5):
+                open_count = sum(
+                    GridUtils.in_bounds(r + dr, c + dc) and (r + dr, c + dc) not in obstacles
+                    for dr, dc in NEIGHBORS4
+                )
+                assert ts.is_narrow_passage((r, c)) == (open_count <= 2)
+        assert ts._corridor_scores[ts.obstacle_bits.index((1, 1))] == 7
+        assert ts._corridor_scores[ts.obstacle_bits.index((0, 0))] == 0
+
+    def test_restricted_cells_except_goal(self, ts_astar):
+        """ทดสอบว่า pickup ที่รออยู่ถูก block ยกเว้นเมื่อเป็น goal"""
+        robot = ts_astar.robots[0]
+        ts_astar.packages[7] = {"pickup": (0, 2), "dropoff": (3, 3), "status": "WAITING"}
+        assert ts_astar._restricted_cells(robot, (0, 4)) == [(0, 2)]
+        assert ts_astar._restricted_cells(robot, (0, 2)) == []
+        path = ts_astar.find_path((0, 0), (0, 4), 0, robot)
+        assert path and (0, 2) not in path
+        assert ts_astar.find_path((0, 0), (0, 2), 0, robot)[-1] == (0, 2)
+
+    def test_fallback_path_cache(self, ts_astar):
+        """ทดสอบว่า fallback A* ใช้ path ที่ cache ไว้ และคำนวณใหม่เมื่อสถานะ package เปลี่ยน"""
+        robot = ts_astar.robots[0]
+        first = ts_astar._fallback_astar((0, 0), (0, 4), robot, set())
+        expected = list(first)
+        first.pop(0)  # แก้ list ที่ได้ไปต้องไม่กระทบ cache
+        assert ts_astar._fallback_astar((0, 0), (0, 4), robot, set()) == expected
+        assert len(ts_astar._path_cache) == 1
+        ts_astar.packages[7] = {"pickup": (0, 2), "dropoff": (3, 3), "status": "WAITING"}
+        detour = ts_astar._fallback_astar((0, 0), (0, 4), robot, set())
+        assert (0, 2) not in detour and len(ts_astar._path_cache) == 2
+
+    def test_can_enter_matches_package_scan(self, ts_astar):
+        """ทดสอบว่า can_enter_* ผ่าน index ตรงกับการไล่ทุก package (รวม package ที่ใช้ตำแหน่งเดียวกัน)"""
+        import random
+        rng = random.Random(3)
+        cells = [(0, c) for c in range(4)]
+        statuses = ("WAITING", "PICKED", "DELIVERED")
+
+        def scan_dropoff(robot, pos):
+            for pid, pkg in ts_astar.packages.items():
+                if pkg["dropoff"] == pos:
+                    if robot["package"] == pid and robot["state"] == "TO_DROPOFF":
+                        return True
+                    return pkg["status"] in ("DELIVERED", "WAITING")
+            return True
+
+        def scan_pickup(robot, pos):
+            if robot["package"] is not None:
+                my_pkg = ts_astar.packages[robot["package"]]
+                if my_pkg["pickup"] == pos and robot["state"] == "TO_PICKUP":
+                    return True
+            return not any(pkg["pickup"] == pos and pkg["status"] == "WAITING"
+                           for pkg in ts_astar.packages.values())
+
+        for pid in range(6):
+            ts_astar.packages[pid] = {"pickup": rng.choice(cells), "dropoff": rng.choice(cells),
+                                      "status": "WAITING"}
+            for _ in range(20):
+                for pkg in ts_astar.packages.values():
+                    pkg["status"] = rng.choice(statuses)
+                robot = {"package": rng.choice([None, *ts_astar.packages]),
+                         "state": rng.choice(["IDLE", "TO_PICKUP", "TO_DROPOFF"])}
+                for pos in cells + [(5, 5)]:
+                    assert ts_astar.can_enter_dropoff(robot, pos) == scan_dropoff(robot, pos)
+                    assert ts_astar.can_enter_pickup(robot, pos) == scan_pickup(robot, pos)
+
     def test_avoid_reserved_positions(self, ts_astar):
         """ทดสอบการหลีกเลี่ยง reserved positions"""
         # จองตำแหน่งที่อยู่ตรงกลาง
@@ -674,6 +1412,39 @@ class TestTimeSpaceAStar:
         if path:
             assert path[-1] == (3, 3)
 
+    def test_workspace_reused_between_searches(self, ts_astar):
+        """ทดสอบว่า workspace ถูกใช้ซ้ำและผลการค้นหาเหมือนเดิม"""
+        robot = ts_astar.robots[0]
+        workspace = ts_astar.workspace
+        first = ts_astar._fallback_astar((0, 0), (3, 3), robot, set())
+        second = ts_astar._fallback_astar((0, 0), (3, 3), robot, set())
+        assert first == second
+        assert ts_astar.workspace is workspace
+
+    def test_workspace_path_reconstruction(self):
+        """ทดสอบการย้อน path จาก parent pointer"""
+        from utils.time_space_astar import AStarWorkspace
+        ws = AStarWorkspace()
+        a = ws.add_node((0, 1), -1)
+        b = ws.add_node((0, 1), a)
+        c = ws.add_node((0, 2), b)
+        assert ws.path_to(c) == [(0, 1), (0, 1), (0, 2)]
+        assert ws.trailing_count(b, (0, 1), limit=5) == 2
+        assert ws.trailing_count(b, (0, 1), limit=1) == 1
+        ws.reset()
+        assert ws.node_pos == [] and ws.open_set == []
+
+    def test_workspace_indexed_states(self):
+        """ทดสอบว่า state แบบ index ถูก 'ล้าง' ด้วยการเพิ่ม generation และขยายตามขนาดที่ขอ"""
+        from utils.time_space_astar import AStarWorkspace
+        ws = AStarWorkspace()
+        g, seen, closed, gen = ws.begin_indexed(10)
+        assert len(g) == 10 and not any(v == gen for v in seen + closed)
+        seen[3] = closed[3] = gen
+        g, seen, closed, gen2 = ws.begin_indexed(20)
+        assert gen2 == gen + 1 and len(seen) == 20
+        assert seen[3] != gen2 and closed[3] != gen2
+
 
 class TestTimeSpaceAStarIntegration:
     """ทดสอบ Time-Space A* แบบ Integration กับ SimulationController"""
@@ -715,5 +1486,149 @@ class TestTimeSpaceAStarIntegration:
             assert isinstance(path, list)
 
 
+
+class TestTrainDeadlockModel:
+    """ทดสอบ pipeline ของ scripts/train_deadlock_model.py"""
+    
+    LOG_TEXT = (
+        "2024-01-01 00:00:00 | MOVE [1, 2] -> [1, 3] | STATE=TO_PICKUP | MODE=NORMAL\n"
+        "  2024-01-01 00:00:01 | BLOCKED [1, 3] -> [1, 4] | WAIT=2 | REASON=OCCUPIED\n"
+        "2024-01-01 00:00:02 | PICKUP P1 @ [1, 4]\n"
+        "2024-01-01 00:00:03 | YIELD to R2 -> [2, 3]\n"
+        "2024-01-01 00:00:04 | RETREAT -> [3, 3]\n"
+        "garbage line\n"
+        "2024-01-01 00:00:05 | EMERGENCY MOVE -> [4, 3]\n"
+    )
+    
+    @staticmethod
+    def naive_window_features(robot_codes, event_codes, window):
+        """คำนวณ window features ทีละ event ด้วย loop ตรงๆ (ใช้เป็นค่าอ้างอิง)"""
+        from scripts.train_deadlock_model import EVENT_CODES, DEADLOCK_CODES
+        n = len(event_codes)
+        blocks, moves, soon = [], [], []
+        for i in range(n):
+            back = [j for j in range(max(0, i - window), i) if robot_codes[j] == robot_codes[i]]
+            ahead = [j for j in range(i, min(n, i + window)) if robot_codes[j] == robot_codes[i]]
+            blocks.append(sum(event_codes[j] == EVENT_CODES['BLOCKED'] for j in back))
+            moves.append(sum(event_codes[j] == EVENT_CODES['MOVE'] for j in back))
+            soon.append(any(event_codes[j] in DEADLOCK_CODES for j in ahead))
+        return blocks, moves, soon
+    
+    def test_window_features_match_loop(self):
+        """ทดสอบว่า compute_window_features (prefix sum) ได้ค่าเดียวกับ loop ตรงๆ"""
+        import numpy as np
+        from scripts.train_deadlock_model import compute_window_features
+        rng = np.random.default_rng(0)
+        robot_codes = np.sort(rng.integers(0, 3, size=40))
+        event_codes = rng.integers(-1, 5, size=40).astype(np.int8)
+        for window in (1, 3, 5):
+            blocks, moves, soon = compute_window_features(robot_codes, event_codes, window)
+            expected = self.naive_window_features(robot_codes, event_codes, window)
+            assert blocks.tolist() == expected[0]
+            assert moves.tolist() == expected[1]
+            assert soon.tolist() == expected[2]
+    
+    def test_window_features_at_subset(self):
+        """ทดสอบว่า at= คืนผลเฉพาะตำแหน่งที่ขอ แต่ window ยังนับ events ทุกตัว"""
+        import numpy as np
+        from scripts.train_deadlock_model import compute_window_features
+        robot_codes = np.array([0, 0, 0, 0, 1, 1])
+        # MOVE, BLOCKED, YIELD, MOVE | MOVE, BLOCKED
+        event_codes = np.array([0, 1, 2, 0, 0, 1], dtype=np.int8)
+        at = np.array([1, 3, 5])
+        blocks, moves, soon = compute_window_features(robot_codes, event_codes, 2, at=at)
+        assert blocks.tolist() == [0, 1, 0]
+        assert moves.tolist() == [1, 0, 1]
+        assert soon.tolist() == [True, False, False]
+    
+    def test_parse_text_matches_parse_line(self):
+        """ทดสอบว่า _parse_text (regex เดียวทั้งไฟล์) ได้ events เดียวกับ _parse_line ทีละบรรทัด"""
+        from scripts.train_deadlock_model import LogParser, EVENT_COLUMNS
+        parser = LogParser()
+        df = parser._parse_text(self.LOG_TEXT, "R1")
+        expected = [
+            event for event in (
+                parser._parse_line(line.strip(), "R1", i)
+                for i, line in enumerate(self.LOG_TEXT.splitlines(), 1)
+            ) if event
+        ]
+        assert list(df.columns) == EVENT_COLUMNS
+        assert df['event_type'].tolist() == ['MOVE', 'BLOCKED', 'YIELD', 'RETREAT', 'EMERGENCY']
+        assert df.to_dict('records') == expected
+    
+    def test_create_features_target(self):
+        """ทดสอบว่า is_deadlock ของ sample รวม deadlock event ที่ตามมาใน window"""
+        import pandas as pd
+        from scripts.train_deadlock_model import LogParser, FeatureEngineer, FEATURE_COLUMNS
+        events = LogParser()._parse_text(self.LOG_TEXT, "R1")
+        features = FeatureEngineer(window_size=2).create_features(events)
+        # sample = MOVE, BLOCKED; YIELD อยู่ห่าง BLOCKED 1 event (ใน window) แต่ห่าง MOVE 2 events
+        assert features['is_deadlock'].tolist() == [False, True]
+        assert features['recent_moves'].tolist() == [0, 1]
+        assert features['dir_col'].tolist() == [1, 1]
+        assert list(features.columns[:-1]) == FEATURE_COLUMNS
+        assert isinstance(features, pd.DataFrame)
+    
+    def test_augment_samples_shape(self):
+        """ทดสอบว่า augment_samples ต่อสำเนา samples ตามจำนวน และ noise ไม่ทำให้ค่าติดลบ"""
+        import numpy as np
+        import pandas as pd
+        from scripts.train_deadlock_model import augment_samples
+        base = pd.DataFrame({
+            'wait': np.array([0, 3], dtype=np.int32),
+            'recent_blocks': np.array([0, 1], dtype=np.int16),
+            'is_deadlock': [False, True],
+        })
+        samples = base[base['is_deadlock']]
+        np.random.seed(0)
+        out = augment_samples(base, samples, copies=4)
+        assert len(out) == len(base) + 4
+        assert out['wait'].dtype == np.int32
+        assert (out['wait'] >= 0).all() and (out['recent_blocks'] >= 0).all()
+        assert out['is_deadlock'].iloc[len(base):].all()
+        np.random.seed(0)
+        assert out.equals(augment_samples(base, samples, copies=4))
+    
+    def test_feature_cache_roundtrip(self, tmp_path):
+        """ทดสอบว่า features cache โหลดกลับได้ค่า/dtype เดิม และ key เปลี่ยนเมื่อ log ถูกเขียนเพิ่ม"""
+        import joblib
+        import pandas as pd
+        from scripts.train_deadlock_model import build_features, feature_cache_path
+        log_dir = tmp_path / "logs"
+        log_dir.mkdir()
+        log_file = log_dir / "R1.log"
+        log_file.write_text(self.LOG_TEXT, encoding="utf-8")
+        
+        cache_dir = str(tmp_path / "cache")
+        path = feature_cache_path(cache_dir, [str(log_dir)], 5)
+        assert path == feature_cache_path(cache_dir, [str(log_dir)], 5)
+        assert path != feature_cache_path(cache_dir, [str(log_dir)], 3)
+        
+        features = build_features([str(log_dir)], 5)
+        os.makedirs(cache_dir, exist_ok=True)
+        joblib.dump(features, path)
+        pd.testing.assert_frame_equal(joblib.load(path), features)
+        
+        with open(log_file, "a", encoding="utf-8") as f:
+            f.write("2024-01-01 00:00:06 | MOVE [4, 3] -> [4, 4] | STATE=HOME | MODE=NORMAL\n")
+        assert feature_cache_path(cache_dir, [str(log_dir)], 5) != path
+    
+    def test_save_model_atomic(self, tmp_path):
+        """ทดสอบว่า save_model เขียนไฟล์ครบ (ไม่มี .tmp ค้าง) และโหลดกลับได้"""
+        import joblib
+        from scripts.train_deadlock_model import DeadlockModelTrainer
+        trainer = DeadlockModelTrainer()
+        trainer.best_model = {"weights": [1, 2, 3]}
+        trainer.best_model_name = "Dummy"
+        output = tmp_path / "models" / "deadlock_predictor.pkl"
+        trainer.save_model(str(output))
+        assert output.exists()
+        assert not (tmp_path / "models" / "deadlock_predictor.pkl.tmp").exists()
+        data = joblib.load(str(output))
+        assert data['model'] == {"weights": [1, 2, 3]}
+        assert data['model_name'] == "Dummy"
+        assert data['feature_columns'] == trainer.feature_columns
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
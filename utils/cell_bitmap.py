@@ -0,0 +1,74 @@
+"""
+Cell Bitmap Module
+bitmap ของตำแหน่งบน grid แบบ bytearray (index = (r+1) * stride + (c+1))
+มีขอบกว้าง 1 ช่องรอบ grid เพื่อให้ neighbor ของทุกช่องใน grid index ได้โดยไม่ต้องเช็ค bounds
+"""
+
+import numpy as np
+
+
+class CellBitmap:
+    """
+    ชุดตำแหน่ง (r, c) บน grid ขนาด rows x cols
+    border=True: ถือว่าช่องนอก grid (ขอบ) ถูกตั้งค่าไว้แล้ว ใช้เป็น blocked mask ของ A*
+    """
+
+    __slots__ = ("rows", "cols", "stride", "bits")
+
+    def __init__(self, rows, cols, cells=(), border=False):
+        self.rows = rows
+        self.cols = cols
+        self.stride = cols + 2
+        self.bits = bytearray((rows + 2) * self.stride)
+        if border:
+            stride = self.stride
+            self.bits[:stride] = b"\x01" * stride
+            self.bits[-stride:] = b"\x01" * stride
+            self.bits[::stride] = b"\x01" * (rows + 2)
+            self.bits[stride - 1::stride] = b"\x01" * (rows + 2)
+        self.update(cells)
+
+    def index(self, pos):
+        """index ของ pos ใน bits"""
+        return (pos[0] + 1) * self.stride + pos[1] + 1
+
+    def __contains__(self, pos):
+        r, c = pos
+        if -1 <= r <= self.rows and -1 <= c <= self.cols:
+            return self.bits[(r + 1) * self.stride + c + 1] == 1
+        return False
+
+    def add(self, pos):
+        """ตั้งค่าตำแหน่งใน grid (ตำแหน่งนอก grid ถูกข้าม)"""
+        r, c = pos
+        if 0 <= r < self.rows and 0 <= c < self.cols:
+            self.bits[(r + 1) * self.stride + c + 1] = 1
+
+    def update(self, cells):
+        for pos in cells:
+            self.add(pos)
+
+    def clear(self):
+        """ล้างทุกช่องใน grid (ขอบคงเดิม)"""
+        stride = self.stride
+        empty = bytes(self.cols)
+        for r in range(1, self.rows + 1):
+            self.bits[r * stride + 1:r * stride + 1 + self.cols] = empty
+
+    def neighbor_counts(self):
+        """
+        จำนวนช่องที่ถูกตั้งค่าใน 4 ทิศรอบทุกช่องของ grid (index เดียวกับ bits, ช่องขอบ = 0)
+        คำนวณทั้ง grid ด้วยการ shift array ครั้งเดียว คืนเป็น bytes
+        """
+        grid = np.frombuffer(self.bits, dtype=np.uint8).reshape(self.rows + 2, self.stride)
+        counts = np.zeros_like(grid)
+        counts[1:-1, 1:-1] = grid[:-2, 1:-1] + grid[2:, 1:-1] + grid[1:-1, :-2] + grid[1:-1, 2:]
+        return counts.tobytes()
+
+    def copy(self):
+        clone = CellBitmap.__new__(CellBitmap)
+        clone.rows = self.rows
+        clone.cols = self.cols
+        clone.stride = self.stride
+        clone.bits = bytearray(self.bits)
+        return clone
@@ -4,8 +4,41 @@ Deadlock Resolver Module
 """
 
 import random
+from bisect import bisect_right
+from collections import deque
+from itertools import permutations
+
+import numpy as np
+
 from core.settings import settings
-from utils.grid_utils import GridUtils
+from utils.grid_utils import GridUtils, NEIGHBORS4, NEIGHBORS8
+from utils.cell_bitmap import CellBitmap
+from utils.robot_table import STATES, STATE_CODES
+
+
+# ทุกลำดับที่เป็นไปได้ของ index 4 ทิศใน NEIGHBORS4 (ใช้สุ่มลำดับทิศใน get_emergency_move)
+DIRECTION_PERMUTATIONS = tuple(permutations(range(len(NEIGHBORS4))))
+
+# คะแนนความสำคัญพื้นฐานตาม state (state อื่น = 0)
+STATE_IMPORTANCE = {"TO_DROPOFF": 1000, "TO_PICKUP": 500, "HOME": 100, "EVACUATING": 50}
+# แบบ array ตาม state code ของ RobotTable (ช่องท้าย = code -1 ที่ไม่รู้จัก)
+STATE_IMPORTANCE_BY_CODE = np.array([STATE_IMPORTANCE.get(name, 0) for name in STATES] + [0], dtype=np.int32)
+
+
+def score_importances(states, carrying, path_len, momentum, wait_count):
+    """
+    คะแนนความสำคัญของ robots หลายตัวในครั้งเดียว (สูตรเดียวกับ get_robot_importance แบบไม่มี branch)
+    states = state code ของ RobotTable, carrying = bool mask ของ robot ที่ส่งของ (TO_DROPOFF + มี package)
+    path_len = ความยาว path (0 = ไม่มี path) คืน int32 array
+    """
+    states = np.asarray(states)
+    carrying = np.asarray(carrying, dtype=bool)
+    path_len = np.asarray(path_len, dtype=np.int32)
+    # robot ที่ส่งของและยังมี path ได้โบนัสตามความใกล้ปลายทาง
+    bonus = np.where(carrying & (path_len > 0), 500 - np.minimum(path_len, 500), 0)
+    return (STATE_IMPORTANCE_BY_CODE[states] + bonus
+            + np.asarray(momentum, dtype=np.int32) * 20
+            + np.asarray(wait_count, dtype=np.int32) * 10).astype(np.int32)
 
 
 class DeadlockResolver:
@@ -16,124 +49,220 @@ class DeadlockResolver:
         self.corridor_map = corridor_map
         self.robots = robots
         self.packages = packages
+        # ค่าจาก settings ที่ใช้ทุก tick (overrides ถูก apply ก่อนสร้าง resolver แล้ว)
+        self._rows = settings.ROWS
+        self._cols = settings.COLS
+        self._decision_wait_threshold = settings.DECISION_WAIT_THRESHOLD
+        # obstacle bitmap แบบมีขอบ (นอก grid = blocked) ให้ BFS เช็คทีละช่องด้วย index เดียว
+        self.obstacle_bits = CellBitmap(self._rows, self._cols, obstacles, border=True)
+        # จำนวน obstacle 4 ทิศรอบแต่ละช่อง (index เดียวกับ obstacle_bits, ขอบนอก grid ไม่นับ)
+        self._obstacle_degree = CellBitmap(self._rows, self._cols, obstacles).neighbor_counts()
+        # visited ของ evacuation BFS (index เดียวกับ bitmap) ใช้ซ้ำทุกรอบด้วย epoch
+        self._bfs_visited = [0] * len(self.obstacle_bits.bits)
+        self._bfs_epoch = 0
+        # ตาราง dispatch ของ make_decisive_action (ขอบเขต wait, handler)
+        self._decision_bounds, self._decision_handlers = self._build_decision_table()
+        # pos -> ช่องเพื่อนบ้านที่ปลอดภัย (obstacles ไม่เปลี่ยนระหว่าง simulation)
+        self._neighbor_table = {}
+        self._dropoff_index = None
+        self._dropoff_index_key = None
+        self._pos_index = None
+        self._pos_index_key = None
+        # robot id -> (path list, ความยาว, set ของ path) ใช้ซ้ำจนกว่า path จะเปลี่ยน
+        self._critical_cache = {}
+        # (sets ที่ใช้สร้าง, union) ของ critical paths ล่าสุด
+        self._critical_union_cache = None
+        # robot id -> (path list, ความยาว, pos, steps, set ของหัว path + pos) ของ find_yield_position
+        self._path_head_cache = {}
     
     def get_robot_by_id(self, robot_id):
         """Helper method to find a robot by its ID"""
-        for rb in self.robots:
-            if rb["id"] == robot_id:
-                return rb
-        return None
+        return self.robots.by_id.get(robot_id)
+
+    def _position_index(self):
+        """dict ตำแหน่ง -> robot ตัวแรกที่อยู่ตรงนั้น (ตามลำดับใน robots) สร้างใหม่เมื่อมี robot ย้ายตำแหน่ง"""
+        key = self.robots.pos_version
+        if self._pos_index_key != key:
+            self._pos_index = {rb["pos"]: rb for rb in reversed(self.robots)}
+            self._pos_index_key = key
+        return self._pos_index
+
+    def _other_robot_at(self, pos, robot):
+        """robot ตัวแรกที่อยู่ที่ pos ที่ไม่ใช่ robot หรือ None (O(1) ผ่าน position index)"""
+        other = self._position_index().get(pos)
+        if other is None or other["id"] != robot["id"]:
+            return other
+        # robot อยู่ที่ pos เอง: หาตัวอื่นที่ซ้อนตำแหน่งเดียวกัน (เกิดได้ยาก)
+        return next((rb for rb in self.robots if rb["id"] != robot["id"] and rb["pos"] == pos), None)
 
     def get_robot_importance(self, robot):
         """คำนวณความสำคัญของ robot"""
-        score = 0
-        if robot["state"] == "TO_DROPOFF":
-            score += 1000
-            if robot["package"] is not None and robot["path"]:
-                score += 500 - min(len(robot["path"]), 500)
-        elif robot["state"] == "TO_PICKUP":
-            score += 500
-        elif robot["state"] == "HOME":
-            score += 100
-        elif robot["state"] == "EVACUATING":
-            score += 50
-        
-        score += robot["momentum"] * 20
-        score += robot["wait_count"] * 10
-        return score
+        state = robot["state"]
+        score = STATE_IMPORTANCE.get(state, 0)
+        if state == "TO_DROPOFF" and robot["package"] is not None:
+            path = robot["path"]
+            if path:
+                score += 500 - min(len(path), 500)
+        return score + robot["momentum"] * 20 + robot["wait_count"] * 10
+
+    def robot_importances(self, indices):
+        """
+        ความสำคัญของ robots ที่ index ใน RobotTable แบบ vectorized (ค่าเดียวกับ get_robot_importance)
+        อ่าน state/package/momentum/wait_count จาก arrays มีแค่ความยาว path ของ carrier ที่อ่านจาก dict
+        """
+        robots = self.robots
+        idx = np.asarray(indices, dtype=np.intp)
+        states = robots.state[idx]
+        carrying = (states == STATE_CODES["TO_DROPOFF"]) & (robots.package[idx] >= 0)
+        path_len = np.zeros(len(idx), dtype=np.int32)
+        for k in np.flatnonzero(carrying).tolist():
+            path_len[k] = len(robots[idx[k]]["path"])
+        return score_importances(states, carrying, path_len, robots.momentum[idx], robots.wait_count[idx])
 
     def is_safe_cell(self, pos):
         """ตรวจสอบว่าตำแหน่งปลอดภัยหรือไม่"""
         r, c = pos
-        if not GridUtils.in_bounds(r, c):
-            return False
-        if pos in self.obstacles:
-            return False
-        return True
+        if 0 <= r < self._rows and 0 <= c < self._cols:
+            return not self.obstacle_bits.bits[(r + 1) * self.obstacle_bits.stride + c + 1]
+        return False
+
+    def _neighbor_cells(self, pos):
+        """
+        ช่องเพื่อนบ้านของ pos ตามลำดับ NEIGHBORS8 (4 ตัวแรก = NEIGHBORS4)
+        None = นอก grid หรือเป็น obstacle (คำนวณครั้งเดียวต่อช่องแล้วใช้ซ้ำ)
+        """
+        cells = self._neighbor_table.get(pos)
+        if cells is None:
+            r, c = pos
+            cells = tuple(
+                (r + dr, c + dc) if self.is_safe_cell((r + dr, c + dc)) else None
+                for dr, dc in NEIGHBORS8
+            )
+            self._neighbor_table[pos] = cells
+        return cells
 
     def get_emergency_move(self, robot):
         """หาตำแหน่งฉุกเฉินสำหรับ robot"""
-        directions = [(-1,0), (1,0), (0,-1), (0,1)]
-        random.shuffle(directions)
+        # ลำดับทิศแบบสุ่ม: เลือก 1 ใน 24 permutations ด้วยการสุ่มครั้งเดียว
+        directions = DIRECTION_PERMUTATIONS[random.randrange(len(DIRECTION_PERMUTATIONS))]
+        cells = self._neighbor_cells(robot["pos"])
         
-        for dr, dc in directions:
-            nr, nc = robot["pos"][0] + dr, robot["pos"][1] + dc
-            nxt = (nr, nc)
-            
-            if not self.is_safe_cell(nxt): continue
-            if any(other["pos"] == nxt for other in self.robots if other["id"] != robot["id"]): continue
+        for k in directions:
+            nxt = cells[k]
+            if nxt is None: continue
+            if self._other_robot_at(nxt, robot) is not None: continue
             if nxt in robot["failed_paths"]: continue
             return nxt
         
         robot["failed_paths"].clear()
-        for dr, dc in directions:
-            nr, nc = robot["pos"][0] + dr, robot["pos"][1] + dc
-            nxt = (nr, nc)
-            if not self.is_safe_cell(nxt): continue
-            if any(other["pos"] == nxt for other in self.robots if other["id"] != robot["id"]): continue
+        for k in directions:
+            nxt = cells[k]
+            if nxt is None: continue
+            if self._other_robot_at(nxt, robot) is not None: continue
             return nxt
         return None
 
     def trace_wait_chain(self, start_robot, max_depth=10):
         """ติดตาม chain ของ robots ที่รอกัน"""
         chain = [start_robot["id"]]
+        seen = {start_robot["id"]}
         current = start_robot
         for _ in range(max_depth):
             if not current["path"]: break
-            next_pos = current["path"][0]
-            next_robot = None
-            for rb in self.robots:
-                if rb["id"] != current["id"] and rb["pos"] == next_pos:
-                    next_robot = rb
-                    break
+            next_robot = self._other_robot_at(current["path"][0], current)
             if next_robot is None: break
-            if next_robot["id"] in chain:
-                chain.append(next_robot["id"])
-                break
-            chain.append(next_robot["id"])
+            next_id = next_robot["id"]
+            chain.append(next_id)
+            if next_id in seen: break
+            seen.add(next_id)
             current = next_robot
         return chain
 
-    def detect_deadlock_group(self):
+    def _wait_for_graph(self):
+        """
+        wait-for graph ของ robots: edges[i] = index ของ robot ที่อยู่ที่ path[0] ของ robot i
+        (-1 = ไม่มีใครขวาง) แต่ละ robot รอได้แค่ตัวเดียว จึงมี edge ออกไม่เกิน 1
+        """
+        robots = self.robots
+        at = {}
+        for i in range(len(robots) - 1, -1, -1):
+            at[robots[i]["pos"]] = i
+        edges = []
+        for i, rb in enumerate(robots):
+            j = at.get(rb["path"][0], -1) if rb["path"] else -1
+            edges.append(-1 if j == i else j)
+        return edges
+
+    @staticmethod
+    def find_wait_cycles(edges):
+        """
+        หา cycle ใน wait-for graph ที่มี edge ออกไม่เกิน 1 ต่อ node ใน O(V)
+        (SCC ขนาด >= 2 ของ graph แบบนี้คือ cycle พอดี)
+        คืน dict: index -> (cycle, ตำแหน่งของ index ใน cycle)
+        """
+        state = [0] * len(edges)  # 0 = ยังไม่เยี่ยม, 1 = อยู่ใน walk ปัจจุบัน, 2 = เสร็จแล้ว
+        cycles = {}
+        for start in range(len(edges)):
+            walk = []
+            node = start
+            while node >= 0 and state[node] == 0:
+                state[node] = 1
+                walk.append(node)
+                node = edges[node]
+            if node >= 0 and state[node] == 1:
+                cycle = walk[walk.index(node):]
+                for k, member in enumerate(cycle):
+                    cycles[member] = (cycle, k)
+            for member in walk:
+                state[member] = 2
+        return cycles
+
+    def detect_deadlock_group(self, max_depth=10):
         """ตรวจจับกลุ่ม robots ที่เกิด deadlock"""
         deadlock_groups = []
-        waiting_robots = [rb for rb in self.robots if rb["wait_count"] > settings.DECISION_WAIT_THRESHOLD]
-        if len(waiting_robots) < 2: return deadlock_groups
-        
+        robots = self.robots
+        threshold = self._decision_wait_threshold
+        waiting = np.flatnonzero(robots.wait_count > threshold).tolist()
+        if len(waiting) < 2: return deadlock_groups
+
+        # สร้าง wait-for graph และหา cycle ครั้งเดียว แทนการไล่ scan robots ทุกตัวซ้ำ
+        edges = self._wait_for_graph()
+        cycles = None
+        waiting_set = set(waiting)
         visited = set()
-        for rb in waiting_robots:
+        for i in waiting:
+            rb = robots[i]
             if rb["id"] in visited: continue
             group = [rb["id"]]
             visited.add(rb["id"])
-            
-            if rb["path"]:
-                next_pos = rb["path"][0]
-                for other in waiting_robots:
-                    if other["id"] != rb["id"] and other["pos"] == next_pos:
-                        group.append(other["id"])
-                        visited.add(other["id"])
-                        if other["path"] and other["path"][0] == rb["pos"]:
-                            deadlock_groups.append(group)
-                            break
-            
+
+            j = edges[i]
+            if j in waiting_set:
+                other = robots[j]
+                group.append(other["id"])
+                visited.add(other["id"])
+                if other["path"] and other["path"][0] == rb["pos"]:
+                    deadlock_groups.append(group)
+
             if len(group) >= 2:
-                chain = self.trace_wait_chain(rb)
-                if len(chain) >= 3 and chain[0] == chain[-1]:
-                    deadlock_groups.append(list(set(chain[:-1])))
+                if cycles is None:
+                    cycles = self.find_wait_cycles(edges)
+                entry = cycles.get(i)
+                # cycle ยาวเกิน max_depth ถือว่าไม่ใช่ deadlock (เหมือน trace_wait_chain)
+                if entry is not None and len(entry[0]) <= max_depth:
+                    cycle, k = entry
+                    deadlock_groups.append(list({robots[m]["id"] for m in cycle[k:] + cycle[:k]}))
         return deadlock_groups
 
     def resolve_deadlock_group(self, group):
         """แก้ไข deadlock group"""
         if len(group) < 2: return
-        min_importance = float('inf')
         least_important_robot = None
-        for rid in group:
-            rb = self.get_robot_by_id(rid)
-            if rb is None: continue
-            imp = self.get_robot_importance(rb)
-            if imp < min_importance:
-                min_importance = imp
-                least_important_robot = rb
+        members = [i for i in map(self.robots.index_of, group) if i is not None]
+        if members:
+            # argmin คืนตัวแรกเมื่อคะแนนเท่ากัน (เหมือนการเทียบ < ทีละตัว)
+            least = int(np.argmin(self.robot_importances(members)))
+            least_important_robot = self.robots[members[least]]
         
         if least_important_robot:
             emergency_pos = self.get_emergency_move(least_important_robot)
@@ -155,18 +284,31 @@ class DeadlockResolver:
             return robot1 if path1_len > path2_len else robot2
         return robot1 if robot1["id"] < robot2["id"] else robot2
 
+    def _path_head(self, robot, steps=5):
+        """
+        set ของ path `steps` ช่องแรก + ตำแหน่งปัจจุบันของ robot (ห้ามแก้ไข set ที่คืนไป)
+        ใช้ซ้ำจนกว่า path object, ความยาว path หรือตำแหน่งจะเปลี่ยน
+        """
+        path = robot["path"]
+        pos = robot["pos"]
+        cached = self._path_head_cache.get(robot["id"])
+        if (cached is None or cached[0] is not path or cached[1] != len(path)
+                or cached[2] != pos or cached[3] != steps):
+            head = set(path[:steps])
+            head.add(pos)
+            cached = (path, len(path), pos, steps, head)
+            self._path_head_cache[robot["id"]] = cached
+        return cached[4]
+
     def find_yield_position(self, robot, yield_to_robot):
         """หาตำแหน่งสำหรับหลบให้ robot อื่น"""
-        other_path = set(yield_to_robot["path"][:5]) if yield_to_robot["path"] else set()
-        other_path.add(yield_to_robot["pos"])
+        other_path = self._path_head(yield_to_robot)
         best_pos = None
         best_score = -999
         
-        for dr, dc in [(-1,0), (1,0), (0,-1), (0,1), (-1,-1), (-1,1), (1,-1), (1,1)]:
-            nr, nc = robot["pos"][0] + dr, robot["pos"][1] + dc
-            nxt = (nr, nc)
-            if not self.is_safe_cell(nxt): continue
-            if any(other["pos"] == nxt for other in self.robots if other["id"] != robot["id"]): continue
+        for nxt in self._neighbor_cells(robot["pos"]):
+            if nxt is None: continue
+            if self._other_robot_at(nxt, robot) is not None: continue
             if nxt in other_path: continue
             
             score = self.corridor_map.get(nxt, 0)
@@ -180,18 +322,34 @@ class DeadlockResolver:
 
     def find_retreat_path(self, robot, steps=3):
         """หา path สำหรับถอยหลัง"""
-        opposite_dir = (-robot["last_dir"][0], -robot["last_dir"][1])
-        retreat_positions = []
-        current = robot["pos"]
+        dr, dc = robot["last_dir"]
+        dr, dc = -dr, -dc
+        r, c = robot["pos"]
+        if not (-1 <= dr <= 1 and -1 <= dc <= 1):
+            # ทิศที่ก้าวเกิน 1 ช่องเดินผ่านขอบของ bitmap ได้ ใช้การเช็คแบบเดิม
+            retreat_positions = []
+            for _ in range(steps):
+                nxt = (r + dr, c + dc)
+                if not self.is_safe_cell(nxt): break
+                if self._other_robot_at(nxt, robot) is not None: break
+                retreat_positions.append(nxt)
+                r, c = nxt
+            return retreat_positions
+        
+        # เดินเป็นเส้นตรงบน padded bitmap: ขอบ grid ถูกตั้งค่าไว้ จึงไม่ต้องเช็ค bounds
+        bitmap = self.obstacle_bits
+        blocked = bitmap.bits
+        step = dr * bitmap.stride + dc
+        i = bitmap.index((r, c))
+        occupied = self._position_index()
+        count = 0
         for _ in range(steps):
-            nr = current[0] + opposite_dir[0]
-            nc = current[1] + opposite_dir[1]
-            nxt = (nr, nc)
-            if not self.is_safe_cell(nxt): break
-            if any(other["pos"] == nxt for other in self.robots if other["id"] != robot["id"]): break
-            retreat_positions.append(nxt)
-            current = nxt
-        return retreat_positions
+            i += step
+            if blocked[i]: break
+            nxt = (r + dr * (count + 1), c + dc * (count + 1))
+            if nxt in occupied and self._other_robot_at(nxt, robot) is not None: break
+            count += 1
+        return [(r + dr * k, c + dc * k) for k in range(1, count + 1)]
 
     def make_decisive_action(self, robot):
         """ตัดสินใจการกระทำเมื่อ robot ติดค้าง"""
@@ -206,94 +364,145 @@ class DeadlockResolver:
         if wait >= 3 and robot["package"] is not None:
             robot["failed_paths"].clear()
         
-        if wait < settings.YIELD_THRESHOLD:
-            return ("WAIT", None)
+        # เลือก handler ตามช่วงของ wait (ตารางสร้างจาก thresholds ตอน init)
+        return self._decision_handlers[bisect_right(self._decision_bounds, wait)](robot)
+
+    def _build_decision_table(self):
+        """
+        ขอบเขตของช่วง wait (เรียงแล้ว) และ handler ของแต่ละช่วง สำหรับ bisect_right
+        handler ของแต่ละช่วงหาจากเงื่อนไขเดิมแบบเรียงลำดับ จึงถูกต้องแม้ thresholds จะไม่เรียงกัน
+        """
+        yield_at = settings.YIELD_THRESHOLD
+        decision_at = settings.DECISION_WAIT_THRESHOLD
+        force_at = settings.FORCE_MOVE_THRESHOLD
+        deadlock_at = settings.DEADLOCK_THRESHOLD
+        
+        def handler_for(wait):
+            if wait < yield_at:
+                return self._decide_wait
+            if yield_at <= wait < decision_at:
+                return self._decide_yield
+            if decision_at <= wait < force_at:
+                return self._decide_repath
+            if force_at <= wait < deadlock_at:
+                return self._decide_retreat
+            if wait >= deadlock_at:
+                return self._decide_deadlock
+            return self._decide_wait
         
+        bounds = sorted({yield_at, decision_at, force_at, deadlock_at})
+        handlers = [handler_for(bounds[0] - 1)] + [handler_for(bound) for bound in bounds]
+        return tuple(bounds), tuple(handlers)
+
+    def _decide_wait(self, robot):
+        return ("WAIT", None)
+
+    def _decide_yield(self, robot):
+        """YIELD_THRESHOLD <= wait < DECISION_WAIT_THRESHOLD: หลบให้ robot ที่ขวางอยู่"""
         blocking_robot = None
         if robot["path"]:
-            next_pos = robot["path"][0]
-            for other in self.robots:
-                if other["id"] != robot["id"] and other["pos"] == next_pos:
-                    blocking_robot = other
-                    break
+            blocking_robot = self._other_robot_at(robot["path"][0], robot)
         
-        if settings.YIELD_THRESHOLD <= wait < settings.DECISION_WAIT_THRESHOLD:
-            if blocking_robot:
-                yielder = self.decide_who_yields(robot, blocking_robot)
-                if yielder["id"] == robot["id"]:
-                    yield_pos = self.find_yield_position(robot, blocking_robot)
-                    if yield_pos:
-                        robot["decision_mode"] = "YIELDING"
-                        robot["yield_to"] = blocking_robot["id"]
-                        return ("YIELD", yield_pos)
-            
-            if not robot["path"]:
-                robot["failed_paths"].clear()
-                return ("REPATH", None)
-            return ("WAIT", None)
+        if blocking_robot:
+            yielder = self.decide_who_yields(robot, blocking_robot)
+            if yielder["id"] == robot["id"]:
+                yield_pos = self.find_yield_position(robot, blocking_robot)
+                if yield_pos:
+                    robot["decision_mode"] = "YIELDING"
+                    robot["yield_to"] = blocking_robot["id"]
+                    return ("YIELD", yield_pos)
         
-        if settings.DECISION_WAIT_THRESHOLD <= wait < settings.FORCE_MOVE_THRESHOLD:
+        if not robot["path"]:
             robot["failed_paths"].clear()
-            if robot["path"]:
-                robot["failed_paths"].add(robot["path"][0])
-            robot["decision_mode"] = "NORMAL"
             return ("REPATH", None)
+        return ("WAIT", None)
+
+    def _decide_repath(self, robot):
+        """DECISION_WAIT_THRESHOLD <= wait < FORCE_MOVE_THRESHOLD: หาเส้นทางใหม่เลี่ยงช่องถัดไป"""
+        robot["failed_paths"].clear()
+        if robot["path"]:
+            robot["failed_paths"].add(robot["path"][0])
+        robot["decision_mode"] = "NORMAL"
+        return ("REPATH", None)
+
+    def _decide_retreat(self, robot):
+        """FORCE_MOVE_THRESHOLD <= wait < DEADLOCK_THRESHOLD: ถอยหลัง หรือ emergency move"""
+        robot["failed_paths"].clear()
+        retreat_path = self.find_retreat_path(robot)
+        if retreat_path:
+            robot["decision_mode"] = "RETREAT"
+            return ("RETREAT", retreat_path)
+        emergency_pos = self.get_emergency_move(robot)
+        if emergency_pos:
+            robot["decision_mode"] = "FORCED"
+            return ("EMERGENCY", emergency_pos)
+        return ("REPATH", None)
+
+    def _decide_deadlock(self, robot):
+        """wait >= DEADLOCK_THRESHOLD: บังคับ robot ที่ขวางให้หลบ หรือ emergency move"""
+        robot["failed_paths"].clear()
+        robot["stuck_count"] = 0
         
-        if settings.FORCE_MOVE_THRESHOLD <= wait < settings.DEADLOCK_THRESHOLD:
-            robot["failed_paths"].clear()
-            retreat_path = self.find_retreat_path(robot)
-            if retreat_path:
-                robot["decision_mode"] = "RETREAT"
-                return ("RETREAT", retreat_path)
+        if robot["state"] in ["IDLE", "HOME"]:
             emergency_pos = self.get_emergency_move(robot)
             if emergency_pos:
                 robot["decision_mode"] = "FORCED"
                 return ("EMERGENCY", emergency_pos)
-            return ("REPATH", None)
         
-        if wait >= settings.DEADLOCK_THRESHOLD:
-            robot["failed_paths"].clear()
-            robot["stuck_count"] = 0
-            
-            if robot["state"] in ["IDLE", "HOME"]:
-                emergency_pos = self.get_emergency_move(robot)
-                if emergency_pos:
-                    robot["decision_mode"] = "FORCED"
-                    return ("EMERGENCY", emergency_pos)
-            
-            if robot["path"]:
-                next_pos = robot["path"][0]
-                occupant = None
-                for other in self.robots:
-                    if other["id"] != robot["id"] and other["pos"] == next_pos:
-                        occupant = other
-                        break
-                if occupant and self.get_robot_importance(robot) > self.get_robot_importance(occupant) + 200:
-                    occupant["decision_mode"] = "FORCED"
-                    evac_pos = self.find_yield_position(occupant, robot)
-                    if evac_pos:
-                        occupant["path"] = [evac_pos]
-                        occupant["state"] = "EVACUATING"
-                        occupant["evac_target"] = evac_pos
-                        return ("WAIT", None)
-            
-            emergency_pos = self.get_emergency_move(robot)
-            if emergency_pos:
-                robot["decision_mode"] = "FORCED"
-                return ("EMERGENCY", emergency_pos)
-            return ("REPATH", None)
+        if robot["path"]:
+            occupant = self._other_robot_at(robot["path"][0], robot)
+            if occupant and self.get_robot_importance(robot) > self.get_robot_importance(occupant) + 200:
+                occupant["decision_mode"] = "FORCED"
+                evac_pos = self.find_yield_position(occupant, robot)
+                if evac_pos:
+                    occupant["path"] = [evac_pos]
+                    occupant["state"] = "EVACUATING"
+                    occupant["evac_target"] = evac_pos
+                    return ("WAIT", None)
         
-        return ("WAIT", None)
+        emergency_pos = self.get_emergency_move(robot)
+        if emergency_pos:
+            robot["decision_mode"] = "FORCED"
+            return ("EMERGENCY", emergency_pos)
+        return ("REPATH", None)
+
+    def _carriers(self):
+        """robots ที่กำลังส่งของ (TO_DROPOFF และมี package) เลือกจาก state/package arrays"""
+        robots = self.robots
+        mask = (robots.state == STATE_CODES["TO_DROPOFF"]) & (robots.package >= 0)
+        return [robots[i] for i in np.flatnonzero(mask).tolist()]
 
     def get_critical_paths(self):
         """ดึง paths ที่สำคัญของ robots ที่กำลังส่งของ"""
+        # path เปลี่ยนได้ 2 แบบ: ถูกแทนด้วย list ใหม่ หรือ pop(0) ตอนเดิน (ความยาวลดลง)
+        # จึงสร้าง set ใหม่เฉพาะ robot ที่ path object หรือความยาวไม่ตรงกับ cache
+        cache = self._critical_cache
         critical_paths = {}
-        for rb in self.robots:
-            if rb["state"] == "TO_DROPOFF" and rb["package"] is not None:
-                path_set = set(rb["path"])
-                critical_paths[rb["id"]] = path_set
+        for rb in self._carriers():
+            path = rb["path"]
+            cached = cache.get(rb["id"])
+            if cached is None or cached[0] is not path or cached[1] != len(path):
+                cached = (path, len(path), set(path))
+                cache[rb["id"]] = cached
+            critical_paths[rb["id"]] = cached[2]
+        if len(cache) > len(critical_paths):
+            for robot_id in [k for k in cache if k not in critical_paths]:
+                del cache[robot_id]
         return critical_paths
 
+    def _critical_union(self, critical_paths):
+        """
+        union ของ critical paths ทั้งหมด ใช้ซ้ำจนกว่า set ของ robot ใดจะเปลี่ยน
+        (get_critical_paths สร้าง set ใหม่เมื่อ path เปลี่ยนเท่านั้น จึงเทียบด้วย identity ได้)
+        """
+        sets = tuple(critical_paths.values())
+        cached = self._critical_union_cache
+        if (cached is None or len(cached[0]) != len(sets)
+                or any(a is not b for a, b in zip(cached[0], sets))):
+            cached = (sets, set().union(*sets))
+            self._critical_union_cache = cached
+        return cached[1]
+
     def is_in_critical_path(self, robot, critical_paths):
         """ตรวจสอบว่า robot อยู่ใน critical path หรือไม่"""
         for crit_id, path_set in critical_paths.items():
@@ -303,18 +512,16 @@ class DeadlockResolver:
 
     def find_evacuation_spot(self, robot, critical_paths, reserved):
         """หาจุดหลบที่ดีที่สุด"""
-        all_critical = set()
-        for path_set in critical_paths.values():
-            all_critical.update(path_set)
+        all_critical = self._critical_union(critical_paths)
         
         # 1. ลองหาจุดที่ใกล้ที่สุดก่อน
-        for dr, dc in [(-1,0), (1,0), (0,-1), (0,1)]:
-            nr, nc = robot["pos"][0] + dr, robot["pos"][1] + dc
-            nxt = (nr, nc)
+        cells = self._neighbor_cells(robot["pos"])
+        for k in range(len(NEIGHBORS4)):
+            nxt = cells[k]
             
-            if not self.is_safe_cell(nxt):
+            if nxt is None:
                 continue
-            if any(other["pos"] == nxt for other in self.robots if other["id"] != robot["id"]):
+            if self._other_robot_at(nxt, robot) is not None:
                 continue
             if nxt in reserved:
                 continue
@@ -325,44 +532,53 @@ class DeadlockResolver:
                     return nxt
         
         # 2. BFS หาที่ไกลออกไป
-        visited = {robot["pos"]}
-        queue = [(robot["pos"], 0)]
+        # index ลง obstacle bitmap (มีขอบ) แทน is_safe_cell และ position index แทนการหา robot
+        # (nxt ไม่มีทางเป็นตำแหน่งของ robot เองเพราะอยู่ใน visited ตั้งแต่แรก)
+        blocked_bits = self.obstacle_bits.bits
+        stride = self.obstacle_bits.stride
+        occupied = self._position_index()
+        corridor_get = self.corridor_map.get
+        obstacle_degree = self._obstacle_degree
+        # visited: ช่องที่มีค่า = epoch ของการค้นหารอบนี้ (ไม่ต้องล้างระหว่างรอบ)
+        self._bfs_epoch += 1
+        epoch = self._bfs_epoch
+        visited = self._bfs_visited
+        start_r, start_c = robot["pos"]
+        visited[(start_r + 1) * stride + start_c + 1] = epoch
+        visited_count = 1
+        queue = deque([(robot["pos"], 0)])
         best_spot = None
         best_score = -999
         
-        while queue and len(visited) < 30:
-            pos, dist = queue.pop(0)
+        while queue and visited_count < 30:
+            pos, dist = queue.popleft()
             
             if dist > 4:
                 continue
             
-            for dr, dc in [(-1,0), (1,0), (0,-1), (0,1)]:
-                nr, nc = pos[0] + dr, pos[1] + dc
-                nxt = (nr, nc)
-                
-                if nxt in visited:
+            r, c = pos
+            for dr, dc in NEIGHBORS4:
+                nr, nc = r + dr, c + dc
+                i = (nr + 1) * stride + nc + 1
+                if visited[i] == epoch:
                     continue
-                visited.add(nxt)
+                visited[i] = epoch
+                visited_count += 1
+                nxt = (nr, nc)
                 
-                if not self.is_safe_cell(nxt):
+                if blocked_bits[i]:
                     continue
                 
-                if any(other["pos"] == nxt for other in self.robots if other["id"] != robot["id"]):
-                    queue.append((nxt, dist + 1))
-                    continue
-                
-                if nxt in reserved:
+                if nxt in occupied or nxt in reserved:
                     queue.append((nxt, dist + 1))
                     continue
                 
                 if nxt not in all_critical:
-                    score = self.corridor_map.get(nxt, 0) * 2
+                    score = corridor_get(nxt, 0) * 2
                     score -= dist * 0.5
                     
-                    corner_count = sum(
-                        1 for dr2, dc2 in [(-1,0), (1,0), (0,-1), (0,1)]
-                        if (nxt[0] + dr2, nxt[1] + dc2) in self.obstacles
-                    )
+                    # obstacle รอบด้าน 4 ทิศ (คำนวณไว้ทั้ง grid ตอน init)
+                    corner_count = obstacle_degree[i]
                     if corner_count >= 2:
                         score += 5
                     
@@ -376,19 +592,36 @@ class DeadlockResolver:
             return best_spot
         
         # 4. หาแค่ที่ว่างที่ใกล้ที่สุด
-        for dr, dc in [(-1,0), (1,0), (0,-1), (0,1), (-1,-1), (-1,1), (1,-1), (1,1)]:
-            nxt = (robot["pos"][0] + dr, robot["pos"][1] + dc)
-            if self.is_safe_cell(nxt) and nxt not in reserved:
-                if not any(other["pos"] == nxt for other in self.robots if other["id"] != robot["id"]):
+        for nxt in cells:
+            if nxt is not None and nxt not in reserved:
+                if self._other_robot_at(nxt, robot) is None:
                     return nxt
         
         return None
 
+    def _active_dropoff_index(self, radius):
+        """
+        (bitmap ของช่องที่ห่าง dropoff ที่กำลังใช้งาน <= radius, รายการ dropoffs)
+        สร้างใหม่เมื่อ state ของ robot เปลี่ยน
+        """
+        key = (self.robots.state_version, radius)
+        if self._dropoff_index_key != key:
+            dropoffs = [self.packages[rb["package"]]["dropoff"] for rb in self._carriers()]
+            near = CellBitmap(self._rows, self._cols)
+            for r, c in set(dropoffs):
+                for dr in range(-radius, radius + 1):
+                    span = radius - abs(dr)
+                    for dc in range(-span, span + 1):
+                        near.add((r + dr, c + dc))
+            self._dropoff_index = (near, dropoffs)
+            self._dropoff_index_key = key
+        return self._dropoff_index
+
     def is_near_active_dropoff(self, robot, radius=3):
         """ตรวจสอบว่า robot อยู่ใกล้จุด dropoff ที่กำลังใช้งานหรือไม่"""
-        for rb in self.robots:
-            if rb["state"] == "TO_DROPOFF" and rb["package"] is not None:
-                dropoff = self.packages[rb["package"]]["dropoff"]
-                if GridUtils.manhattan(robot["pos"], dropoff) <= radius:
-                    return True
-        return False
+        near, dropoffs = self._active_dropoff_index(radius)
+        r, c = robot["pos"]
+        if 0 <= r < near.rows and 0 <= c < near.cols:
+            return near.bits[(r + 1) * near.stride + c + 1] == 1
+        # นอก grid (ไม่มีใน bitmap): เทียบระยะกับทุก dropoff ตรงๆ
+        return any(abs(pr - r) + abs(pc - c) <= radius for pr, pc in dropoffs)
@@ -3,8 +3,15 @@ Display Manager Module
 จัดการการแสดงผลและ Activity Log สำหรับ Smart Logistics Simulation
 """
 
+import re
+import shutil
+import sys
 import time
-from collections import deque
+from collections import Counter, deque
+from itertools import islice
+
+import numpy as np
+
 from core.settings import settings
 from utils.grid_utils import GridUtils
 
@@ -12,8 +19,10 @@ from utils.grid_utils import GridUtils
 class DisplayManager:
     """จัดการการแสดงผลและ Activity Log"""
     
-    def __init__(self, max_activities=8):
+    def __init__(self, max_activities=8, visible=True):
         self.activities = deque(maxlen=max_activities)
+        # False = ไม่มีการ render (headless) จึงไม่ต้องเก็บ activity log
+        self.visible = visible
         self.start_time = time.time()
         self.total_moves = 0
         self.total_pickups = 0
@@ -22,12 +31,20 @@ class DisplayManager:
         self.yield_count = 0
     
     def add_activity(self, message):
+        if not self.visible:
+            return
         timestamp = time.strftime('%H:%M:%S')
         self.activities.append(f"[{timestamp}] {message}")
     
     def get_activities(self):
         return list(self.activities)
     
+    def get_recent(self, n=6):
+        """activity ล่าสุด n รายการ (เก่า -> ใหม่) โดยไม่ copy ทั้ง deque"""
+        recent = list(islice(reversed(self.activities), n))
+        recent.reverse()
+        return recent
+    
     def record_move(self):
         self.total_moves += 1
     
@@ -72,147 +89,209 @@ class ANSIColors:
     BG_HOME = '\033[45m'    # Magenta BG (กลับบ้าน)
 
 
+# ANSI escape sequence (ไม่มีความกว้างบนจอ)
+_ANSI_ESCAPE = re.compile(r"\033\[[0-9;]*[A-Za-z]")
+
+
 class SimulationRenderer:
     """จัดการการแสดงผล Grid และ Statistics"""
+
+    # วาดใหม่ทั้งจอทุกกี่ frame (กันจอเพี้ยนจาก output อื่นที่ print แทรกระหว่าง frame)
+    FULL_REDRAW_INTERVAL = 100
+    # เผื่อความกว้างของ emoji (กว้าง 2 ช่องบนจอ) เมื่อเทียบความยาวบรรทัดกับความกว้าง terminal
+    WIDTH_MARGIN = 4
     
-    def __init__(self, display_manager: DisplayManager):
+    def __init__(self, display_manager: DisplayManager, obstacle_grid=None, corridor_map=None):
         self.display = display_manager
         self.C = ANSIColors
+        self.corridor_map = corridor_map
+
+        # frame ก่อนหน้าสำหรับเขียนเฉพาะส่วนที่เปลี่ยน (ใช้เมื่อ stdout เป็น terminal เท่านั้น)
+        self.diff_enabled = sys.stdout.isatty()
+        self._prev_lines = None
+        self._prev_grid = None
+        self._prev_grid_top = None
+        self._prev_size = None
+        self._frames_since_full = 0
+        self._cell_widths = {}
+
+        # ข้อความที่ไม่เปลี่ยนระหว่างรัน สร้างครั้งเดียว
+        C = self.C
+        self._header_lines = (
+            f"{C.HEADER}{C.BOLD}╔{'═'*100}╗{C.ENDC}",
+            f"{C.HEADER}{C.BOLD}║{'🤖 SMART LOGISTICS SIMULATION 🤖':^100}║{C.ENDC}",
+            f"{C.HEADER}{C.BOLD}╚{'═'*100}╝{C.ENDC}",
+        )
+        self._hline = "─" * 100
+        self._pickup_cell = f"{C.GREEN}{C.BOLD} P {C.ENDC}"
+        self._dropoff_cell = f"{C.YELLOW}{C.BOLD} D {C.ENDC}"
+        # สีพื้นของ robot ตาม state (state อื่น = IDLE)
+        self._robot_styles = {
+            "TO_PICKUP": C.BG_PICKUP,
+            "TO_DROPOFF": C.BG_DROPOFF,
+            "EVACUATING": C.BG_EVAC,
+            "HOME": C.BG_HOME,
+        }
+        # (ชื่อ, state) -> ข้อความของช่อง robot
+        self._robot_cells = {}
+        self._legend_line = (
+            f"{C.BOLD}📋 LEGEND:{C.ENDC} "
+            f"{C.BG_IDLE}{C.WHITE} IDLE {C.ENDC} "
+            f"{C.BG_PICKUP}{C.WHITE} TO_PICKUP {C.ENDC} "
+            f"{C.BG_DROPOFF}{C.WHITE} DELIVERING {C.ENDC} "
+            f"{C.BG_HOME}{C.WHITE} HOME {C.ENDC} "
+            f"{C.BG_EVAC}{C.WHITE} EVAC/YIELD {C.ENDC} "
+            f"{C.GREEN}{C.BOLD}P{C.ENDC}=Pickup "
+            f"{C.YELLOW}{C.BOLD}D{C.ENDC}=Dropoff"
+        )
+        self._robot_table_header = (
+            f"   {C.DIM}{'NAME':<6} {'STATE':<12} {'PACKAGE':<8} {'POSITION':<10} {'WAIT':<6} {'MODE':<10} {'PATH LEN'}{C.ENDC}",
+            f"   {'─'*70}",
+        )
+        # (rows, cols) -> (หัวคอลัมน์, label ของแต่ละแถว) และ grid พื้นหลังเมื่อไม่มี obstacle_grid
+        self._grid_labels = {}
+        self._default_base = {}
+
+        # ส่วนที่ไม่เปลี่ยนระหว่างรัน (พื้น + กำแพง) สร้างครั้งเดียว
+        self.base_grid = None
+        if obstacle_grid is not None:
+            rows, cols = obstacle_grid.shape
+            self.base_grid = self._build_base_grid(np.argwhere(obstacle_grid), rows, cols)
+
+    def _build_base_grid(self, walls, rows, cols):
+        """
+        สร้าง grid พื้นหลัง (จุดว่างและกำแพง) สำหรับใช้ซ้ำทุก frame
+        วางกำแพงทั้งหมดด้วย fancy indexing ครั้งเดียว แล้วคืนเป็น list ของแถว (copy ต่อ frame เร็วกว่า object array)
+        """
+        C = self.C
+        base = np.full((rows, cols), f"{C.DIM} · {C.ENDC}", dtype=object)
+        walls = np.asarray(walls if isinstance(walls, np.ndarray) else list(walls), dtype=np.intp).reshape(-1, 2)
+        r, c = walls[:, 0], walls[:, 1]
+        inside = (r >= 0) & (r < rows) & (c >= 0) & (c < cols)
+        base[r[inside], c[inside]] = f"{C.BG_WALL}   {C.ENDC}"
+        return base.tolist()
     
-    def render(self, step, robots, packages, obstacles, corridor_map):
-        """แสดงผล Grid และ Statistics"""
+    def render(self, step, robots, packages, obstacles=None, corridor_map=None):
+        """แสดงผล Grid และ Statistics (สร้างทั้ง frame เป็นบรรทัด แล้วเขียนเฉพาะส่วนที่เปลี่ยน)"""
         C = self.C
+        lines = []
+        add = lines.append
         
-        # --- 1. Clear Screen & Header ---
-        print("\033[H\033[J", end="") 
-        print(f"{C.HEADER}{C.BOLD}╔{'═'*100}╗{C.ENDC}")
-        print(f"{C.HEADER}{C.BOLD}║{'🤖 SMART LOGISTICS SIMULATION 🤖':^100}║{C.ENDC}")
-        print(f"{C.HEADER}{C.BOLD}╚{'═'*100}╝{C.ENDC}")
+        # --- 1. Header ---
+        lines.extend(self._header_lines)
         
         # --- Statistics Bar ---
         elapsed = self.display.get_elapsed_time()
         elapsed_str = f"{int(elapsed//60):02d}:{int(elapsed%60):02d}"
-        delivered_count = sum(1 for p in packages.values() if p["status"] == "DELIVERED")
+        # แยกชื่อ package ตามสถานะในรอบเดียว (ใช้ทั้งแถบสถิติและ PACKAGE STATUS)
+        waiting, picked, delivered = [], [], []
+        by_status = {"WAITING": waiting, "PICKED": picked, "DELIVERED": delivered}
+        for p in packages.values():
+            names = by_status.get(p["status"])
+            if names is not None:
+                names.append(p["name"])
+        delivered_count = len(delivered)
         total_pkgs = len(packages)
         
-        print(f" {C.BOLD}Step:{C.ENDC} {C.CYAN}{step:<5}{C.ENDC} | "
+        add(f" {C.BOLD}Step:{C.ENDC} {C.CYAN}{step:<5}{C.ENDC} | "
               f"{C.BOLD}Time:{C.ENDC} {elapsed_str} | "
               f"{C.BOLD}Moves:{C.ENDC} {self.display.total_moves} | "
               f"{C.BOLD}Pickups:{C.ENDC} {C.GREEN}{self.display.total_pickups}{C.ENDC} | "
               f"{C.BOLD}Dropoffs:{C.ENDC} {C.YELLOW}{self.display.total_dropoffs}{C.ENDC} | "
               f"{C.BOLD}Deadlocks:{C.ENDC} {C.RED}{self.display.deadlock_count}{C.ENDC}")
-        print("─" * 100)
+        add(self._hline)
 
         # --- 2. Prepare Grid Data ---
-        grid_display = [[f"{C.DIM} · {C.ENDC}" for _ in range(settings.COLS)] for _ in range(settings.ROWS)]
-
-        # Walls (Racks)
-        for r, c in obstacles:
-            if GridUtils.in_bounds(r, c):
-                grid_display[r][c] = f"{C.BG_WALL}   {C.ENDC}"
+        # Walls (Racks) - ใช้ grid ที่สร้างไว้ตอน init ถ้าไม่ได้ส่ง obstacles มา
+        rows, cols = settings.ROWS, settings.COLS
+        base = self.base_grid
+        if obstacles is not None:
+            base = self._build_base_grid(obstacles, rows, cols)
+        elif base is None:
+            base = self._default_base.get((rows, cols))
+            if base is None:
+                base = self._default_base[(rows, cols)] = self._build_base_grid((), rows, cols)
+        grid_display = [row.copy() for row in base]
 
         # Packages (Pickup/Dropoff)
         for pkg in packages.values():
             if pkg["status"] == "WAITING":
                 r, c = pkg["pickup"]
                 if GridUtils.in_bounds(r, c):
-                    grid_display[r][c] = f"{C.GREEN}{C.BOLD} P {C.ENDC}"
+                    grid_display[r][c] = self._pickup_cell
             
             if pkg["status"] in ["WAITING", "PICKED"]:
                 r, c = pkg["dropoff"]
                 if GridUtils.in_bounds(r, c):
-                    grid_display[r][c] = f"{C.YELLOW}{C.BOLD} D {C.ENDC}"
+                    grid_display[r][c] = self._dropoff_cell
 
         # Robots
+        robot_cells = self._robot_cells
         for rb in robots:
             r, c = rb["pos"]
             if GridUtils.in_bounds(r, c):
-                short_name = rb["name"].replace("R", "")
-                display_text = f"{short_name:^3}"
-                
-                # เลือกสีตามสถานะ (State Machine Colors)
-                state = rb['state']
-                if state == "TO_PICKUP":
-                    style = C.BG_PICKUP
-                elif state == "TO_DROPOFF":
-                    style = C.BG_DROPOFF
-                elif state == "EVACUATING":
-                    style = C.BG_EVAC
-                elif state == "HOME":
-                    style = C.BG_HOME
-                else:  # IDLE
-                    style = C.BG_IDLE
-                
-                grid_display[r][c] = f"{style}{C.BOLD}{C.WHITE}{display_text}{C.ENDC}"
+                key = (rb["name"], rb["state"])
+                cell = robot_cells.get(key)
+                if cell is None:
+                    short_name = rb["name"].replace("R", "")
+                    # เลือกสีตามสถานะ (State Machine Colors)
+                    style = self._robot_styles.get(rb["state"], C.BG_IDLE)
+                    cell = robot_cells[key] = f"{style}{C.BOLD}{C.WHITE}{short_name:^3}{C.ENDC}"
+                grid_display[r][c] = cell
 
         # --- 3. Print Grid ---
-        indent = "   "
-        col_header = indent + "".join(f"{i:02} " for i in range(settings.COLS))
-        print(f"{C.DIM}{col_header}{C.ENDC}")
+        col_header, row_labels = self._labels_for(rows, cols)
+        add(col_header)
 
-        for i, row in enumerate(grid_display):
-            row_label = f"{C.DIM}{i:02} {C.ENDC}" 
-            print(f"{row_label}" + "".join(row))
+        grid_top = len(lines)
+        for row_label, row in zip(row_labels, grid_display):
+            add(row_label + "".join(row))
 
-        print("─" * 100)
+        add(self._hline)
         
         # --- 4. LEGEND ---
-        print(f"{C.BOLD}📋 LEGEND:{C.ENDC} ", end="")
-        print(f"{C.BG_IDLE}{C.WHITE} IDLE {C.ENDC} ", end="")
-        print(f"{C.BG_PICKUP}{C.WHITE} TO_PICKUP {C.ENDC} ", end="")
-        print(f"{C.BG_DROPOFF}{C.WHITE} DELIVERING {C.ENDC} ", end="")
-        print(f"{C.BG_HOME}{C.WHITE} HOME {C.ENDC} ", end="")
-        print(f"{C.BG_EVAC}{C.WHITE} EVAC/YIELD {C.ENDC} ", end="")
-        print(f"{C.GREEN}{C.BOLD}P{C.ENDC}=Pickup ", end="")
-        print(f"{C.YELLOW}{C.BOLD}D{C.ENDC}=Dropoff")
-        print()
+        add(self._legend_line)
+        add("")
         
         # --- 5. STATISTICS ---
         progress = int((delivered_count / total_pkgs) * 40) if total_pkgs > 0 else 0
         bar = "█" * progress + "░" * (40 - progress)
         pct = (delivered_count / total_pkgs * 100) if total_pkgs > 0 else 0
         
-        print(f"{C.BOLD}📊 STATISTICS:{C.ENDC}")
-        print(f"   Progress: {delivered_count}/{total_pkgs} ({pct:.1f}%) [{C.GREEN}{bar}{C.ENDC}]")
+        add(f"{C.BOLD}📊 STATISTICS:{C.ENDC}")
+        add(f"   Progress: {delivered_count}/{total_pkgs} ({pct:.1f}%) [{C.GREEN}{bar}{C.ENDC}]")
         
-        # Count robot states
-        state_counts = {"IDLE": 0, "TO_PICKUP": 0, "TO_DROPOFF": 0, "HOME": 0, "EVACUATING": 0}
-        for rb in robots:
-            state_counts[rb["state"]] = state_counts.get(rb["state"], 0) + 1
+        # Count robot states (state ที่ไม่มี robot = 0)
+        state_counts = Counter(rb["state"] for rb in robots)
         
-        print(f"   Robots: IDLE={C.BLUE}{state_counts['IDLE']}{C.ENDC} | "
+        add(f"   Robots: IDLE={C.BLUE}{state_counts['IDLE']}{C.ENDC} | "
               f"TO_PICKUP={C.CYAN}{state_counts['TO_PICKUP']}{C.ENDC} | "
               f"DELIVERING={C.GREEN}{state_counts['TO_DROPOFF']}{C.ENDC} | "
               f"HOME={C.MAGENTA}{state_counts['HOME']}{C.ENDC} | "
               f"EVAC={C.RED}{state_counts['EVACUATING']}{C.ENDC}")
-        print()
+        add("")
         
         # --- 6. PACKAGE STATUS ---
-        print(f"{C.BOLD}📦 PACKAGE STATUS:{C.ENDC}")
-        waiting = [p for p in packages.values() if p["status"] == "WAITING"]
-        picked = [p for p in packages.values() if p["status"] == "PICKED"]
-        delivered = [p for p in packages.values() if p["status"] == "DELIVERED"]
+        add(f"{C.BOLD}📦 PACKAGE STATUS:{C.ENDC}")
+        line = f"   {C.YELLOW}WAITING ({len(waiting)}):{C.ENDC} "
+        line += ", ".join(waiting[:8]) if waiting else "-"
+        if len(waiting) > 8: line += f" +{len(waiting)-8} more"
+        add(line)
         
-        print(f"   {C.YELLOW}WAITING ({len(waiting)}):{C.ENDC} ", end="")
-        print(", ".join([p["name"] for p in waiting[:8]]) if waiting else "-", end="")
-        if len(waiting) > 8: print(f" +{len(waiting)-8} more", end="")
-        print()
+        line = f"   {C.CYAN}IN TRANSIT ({len(picked)}):{C.ENDC} "
+        line += ", ".join(picked[:8]) if picked else "-"
+        if len(picked) > 8: line += f" +{len(picked)-8} more"
+        add(line)
         
-        print(f"   {C.CYAN}IN TRANSIT ({len(picked)}):{C.ENDC} ", end="")
-        print(", ".join([p["name"] for p in picked[:8]]) if picked else "-", end="")
-        if len(picked) > 8: print(f" +{len(picked)-8} more", end="")
-        print()
-        
-        print(f"   {C.GREEN}DELIVERED ({len(delivered)}):{C.ENDC} ", end="")
-        print(", ".join([p["name"] for p in delivered[-8:]]) if delivered else "-", end="")
-        if len(delivered) > 8: print(f" (+{len(delivered)-8} earlier)", end="")
-        print()
-        print()
+        line = f"   {C.GREEN}DELIVERED ({len(delivered)}):{C.ENDC} "
+        line += ", ".join(delivered[-8:]) if delivered else "-"
+        if len(delivered) > 8: line += f" (+{len(delivered)-8} earlier)"
+        add(line)
+        add("")
         
         # --- 7. ROBOT STATUS TABLE ---
-        print(f"{C.BOLD}🤖 ROBOT STATUS:{C.ENDC}")
-        print(f"   {C.DIM}{'NAME':<6} {'STATE':<12} {'PACKAGE':<8} {'POSITION':<10} {'WAIT':<6} {'MODE':<10} {'PATH LEN'}{C.ENDC}")
-        print(f"   {'─'*70}")
+        add(f"{C.BOLD}🤖 ROBOT STATUS:{C.ENDC}")
+        lines.extend(self._robot_table_header)
         
         for rb in robots:
             pkg_str = packages[rb["package"]]['name'] if rb["package"] is not None else "-"
@@ -241,18 +320,100 @@ class SimulationRenderer:
             else: 
                 mode_str = f"{C.DIM}{mode_str}{C.ENDC}"
 
-            print(f"   {rb['name']:<6} {state_color}{rb['state']:<12}{C.ENDC} {pkg_str:<8} {pos_str:<10} {wait_str:<6} {mode_str:<10} {path_len}")
-        print()
+            add(f"   {rb['name']:<6} {state_color}{rb['state']:<12}{C.ENDC} {pkg_str:<8} {pos_str:<10} {wait_str:<6} {mode_str:<10} {path_len}")
+        add("")
         
         # --- 8. RECENT ACTIVITY ---
-        print(f"{C.BOLD}📝 RECENT ACTIVITY:{C.ENDC}")
-        activities = self.display.get_activities()
+        add(f"{C.BOLD}📝 RECENT ACTIVITY:{C.ENDC}")
+        activities = self.display.get_recent(6)
         if activities:
-            for act in activities[-6:]:
-                print(f"   {C.DIM}{act}{C.ENDC}")
+            for act in activities:
+                add(f"   {C.DIM}{act}{C.ENDC}")
+        else:
+            add(f"   {C.DIM}No recent activity{C.ENDC}")
+        add(self._hline)
+
+        self._write_frame(lines, grid_top, grid_display)
+
+
+    def _labels_for(self, rows, cols):
+        """หัวคอลัมน์และ label ของแต่ละแถวของ grid ขนาด rows x cols (สร้างครั้งเดียวต่อขนาด)"""
+        labels = self._grid_labels.get((rows, cols))
+        if labels is None:
+            C = self.C
+            col_header = "   " + "".join(f"{i:02} " for i in range(cols))
+            labels = self._grid_labels[(rows, cols)] = (
+                f"{C.DIM}{col_header}{C.ENDC}",
+                [f"{C.DIM}{i:02} {C.ENDC}" for i in range(rows)],
+            )
+        return labels
+
+    def _write_frame(self, lines, grid_top, grid):
+        """
+        เขียน frame ลง stdout ครั้งเดียว
+        frame แรก / terminal เปลี่ยนขนาด / frame ไม่พอดีจอ: ล้างจอแล้ววาดใหม่ทั้งหมด
+        นอกนั้นเขียนเฉพาะบรรทัดที่เปลี่ยน (แถวของ grid เขียนเฉพาะช่องที่เปลี่ยน) ด้วย cursor addressing
+        """
+        size = shutil.get_terminal_size() if self.diff_enabled else None
+        prev = self._prev_lines
+        full = (
+            prev is None
+            or size is None
+            or size != self._prev_size
+            or grid_top != self._prev_grid_top
+            or len(lines) >= size.lines
+            or self._frames_since_full >= self.FULL_REDRAW_INTERVAL
+            or max(len(_ANSI_ESCAPE.sub("", line)) for line in lines) + self.WIDTH_MARGIN > size.columns
+        )
+        if full:
+            text = "\033[H\033[J" + "".join(line + "\n" for line in lines)
+            self._frames_since_full = 0
         else:
-            print(f"   {C.DIM}No recent activity{C.ENDC}")
-        print("─" * 100)
+            prev_grid = self._prev_grid
+            parts = []
+            for i, line in enumerate(lines):
+                if i < len(prev) and prev[i] == line:
+                    continue
+                r = i - grid_top
+                updates = None
+                if 0 <= r < len(grid) and r < len(prev_grid) and len(grid[r]) == len(prev_grid[r]):
+                    updates = self._row_cell_updates(i + 1, len(f"{r:02} ") + 1, grid[r], prev_grid[r])
+                if updates is None:
+                    parts.append(f"\033[{i + 1};1H{line}\033[K")
+                else:
+                    parts.extend(updates)
+            # ล้างส่วนที่เหลือใต้ frame (frame สั้นลง หรือมี output อื่นแทรก) แล้ววาง cursor ไว้ท้าย frame
+            parts.append(f"\033[{len(lines) + 1};1H\033[J")
+            text = "".join(parts)
+            self._frames_since_full += 1
+
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        self._prev_lines = lines
+        self._prev_grid = grid
+        self._prev_grid_top = grid_top
+        self._prev_size = size
+
+    def _row_cell_updates(self, line_no, col, row, prev_row):
+        """
+        escape sequences ที่เขียนเฉพาะช่องที่เปลี่ยนของแถว grid (col = คอลัมน์บนจอของช่องแรก)
+        คืน None ถ้าช่องที่เปลี่ยนกว้างไม่เท่าเดิม (ช่องถัดไปเลื่อนตำแหน่ง ต้องเขียนทั้งบรรทัด)
+        """
+        widths = self._cell_widths
+        parts = []
+        for cell, old in zip(row, prev_row):
+            width = widths.get(cell)
+            if width is None:
+                width = widths[cell] = len(_ANSI_ESCAPE.sub("", cell))
+            if cell != old:
+                old_width = widths.get(old)
+                if old_width is None:
+                    old_width = widths[old] = len(_ANSI_ESCAPE.sub("", old))
+                if old_width != width:
+                    return None
+                parts.append(f"\033[{line_no};{col}H{cell}")
+            col += width
+        return parts
 
     def render_final_statistics(self, total_steps, robots, packages):
         """แสดงสถิติสรุปเมื่อจบ simulation"""
@@ -262,35 +423,40 @@ class SimulationRenderer:
         delivered = sum(1 for p in packages.values() if p["status"] == "DELIVERED")
         total_turns = sum(rb['total_turns'] for rb in robots)
         
-        print()
-        print(f"{C.GREEN}{C.BOLD}╔{'═'*60}╗{C.ENDC}")
-        print(f"{C.GREEN}{C.BOLD}║{'🎉 SIMULATION COMPLETE 🎉':^60}║{C.ENDC}")
-        print(f"{C.GREEN}{C.BOLD}╚{'═'*60}╝{C.ENDC}")
-        print()
-        print(f"{C.BOLD}📊 FINAL STATISTICS:{C.ENDC}")
-        print(f"   ┌{'─'*40}┐")
-        print(f"   │ {'Total Steps:':<25} {C.CYAN}{total_steps:>12}{C.ENDC} │")
-        print(f"   │ {'Elapsed Time:':<25} {C.CYAN}{int(elapsed//60):02d}:{int(elapsed%60):02d}{' '*8}{C.ENDC} │")
-        print(f"   │ {'Packages Delivered:':<25} {C.GREEN}{delivered:>12}{C.ENDC} │")
-        print(f"   │ {'Total Moves:':<25} {C.YELLOW}{self.display.total_moves:>12}{C.ENDC} │")
-        print(f"   │ {'Total Pickups:':<25} {C.GREEN}{self.display.total_pickups:>12}{C.ENDC} │")
-        print(f"   │ {'Total Dropoffs:':<25} {C.GREEN}{self.display.total_dropoffs:>12}{C.ENDC} │")
-        print(f"   │ {'Total Turns:':<25} {C.MAGENTA}{total_turns:>12}{C.ENDC} │")
-        print(f"   │ {'Deadlocks Resolved:':<25} {C.RED}{self.display.deadlock_count:>12}{C.ENDC} │")
-        print(f"   │ {'Yield Events:':<25} {C.YELLOW}{self.display.yield_count:>12}{C.ENDC} │")
-        print(f"   └{'─'*40}┘")
-        print()
+        lines = []
+        add = lines.append
+        add("")
+        add(f"{C.GREEN}{C.BOLD}╔{'═'*60}╗{C.ENDC}")
+        add(f"{C.GREEN}{C.BOLD}║{'🎉 SIMULATION COMPLETE 🎉':^60}║{C.ENDC}")
+        add(f"{C.GREEN}{C.BOLD}╚{'═'*60}╝{C.ENDC}")
+        add("")
+        add(f"{C.BOLD}📊 FINAL STATISTICS:{C.ENDC}")
+        add(f"   ┌{'─'*40}┐")
+        add(f"   │ {'Total Steps:':<25} {C.CYAN}{total_steps:>12}{C.ENDC} │")
+        add(f"   │ {'Elapsed Time:':<25} {C.CYAN}{int(elapsed//60):02d}:{int(elapsed%60):02d}{' '*8}{C.ENDC} │")
+        add(f"   │ {'Packages Delivered:':<25} {C.GREEN}{delivered:>12}{C.ENDC} │")
+        add(f"   │ {'Total Moves:':<25} {C.YELLOW}{self.display.total_moves:>12}{C.ENDC} │")
+        add(f"   │ {'Total Pickups:':<25} {C.GREEN}{self.display.total_pickups:>12}{C.ENDC} │")
+        add(f"   │ {'Total Dropoffs:':<25} {C.GREEN}{self.display.total_dropoffs:>12}{C.ENDC} │")
+        add(f"   │ {'Total Turns:':<25} {C.MAGENTA}{total_turns:>12}{C.ENDC} │")
+        add(f"   │ {'Deadlocks Resolved:':<25} {C.RED}{self.display.deadlock_count:>12}{C.ENDC} │")
+        add(f"   │ {'Yield Events:':<25} {C.YELLOW}{self.display.yield_count:>12}{C.ENDC} │")
+        add(f"   └{'─'*40}┘")
+        add("")
         
         # Efficiency metrics
         if total_steps > 0:
             efficiency = (delivered / total_steps) * 100
             moves_per_pkg = self.display.total_moves / delivered if delivered > 0 else 0
-            print(f"{C.BOLD}📈 EFFICIENCY METRICS:{C.ENDC}")
-            print(f"   Delivery Rate: {C.GREEN}{efficiency:.2f}%{C.ENDC} per step")
-            print(f"   Moves per Package: {C.CYAN}{moves_per_pkg:.1f}{C.ENDC}")
-            print(f"   Avg Steps per Delivery: {C.CYAN}{total_steps/delivered:.1f}{C.ENDC}" if delivered > 0 else "")
+            add(f"{C.BOLD}📈 EFFICIENCY METRICS:{C.ENDC}")
+            add(f"   Delivery Rate: {C.GREEN}{efficiency:.2f}%{C.ENDC} per step")
+            add(f"   Moves per Package: {C.CYAN}{moves_per_pkg:.1f}{C.ENDC}")
+            add(f"   Avg Steps per Delivery: {C.CYAN}{total_steps/delivered:.1f}{C.ENDC}" if delivered > 0 else "")
         
-        print()
-        print(f"{C.DIM}{'─'*60}{C.ENDC}")
-        print(f"{C.BOLD}All robots returned home. Simulation ended successfully!{C.ENDC}")
-        print()
+        add("")
+        add(f"{C.DIM}{'─'*60}{C.ENDC}")
+        add(f"{C.BOLD}All robots returned home. Simulation ended successfully!{C.ENDC}")
+        add("")
+
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
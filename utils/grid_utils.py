@@ -1,5 +1,39 @@
+import numpy as np
+
 from core.settings import settings
 
+# ทิศเพื่อนบ้าน (row, col) ลำดับคงที่ใช้ร่วมกันทุก module
+NEIGHBORS4 = ((-1, 0), (1, 0), (0, -1), (0, 1))
+NEIGHBORS8 = NEIGHBORS4 + ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+
+def ordered_neighbors(preferred, last_dir):
+    """NEIGHBORS4 โดยให้ทิศ preferred มาก่อน ตามด้วย last_dir (ที่เหลือคงลำดับเดิม)"""
+    return tuple(sorted(NEIGHBORS4, key=lambda d: 0 if d == preferred else (1 if d == last_dir else 2)))
+
+
+# (preferred, last_dir) -> ลำดับทิศสำหรับ A* (ใช้ preferred = (0, 0) เมื่อไม่มีทิศที่ต้องการ)
+NEIGHBORS4_BY_PREFERENCE = {
+    (preferred, last_dir): ordered_neighbors(preferred, last_dir)
+    for preferred in NEIGHBORS4 + ((0, 0),)
+    for last_dir in NEIGHBORS4 + ((0, 0),)
+}
+
+# ฟังก์ชันที่ A* เรียกทุก expansion เป็นฟังก์ชันระดับ module (import ไป bind เป็น local ได้)
+def in_bounds(r, c):
+    return 0 <= r < settings.ROWS and 0 <= c < settings.COLS
+
+
+def manhattan(a, b):
+    return abs(a[0]-b[0]) + abs(a[1]-b[1])
+
+
+def is_turn(old_dir, new_dir):
+    if old_dir == (0, 0):
+        return False
+    return old_dir != new_dir
+
+
 class GridUtils:
     @staticmethod
     def parse_pos(pos_input):
@@ -19,40 +53,43 @@ class GridUtils:
         """แปลง (row, col) -> '[row, col]'"""
         return f"[{pos[0]}, {pos[1]}]"
 
-    @staticmethod
-    def in_bounds(r, c):
-        return 0 <= r < settings.ROWS and 0 <= c < settings.COLS
+    in_bounds = staticmethod(in_bounds)
+    manhattan = staticmethod(manhattan)
 
     @staticmethod
-    def manhattan(a, b):
-        return abs(a[0]-b[0]) + abs(a[1]-b[1])
+    def manhattan_many(positions, pos):
+        """ระยะ Manhattan จากทุกแถวของ positions (N, 2) ไปยัง pos (vectorized)"""
+        positions = np.asarray(positions, dtype=np.int32).reshape(-1, 2)
+        return np.abs(positions[:, 0] - pos[0]) + np.abs(positions[:, 1] - pos[1])
 
     @staticmethod
-    def create_wall(wall_def):
+    def wall_cells(wall_def):
         """
-        สร้าง set ของตำแหน่ง Wall
+        คืนตำแหน่ง Wall ทั้งหมดเป็น ndarray ขนาด (K, 2)
         รับค่า format: [r1, c1, r2, c2] เท่านั้น
         """
         if len(wall_def) == 4:
             r1, c1, r2, c2 = map(int, wall_def)
             # หา min/max เผื่อ user ใส่สลับตำแหน่ง
-            r_start, r_end = min(r1, r2), max(r1, r2)
-            c_start, c_end = min(c1, c2), max(c1, c2)
-            
-            wall_set = set()
-            for r in range(r_start, r_end + 1):
-                for c in range(c_start, c_end + 1):
-                    wall_set.add((r, c))
-            return wall_set
-            
+            rr, cc = np.meshgrid(
+                np.arange(min(r1, r2), max(r1, r2) + 1),
+                np.arange(min(c1, c2), max(c1, c2) + 1),
+                indexing='ij'
+            )
+            return np.column_stack([rr.ravel(), cc.ravel()])
+
         raise ValueError(f"Invalid wall format: {wall_def}. Expected [r1, c1, r2, c2]")
 
+    @staticmethod
+    def create_wall(wall_def):
+        """
+        สร้าง set ของตำแหน่ง Wall
+        รับค่า format: [r1, c1, r2, c2] เท่านั้น
+        """
+        return set(map(tuple, GridUtils.wall_cells(wall_def).tolist()))
+
     @staticmethod
     def get_direction(from_pos, to_pos):
         return (to_pos[0] - from_pos[0], to_pos[1] - from_pos[1])
 
-    @staticmethod
-    def is_turn(old_dir, new_dir):
-        if old_dir == (0, 0):
-            return False
-        return old_dir != new_dir
\ No newline at end of file
+    is_turn = staticmethod(is_turn)
\ No newline at end of file
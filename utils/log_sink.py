@@ -0,0 +1,82 @@
+"""
+Robot Log Sink Module
+loguru sink ตัวเดียวที่แยกข้อความไปยังไฟล์ log ของ robot แต่ละตัว
+"""
+
+import os
+import time
+
+# fdatasync ไม่มีในบาง OS (เช่น macOS/Windows) ใช้ fsync แทน
+_datasync = getattr(os, "fdatasync", os.fsync)
+
+
+class RobotLogSink:
+    """
+    Dispatcher sink สำหรับ loguru
+    เลือกไฟล์ปลายทางจาก record["extra"]["robot"] และเปิดไฟล์ค้างไว้ตลอดการรัน
+    ใช้คู่กับ logger.add(sink, enqueue=True) เพื่อให้การเขียนไฟล์อยู่ใน background thread
+
+    ข้อความจะถูกพักไว้ในหน่วยความจำแล้วเขียนรวมทีเดียว เมื่อขนาดเกิน buffer_size
+    หรือครบ flush_interval วินาที และจะ fdatasync ทุก sync_every ครั้งที่ flush
+    """
+
+    def __init__(self, log_dir, robot_names, buffer_size=128 * 1024,
+                 flush_interval=1.0, sync_every=10):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.sync_every = sync_every
+
+        self.files = {}
+        self.pending = {}
+        for name in robot_names:
+            path = os.path.join(log_dir, f"{name}.log")
+            self.files[name] = open(path, "a", encoding="utf-8", buffering=buffer_size)
+            self.pending[name] = []
+
+        self._pending_bytes = 0
+        self._flush_count = 0
+        self._last_flush = time.monotonic()
+
+    def __call__(self, message):
+        lines = self.pending.get(message.record["extra"].get("robot"))
+        if lines is None:
+            return
+        lines.append(message)
+        self._pending_bytes += len(message)
+
+        if (self._pending_bytes >= self.buffer_size
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    @staticmethod
+    def accepts(record):
+        """filter สำหรับ logger.add - รับเฉพาะข้อความที่ bind robot ไว้"""
+        return "robot" in record["extra"]
+
+    def flush(self, sync=False):
+        """เขียนข้อความที่พักไว้ลงไฟล์ (หนึ่ง write ต่อ robot)"""
+        self._flush_count += 1
+        sync = sync or self._flush_count % self.sync_every == 0
+
+        for name, lines in self.pending.items():
+            if not lines:
+                continue
+            handle = self.files[name]
+            handle.write("".join(lines))
+            lines.clear()
+            handle.flush()
+            if sync:
+                _datasync(handle.fileno())
+
+        self._pending_bytes = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """flush + fdatasync แล้วปิดไฟล์ (เรียกซ้ำได้)"""
+        if not self.files:
+            return
+        self.flush(sync=True)
+        for handle in self.files.values():
+            handle.close()
+        self.files.clear()
+        self.pending.clear()
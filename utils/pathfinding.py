@@ -3,21 +3,39 @@ Pathfinding Module
 จัดการการหาเส้นทาง Time-Space A* สำหรับ Smart Logistics Simulation
 """
 
+import numpy as np
+
 from core.settings import settings
 from utils.grid_utils import GridUtils
+from utils.robot_table import STATES
 from utils.time_space_astar import TimeSpaceAStar, ReservationTable
 
 
+# ค่า priority ตาม state code ของ RobotTable (ช่องสุดท้ายสำหรับ state ที่ไม่รู้จัก = -1)
+STATE_PRIORITY = {
+    "TO_DROPOFF": 3000,
+    "TO_PICKUP": 2000,
+    "EVACUATING": 1500,
+    "HOME": 1000,
+    "IDLE": 0
+}
+_STATE_PRIORITY_BY_CODE = np.array(
+    [STATE_PRIORITY.get(name, 0) for name in STATES] + [0], dtype=np.int64
+)
+
+
 class PathFinder:
     """จัดการการหาเส้นทางด้วย Time-Space A* Algorithm"""
     
     def __init__(self, obstacles, corridor_map, robots, packages, 
-                 deadlock_model=None, route_analyzer=None, route_cache=None):
+                 deadlock_model=None, route_analyzer=None, route_cache=None,
+                 model_loader=None):
         self.obstacles = obstacles
         self.corridor_map = corridor_map
         self.robots = robots
         self.packages = packages
-        self.deadlock_model = deadlock_model
+        self._deadlock_model = deadlock_model
+        self._model_loader = model_loader
         self.route_analyzer = route_analyzer
         self.route_cache = route_cache
         
@@ -36,6 +54,13 @@ class PathFinder:
         
         # Current simulation step (ต้อง update ทุก step)
         self.current_step = 0
+
+    @property
+    def deadlock_model(self):
+        """โหลด deadlock model ครั้งแรกที่ถูกใช้งาน (ถ้ามี model_loader)"""
+        if self._deadlock_model is None and self._model_loader is not None:
+            self._deadlock_model = self._model_loader()
+        return self._deadlock_model
     
     def update_step(self, step):
         """อัพเดท current step และล้าง old reservations"""
@@ -94,54 +119,20 @@ class PathFinder:
         }])
 
     def is_narrow_passage(self, pos):
-        """ตรวจสอบว่าตำแหน่งนี้เป็นทางแคบหรือไม่"""
-        r, c = pos
-        open_count = 0
-        
-        for dr, dc in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            nr, nc = r + dr, c + dc
-            if GridUtils.in_bounds(nr, nc) and (nr, nc) not in self.obstacles:
-                open_count += 1
-        
-        return open_count <= 2
+        """ตรวจสอบว่าตำแหน่งนี้เป็นทางแคบหรือไม่ (ใช้ตารางที่ ts_astar คำนวณไว้)"""
+        return self.ts_astar.is_narrow_passage(pos)
 
     def can_enter_dropoff(self, robot, pos):
-        """ตรวจสอบสิทธิ์การเข้าจุด Dropoff"""
-        for pid, pkg in self.packages.items():
-            if pkg["dropoff"] == pos:
-                if robot["package"] == pid and robot["state"] == "TO_DROPOFF":
-                    return True
-                if pkg["status"] == "DELIVERED":
-                    return True
-                if pkg["status"] == "WAITING":
-                    return True
-                return False
-        return True
+        """ตรวจสอบสิทธิ์การเข้าจุด Dropoff (ใช้ index ของ package ใน ts_astar)"""
+        return self.ts_astar.can_enter_dropoff(robot, pos)
 
     def can_enter_pickup(self, robot, pos):
-        """ตรวจสอบสิทธิ์การเข้าจุด Pickup"""
-        if robot["package"] is not None:
-            my_pkg = self.packages[robot["package"]]
-            if my_pkg["pickup"] == pos and robot["state"] == "TO_PICKUP":
-                return True
-
-        for pid, pkg in self.packages.items():
-            if pkg["pickup"] == pos:
-                if pkg["status"] == "WAITING":
-                    return False
-        
-        return True
+        """ตรวจสอบสิทธิ์การเข้าจุด Pickup (ใช้ index ของ package ใน ts_astar)"""
+        return self.ts_astar.can_enter_pickup(robot, pos)
 
     def get_robot_priority(self, robot):
         """คำนวณ priority ของ robot"""
-        state_priority = {
-            "TO_DROPOFF": 3000,
-            "TO_PICKUP": 2000,
-            "EVACUATING": 1500,
-            "HOME": 1000,
-            "IDLE": 0
-        }
-        base = state_priority.get(robot["state"], 0)
+        base = STATE_PRIORITY.get(robot["state"], 0)
         wait_bonus = robot.get("wait_count", 0) * 100
         dist_bonus = 0
         if robot["path"]:
@@ -149,6 +140,24 @@ class PathFinder:
         momentum_bonus = robot.get("momentum", 0) * 50
         return base + wait_bonus + dist_bonus + momentum_bonus
 
+    def compute_priority_vector(self):
+        """priority ของ robot ทุกตัว (เหมือน get_robot_priority) จาก arrays ของ RobotTable"""
+        table = self.robots
+        path_len = np.fromiter((len(rb["path"]) for rb in table), dtype=np.int64, count=len(table))
+        dist_bonus = np.where(path_len > 0, 500 - np.minimum(path_len, 500), 0)
+        return (
+            _STATE_PRIORITY_BY_CODE[table.state]
+            + table.wait_count.astype(np.int64) * 100
+            + dist_bonus
+            + table.momentum.astype(np.int64) * 50
+        )
+
+    def get_priority_order(self):
+        """robots เรียงตาม priority จากมากไปน้อย (stable เหมือน sorted(..., reverse=True))"""
+        order = np.argsort(-self.compute_priority_vector(), kind="stable")
+        robots = self.robots
+        return [robots[i] for i in order.tolist()]
+
     def smart_astar(self, start, goal, blocked, robot):
         """Smart A* Algorithm with Toggle
         
@@ -177,26 +186,32 @@ class PathFinder:
         return path
 
     def has_clear_line(self, start, end, robot):
-        """ตรวจสอบว่ามีเส้นทางตรงที่ชัดเจนหรือไม่"""
+        """ตรวจสอบว่ามีเส้นทางตรงที่ชัดเจนหรือไม่ (ไล่ช่องระหว่างทางด้วย Bresenham แบบจำนวนเต็ม)"""
         r0, c0 = start
         r1, c1 = end
         
         if start == end:
             return True
         
-        if abs(r1 - r0) + abs(c1 - c0) > 5:
+        dr, dc = abs(r1 - r0), abs(c1 - c0)
+        if dr + dc > 5:
             return False
         
-        steps = max(abs(r1 - r0), abs(c1 - c0))
-        
-        if steps == 0:
-            return True
-        
-        for step in range(1, steps):
-            t = step / steps
-            r = int(r0 + (r1 - r0) * t)
-            c = int(c0 + (c1 - c0) * t)
+        step_r = 1 if r1 > r0 else -1
+        step_c = 1 if c1 > c0 else -1
+        err = dc - dr
+        r, c = r0, c0
+        while True:
+            e2 = 2 * err
+            if e2 >= -dr:
+                err -= dr
+                c += step_c
+            if e2 <= dc:
+                err += dc
+                r += step_r
             pos = (r, c)
+            if pos == end:
+                return True
             
             if not GridUtils.in_bounds(r, c):
                 return False
@@ -206,5 +221,3 @@ class PathFinder:
                 return False
             if not self.can_enter_pickup(robot, pos):
                 return False
-        
-        return True
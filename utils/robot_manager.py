@@ -3,8 +3,62 @@ Robot Manager Module
 จัดการ Robot และ Package assignments สำหรับ Smart Logistics Simulation
 """
 
+from collections import Counter, deque
+
+import numpy as np
+
 from core.settings import settings
-from utils.grid_utils import GridUtils
+from utils.grid_utils import GridUtils, NEIGHBORS4
+from utils.robot_table import STATE_CODES, MODE_CODES
+
+IDLE = STATE_CODES["IDLE"]
+EVACUATING = STATE_CODES["EVACUATING"]
+YIELDING = MODE_CODES["YIELDING"]
+
+
+class PositionWindow:
+    """
+    ประวัติตำแหน่งล่าสุดขนาดคงที่ (maxlen) พร้อมนับจำนวนครั้งของแต่ละตำแหน่ง
+    ทำให้รู้จำนวนตำแหน่งที่ไม่ซ้ำได้ทันทีโดยไม่ต้องไล่ประวัติ
+    """
+
+    __slots__ = ("positions", "counts")
+
+    def __init__(self, maxlen, positions=()):
+        self.positions = deque(maxlen=maxlen)
+        self.counts = Counter()
+        for pos in positions:
+            self.append(pos)
+
+    @property
+    def maxlen(self):
+        return self.positions.maxlen
+
+    def append(self, pos):
+        positions = self.positions
+        if len(positions) == positions.maxlen:
+            oldest = positions[0]
+            remaining = self.counts[oldest] - 1
+            if remaining:
+                self.counts[oldest] = remaining
+            else:
+                del self.counts[oldest]
+        positions.append(pos)
+        self.counts[pos] += 1
+
+    def unique_count(self):
+        """จำนวนตำแหน่งที่ไม่ซ้ำกันในประวัติ"""
+        return len(self.counts)
+
+    def clear(self):
+        self.positions.clear()
+        self.counts.clear()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        return iter(self.positions)
 
 
 class RobotManager:
@@ -16,35 +70,35 @@ class RobotManager:
         self.obstacles = obstacles
         self.corridor_map = corridor_map
         self.pathfinder = pathfinder
+        self._blocked_base = None
+        self._blocked_base_version = None
     
     def get_robot_by_id(self, robot_id):
         """Helper method to find a robot by its ID"""
-        for rb in self.robots:
-            if rb["id"] == robot_id:
-                return rb
-        return None
+        return self.robots.by_id.get(robot_id)
+
+    def _distances_from(self, pos):
+        """ระยะ Manhattan จาก pos ไปยัง robot ทุกตัว (vectorized)"""
+        return GridUtils.manhattan_many(self.robots.pos, pos)
 
     def get_traffic_density(self, pos, robot_id):
         """คำนวณความหนาแน่นของ traffic รอบตำแหน่ง"""
-        density = 0
-        for rb in self.robots:
-            if rb["id"] == robot_id:
-                continue
-            dist = GridUtils.manhattan(pos, rb["pos"])
-            if dist == 0:
-                density += 10
-            elif dist <= 2:
-                density += 5 / dist
-            elif dist <= 4:
-                density += 2 / dist
-        return density
+        dist = self._distances_from(pos)
+        safe = np.maximum(dist, 1).astype(np.float64)
+        weights = np.where(
+            dist == 0, 10.0,
+            np.where(dist <= 2, 5.0 / safe, np.where(dist <= 4, 2.0 / safe, 0.0))
+        )
+        weights[self.robots.ids == robot_id] = 0.0
+        # รวมตามลำดับเดิมเพื่อให้ผลลัพธ์ทศนิยมตรงกับการบวกทีละตัว
+        return sum(weights.tolist())
 
     def is_narrow_passage(self, pos):
         """ตรวจสอบว่าตำแหน่งนี้เป็นทางแคบหรือไม่"""
         r, c = pos
         open_count = 0
         
-        for dr, dc in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+        for dr, dc in NEIGHBORS4:
             nr, nc = r + dr, c + dc
             if GridUtils.in_bounds(nr, nc) and (nr, nc) not in self.obstacles:
                 open_count += 1
@@ -54,6 +108,7 @@ class RobotManager:
     def request_package(self, robot):
         """ขอ package ใหม่สำหรับ robot"""
         candidates = []
+        others_busy = (self.robots.ids != robot["id"]) & (self.robots.package >= 0)
         for pid, pkg in self.packages.items():
             if pkg["status"] == "WAITING" and pkg["assigned_to"] is None:
                 pickup_dist = GridUtils.manhattan(robot["pos"], pkg["pickup"])
@@ -62,12 +117,9 @@ class RobotManager:
                 traffic_cost = self.get_traffic_density(pkg["pickup"], robot["id"])
                 passage_penalty = 2.0 if self.is_narrow_passage(pkg["pickup"]) else 0.0
                 
-                competing_robots = sum(
-                    1 for rb in self.robots 
-                    if rb["id"] != robot["id"] 
-                    and rb["package"] is not None 
-                    and GridUtils.manhattan(rb["pos"], pkg["pickup"]) < pickup_dist
-                )
+                competing_robots = int(np.count_nonzero(
+                    others_busy & (self._distances_from(pkg["pickup"]) < pickup_dist)
+                ))
                 
                 total_cost = (
                     pickup_dist * 1.0 + 
@@ -86,29 +138,25 @@ class RobotManager:
             return best_pid
         return None
 
-    def detect_oscillation(self, robot, window=5):
+    def detect_oscillation(self, robot, window=None):
         """ตรวจจับว่า robot เดินวนซ้ำหรือไม่"""
-        if 'position_history' not in robot:
-            robot['position_history'] = []
-        
-        robot['position_history'].append(robot['pos'])
-        
-        if len(robot['position_history']) > 10:
-            robot['position_history'].pop(0)
+        if window is None:
+            window = settings.OSCILLATION_WINDOW
+
+        history = robot.get('position_history')
+        if not isinstance(history, PositionWindow) or history.maxlen != window:
+            history = PositionWindow(window, history or ())
+            robot['position_history'] = history
         
-        if len(robot['position_history']) >= window:
-            recent = robot['position_history'][-window:]
-            unique_positions = len(set(recent))
-            
-            if unique_positions <= 3:
-                return True
+        history.append(robot['pos'])
         
-        return False
+        # history เก็บแค่ window ตัวท้าย จึงใช้จำนวนตำแหน่งที่นับไว้ได้ทันที
+        return len(history) >= window and history.unique_count() <= 3
 
     def clear_oscillation_history(self, robot):
         """ล้างประวัติการเดิน"""
         if 'position_history' in robot:
-            robot['position_history'] = []
+            robot['position_history'].clear()
 
     def cleanup_orphaned_assignments(self):
         """ล้าง package assignments ที่ไม่มี robot ทำงานอยู่"""
@@ -163,6 +211,8 @@ class RobotManager:
 
     def force_idle_robots_to_work(self):
         """บังคับให้ robot ที่ว่างไปรับงาน"""
+        if not self.robots.state_counts[IDLE]:
+            return
         for rb in self.robots:
             if rb["state"] != "IDLE": continue
             if rb["package"] is not None: continue
@@ -210,6 +260,27 @@ class RobotManager:
                     rb["path"] = self.pathfinder.smart_astar(rb["pos"], pkg["pickup"], blocked, rb)
                     rb["wait_count"] = 0
 
+    def update_mode_timers(self, step, evac_timeout=15, yield_timeout=10):
+        """
+        อัพเดท evac_start_step / yield_start_step ของทุก robot แบบ vectorized
+        คืน (evac_expired, yield_expired) เป็น list ของ bool ตามลำดับ robot
+        """
+        table = self.robots
+        evacuating = table.state == EVACUATING
+        yielding = table.mode == YIELDING
+
+        for active, starts, key in (
+            (evacuating, table.evac_start_step, "evac_start_step"),
+            (yielding, table.yield_start_step, "yield_start_step"),
+        ):
+            started = starts != 0
+            table.assign(key, np.flatnonzero(active & ~started), step)
+            table.assign(key, np.flatnonzero(~active & started), 0)
+
+        evac_expired = evacuating & (step - table.evac_start_step > evac_timeout)
+        yield_expired = yielding & (step - table.yield_start_step > yield_timeout)
+        return evac_expired.tolist(), yield_expired.tolist()
+
     def force_reset_stuck_state(self, robot, current_step):
         """บังคับ reset state ของ robot ที่ติดค้าง"""
         print(f"[FORCE RESET] {robot['name']} stuck in {robot['state']}/{robot['decision_mode']} - Resetting to IDLE")
@@ -221,7 +292,7 @@ class RobotManager:
         robot["yield_to"] = None
         robot["wait_count"] = 0
         robot["failed_paths"].clear()
-        robot["position_history"] = []
+        robot["position_history"].clear()
         robot["evac_start_step"] = 0
         robot["yield_start_step"] = 0
         robot["momentum"] = 0
@@ -234,10 +305,11 @@ class RobotManager:
 
     def get_blocked_for_robot(self, robot, reserved_positions):
         """หาตำแหน่งที่ blocked สำหรับ robot"""
-        blocked = set(self.obstacles)
-        for other in self.robots:
-            if other["id"] != robot["id"]:
-                blocked.add(other["pos"])
+        # obstacles + ตำแหน่ง robot ทุกตัว สร้างใหม่เฉพาะเมื่อมี robot ขยับ
+        if self._blocked_base_version != self.robots.pos_version:
+            self._blocked_base = frozenset(self.obstacles).union(map(tuple, self.robots.pos.tolist()))
+            self._blocked_base_version = self.robots.pos_version
+        blocked = set(self._blocked_base)
         blocked.update(reserved_positions)
         blocked.discard(robot["pos"])
         
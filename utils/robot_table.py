@@ -0,0 +1,174 @@
+"""
+Robot Table Module
+เก็บข้อมูล Robot แบบ Structure-of-Arrays (NumPy) ควบคู่กับ dict เดิม
+"""
+
+import numpy as np
+
+
+STATES = ("IDLE", "HOME", "TO_PICKUP", "TO_DROPOFF", "EVACUATING")
+STATE_CODES = {name: code for code, name in enumerate(STATES)}
+
+MODES = ("NORMAL", "YIELDING", "FORCED", "RETREAT", "IDLE")
+MODE_CODES = {name: code for code, name in enumerate(MODES)}
+
+
+def _encode_state(value):
+    return STATE_CODES.get(value, -1)
+
+
+def _encode_mode(value):
+    return MODE_CODES.get(value, -1)
+
+
+def _encode_optional(value):
+    return -1 if value is None else value
+
+
+# key ใน robot dict -> (ชื่อ array, dtype, จำนวนคอลัมน์, ตัวแปลงค่า)
+LANES = {
+    "id": ("ids", np.int32, 1, None),
+    "pos": ("pos", np.int16, 2, None),
+    "home": ("home", np.int16, 2, None),
+    "state": ("state", np.int8, 1, _encode_state),
+    "decision_mode": ("mode", np.int8, 1, _encode_mode),
+    "package": ("package", np.int32, 1, _encode_optional),
+    "wait_count": ("wait_count", np.int32, 1, None),
+    "momentum": ("momentum", np.int16, 1, None),
+    "stuck_count": ("stuck_count", np.int32, 1, None),
+    "last_dir": ("last_dir", np.int8, 2, None),
+    "evac_start_step": ("evac_start_step", np.int32, 1, None),
+    "yield_start_step": ("yield_start_step", np.int32, 1, None),
+}
+
+
+class RobotRecord(dict):
+    """dict ของ Robot หนึ่งตัว ที่เขียนค่าตัวเลขลง RobotTable ทุกครั้งที่ถูกกำหนด"""
+
+    __slots__ = ("_table", "_idx")
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        lane = LANES.get(key)
+        if lane is not None:
+            self._table._write(self._idx, lane, value)
+
+
+class RobotTable(list):
+    """
+    รายการ Robot (list ของ RobotRecord) พร้อม NumPy arrays แบบขนาน
+    ใช้แทน list เดิมได้ทันที และเปิดให้คำนวณแบบ vectorized ผ่าน attribute
+    เช่น table.pos (N, 2), table.state (N,), table.wait_count (N,)
+    """
+
+    def __init__(self, robots=(), capacity=8):
+        super().__init__()
+        self._capacity = max(1, capacity)
+        self._arrays = {}
+        for name, dtype, width, _ in LANES.values():
+            shape = (self._capacity, width) if width > 1 else (self._capacity,)
+            self._arrays[name] = np.zeros(shape, dtype=dtype)
+        self.by_id = {}
+        # เพิ่มทุกครั้งที่ state/package ของ robot ตัวใดเปลี่ยน (ใช้ invalidate cache)
+        self.state_version = 0
+        # เพิ่มทุกครั้งที่ตำแหน่งของ robot ตัวใดเปลี่ยน
+        self.pos_version = 0
+        # จำนวน robot ในแต่ละ state (index = state code)
+        self.state_counts = [0] * len(STATES)
+        self.occupancy = None
+        self._cells = {}
+        for robot in robots:
+            self.append(robot)
+
+    def __getattr__(self, name):
+        arrays = self.__dict__.get("_arrays")
+        if arrays is not None and name in arrays:
+            return arrays[name][:len(self)]
+        raise AttributeError(name)
+
+    def append(self, robot):
+        """เพิ่ม robot (dict) และคืน RobotRecord ที่ผูกกับ table"""
+        if len(self) == self._capacity:
+            self._grow()
+
+        record = RobotRecord()
+        record._table = self
+        record._idx = len(self)
+        # slot ใหม่ยังไม่มี state (ไม่นับใน state_counts จนกว่าจะถูกกำหนด)
+        self._arrays["state"][record._idx] = -1
+        super().append(record)
+        for key, value in robot.items():
+            record[key] = value
+
+        self.by_id[record.get("id")] = record
+        return record
+
+    def attach_grid(self, rows, cols):
+        """สร้าง occupancy grid (row, col) -> index ของ robot (-1 = ว่าง)"""
+        self.occupancy = np.full((rows, cols), -1, dtype=np.int16)
+        self._cells = {}
+        for record in self:
+            if "pos" in record:
+                self._place(record._idx, record["pos"])
+
+    def index_of(self, robot_id):
+        """คืน index ของ robot ใน arrays หรือ None"""
+        record = self.by_id.get(robot_id)
+        return None if record is None else record._idx
+
+    def at_home(self):
+        """bool mask (N,) ของ robot ที่อยู่ที่ home"""
+        return (self.pos == self.home).all(axis=1)
+
+    def assign(self, key, indices, value):
+        """
+        กำหนดค่า key ของ robot หลายตัวพร้อมกัน (vectorized ลง array)
+        แล้วเขียนกลับเฉพาะ dict ของ index ที่ระบุ เพื่อให้ dict view ยังตรงกัน
+        ใช้กับ lane ตัวเลขธรรมดา (ไม่อัพเดท occupancy / state_version)
+        """
+        name, _, _, encode = LANES[key]
+        self._arrays[name][indices] = value if encode is None else encode(value)
+        for idx in np.asarray(indices).tolist():
+            dict.__setitem__(self[idx], key, value)
+
+    def _grow(self):
+        self._capacity *= 2
+        for name, arr in self._arrays.items():
+            grown = np.zeros((self._capacity,) + arr.shape[1:], dtype=arr.dtype)
+            grown[:len(arr)] = arr
+            self._arrays[name] = grown
+
+    def _write(self, idx, lane, value):
+        name, _, _, encode = lane
+        encoded = value if encode is None else encode(value)
+        if name == "state":
+            self._count_state(idx, encoded)
+        self._arrays[name][idx] = encoded
+        if name == "pos":
+            self.pos_version += 1
+            if self.occupancy is not None:
+                self._place(idx, value)
+        elif name == "state" or name == "package":
+            self.state_version += 1
+
+    def _count_state(self, idx, code):
+        """ย้ายการนับของ robot idx จาก state เดิมไปยัง state code ใหม่"""
+        old = self._arrays["state"][idx]
+        if old >= 0:
+            self.state_counts[old] -= 1
+        if code >= 0:
+            self.state_counts[code] += 1
+
+    def _place(self, idx, pos):
+        """ย้าย robot idx ใน occupancy grid ไปยัง pos"""
+        grid = self.occupancy
+        rows, cols = grid.shape
+        old = self._cells.get(idx)
+        if old is not None and grid[old] == idx:
+            grid[old] = -1
+        r, c = pos
+        if 0 <= r < rows and 0 <= c < cols:
+            grid[r, c] = idx
+            self._cells[idx] = (r, c)
+        else:
+            self._cells.pop(idx, None)
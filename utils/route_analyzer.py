@@ -10,7 +10,7 @@ Route Analyzer Module
 
 from collections import defaultdict, deque
 from core.settings import settings
-from utils.grid_utils import GridUtils
+from utils.grid_utils import NEIGHBORS4_BY_PREFERENCE, in_bounds, is_turn, manhattan, ordered_neighbors
 
 
 class RouteAnalyzer:
@@ -189,21 +189,16 @@ class RouteAnalyzer:
                 continue
             came_from[state] = True
             
-            directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]
-            
             # Prefer direction ที่ตรงกับ flow
             preferred = self.get_preferred_direction(current, goal, robot.get("state", "IDLE"))
-            if preferred != (0, 0):
-                directions.sort(key=lambda d: 0 if d == preferred else (1 if d == last_dir else 2))
-            elif last_dir != (0, 0):
-                directions.sort(key=lambda d: 0 if d == last_dir else 1)
+            directions = NEIGHBORS4_BY_PREFERENCE.get((preferred, last_dir)) or ordered_neighbors(preferred, last_dir)
             
             for dr, dc in directions:
                 nr, nc = current[0] + dr, current[1] + dc
                 nxt = (nr, nc)
                 new_dir = (dr, dc)
                 
-                if not GridUtils.in_bounds(nr, nc) or nxt in blocked:
+                if not in_bounds(nr, nc) or nxt in blocked:
                     continue
                 
                 # Cost calculation
@@ -214,7 +209,7 @@ class RouteAnalyzer:
                 move_cost *= max(0.5, 1.0 - highway_bonus * 0.1)
                 
                 # Turn penalty
-                if GridUtils.is_turn(last_dir, new_dir) and last_dir != (0, 0):
+                if is_turn(last_dir, new_dir) and last_dir != (0, 0):
                     move_cost += 0.8  # ลดจาก 1.5 เพื่อให้เลี้ยวได้ง่ายขึ้น
                 
                 # Corridor bonus
@@ -231,7 +226,7 @@ class RouteAnalyzer:
                 
                 if new_state not in g_score or new_g < g_score[new_state]:
                     g_score[new_state] = new_g
-                    h = GridUtils.manhattan(nxt, goal)
+                    h = manhattan(nxt, goal)
                     
                     # Goal direction bonus
                     goal_dir = (
@@ -8,9 +8,13 @@ Time-Space A* Pathfinding Module
 """
 
 import heapq
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from core.settings import settings
-from utils.grid_utils import GridUtils
+from utils.grid_utils import GridUtils, NEIGHBORS4, NEIGHBORS4_BY_PREFERENCE, manhattan, ordered_neighbors
+from utils.cell_bitmap import CellBitmap
+
+# ทิศ -> รหัสใน state index ของ A* บน grid (ลำดับเดียวกับ NEIGHBORS4, 0 = ทิศเริ่มต้นอื่นๆ)
+DIRECTION_CODES = {d: code for code, d in enumerate(NEIGHBORS4, start=1)}
 
 
 class ReservationTable:
@@ -21,10 +25,16 @@ class ReservationTable:
         self.reservations = defaultdict(dict)
         # {robot_id: [(position, timestep), ...]}
         self.robot_reservations = defaultdict(list)
+        # min-heap ของ timestep ที่มีใน reservations (clear_old ลบเฉพาะที่หมดอายุ ไม่ต้องไล่ทุก key)
+        self._timesteps = []
     
     def reserve(self, robot_id, position, timestep):
         """จองตำแหน่งในเวลาที่กำหนด"""
-        self.reservations[timestep][position] = robot_id
+        slot = self.reservations.get(timestep)
+        if slot is None:
+            slot = self.reservations[timestep] = {}
+            heapq.heappush(self._timesteps, timestep)
+        slot[position] = robot_id
         self.robot_reservations[robot_id].append((position, timestep))
     
     def reserve_path(self, robot_id, path, start_time):
@@ -44,44 +54,118 @@ class ReservationTable:
     
     def is_reserved(self, position, timestep, exclude_robot=None):
         """ตรวจสอบว่าตำแหน่งถูกจองในเวลานั้นหรือไม่"""
-        if timestep in self.reservations:
-            if position in self.reservations[timestep]:
-                reserved_by = self.reservations[timestep][position]
-                if exclude_robot is not None and reserved_by == exclude_robot:
-                    return False
-                return True
+        slot = self.reservations.get(timestep)
+        if slot is not None and position in slot:
+            if exclude_robot is not None and slot[position] == exclude_robot:
+                return False
+            return True
         return False
     
     def get_reserved_by(self, position, timestep):
         """ดูว่าใครจองตำแหน่งนี้"""
-        if timestep in self.reservations:
-            return self.reservations[timestep].get(position)
+        slot = self.reservations.get(timestep)
+        if slot is not None:
+            return slot.get(position)
         return None
     
     def clear_robot(self, robot_id):
         """ล้างการจองของหุ่นยนต์"""
         for pos, timestep in self.robot_reservations[robot_id]:
-            if timestep in self.reservations:
-                if self.reservations[timestep].get(pos) == robot_id:
-                    del self.reservations[timestep][pos]
+            slot = self.reservations.get(timestep)
+            if slot is not None and slot.get(pos) == robot_id:
+                del slot[pos]
         self.robot_reservations[robot_id] = []
     
     def clear_old(self, current_time):
-        """ล้างการจองที่ผ่านไปแล้ว"""
-        old_times = [t for t in self.reservations.keys() if t < current_time]
-        for t in old_times:
-            del self.reservations[t]
+        """ล้างการจองที่ผ่านไปแล้ว (O(log T) ต่อ timestep ที่หมดอายุ)"""
+        timesteps = self._timesteps
+        while timesteps and timesteps[0] < current_time:
+            self.reservations.pop(heapq.heappop(timesteps), None)
         
-        # ล้าง robot_reservations ด้วย
-        for robot_id in self.robot_reservations:
-            self.robot_reservations[robot_id] = [
-                (pos, t) for pos, t in self.robot_reservations[robot_id] 
-                if t >= current_time
-            ]
+        # ล้าง robot_reservations ด้วย: การจองของแต่ละ robot เรียงตามเวลา
+        # จึงตัดเฉพาะส่วนหน้าที่หมดอายุ (entry ที่ค้างอยู่ไม่มีผล เพราะ clear_robot เช็คเจ้าของก่อนลบ)
+        for entries in self.robot_reservations.values():
+            expired = 0
+            while expired < len(entries) and entries[expired][1] < current_time:
+                expired += 1
+            if expired:
+                del entries[:expired]
+
+
+class AStarWorkspace:
+    """
+    หน่วยความจำชั่วคราวของ A* ที่ใช้ซ้ำทุกครั้งที่ค้นหา
+    เก็บ path เป็น parent pointer (node_pos/node_parent) แทนการ copy list ทุกครั้งที่ push
+    """
+
+    __slots__ = ("open_set", "g_score", "closed", "node_pos", "node_parent",
+                 "state_g", "state_seen", "state_closed", "generation")
+
+    def __init__(self):
+        self.open_set = []
+        self.g_score = {}
+        self.closed = set()
+        self.node_pos = []
+        self.node_parent = []
+        # state แบบ index (A* บน grid): ค่าใน state_seen/state_closed ใช้ได้เมื่อเท่ากับ generation ปัจจุบัน
+        self.state_g = []
+        self.state_seen = []
+        self.state_closed = []
+        self.generation = 0
+
+    def reset(self):
+        """ล้างข้อมูลของการค้นหาครั้งก่อน (ไม่สร้าง container ใหม่)"""
+        self.open_set.clear()
+        self.g_score.clear()
+        self.closed.clear()
+        self.node_pos.clear()
+        self.node_parent.clear()
+
+    def begin_indexed(self, size):
+        """
+        เริ่มการค้นหาที่ใช้ state แบบ index 0..size-1 คืน (g, seen, closed, generation)
+        ไม่ต้องล้าง array: เพิ่ม generation แทน
+        """
+        grow = size - len(self.state_g)
+        if grow > 0:
+            self.state_g.extend([0.0] * grow)
+            self.state_seen.extend([0] * grow)
+            self.state_closed.extend([0] * grow)
+        self.generation += 1
+        return self.state_g, self.state_seen, self.state_closed, self.generation
+
+    def add_node(self, pos, parent):
+        """เพิ่ม node ต่อจาก parent (-1 = จุดเริ่มต้น) และคืน index ของ node"""
+        self.node_pos.append(pos)
+        self.node_parent.append(parent)
+        return len(self.node_pos) - 1
+
+    def path_to(self, node):
+        """สร้าง path จากจุดเริ่มต้น (ไม่รวม start) ถึง node"""
+        path = []
+        node_pos = self.node_pos
+        node_parent = self.node_parent
+        while node >= 0:
+            path.append(node_pos[node])
+            node = node_parent[node]
+        path.reverse()
+        return path
+
+    def trailing_count(self, node, pos, limit):
+        """นับจำนวน node ท้าย path ที่อยู่ที่ pos ติดกัน (หยุดนับเมื่อถึง limit)"""
+        count = 0
+        node_pos = self.node_pos
+        while node >= 0 and count < limit and node_pos[node] == pos:
+            count += 1
+            node = self.node_parent[node]
+        return count
 
 
 class TimeSpaceAStar:
     """Time-Space A* Pathfinder"""
+
+    # จำนวน path ของ fallback A* ที่เก็บไว้สูงสุด
+    PATH_CACHE_SIZE = 256
     
     def __init__(self, obstacles, corridor_map, robots, packages, 
                  reservation_table=None, deadlock_model=None, 
@@ -94,6 +178,22 @@ class TimeSpaceAStar:
         self.deadlock_model = deadlock_model
         self.route_analyzer = route_analyzer
         self.route_cache = route_cache
+        self.workspace = AStarWorkspace()
+        # key ของ fallback A* -> path (LRU)
+        self._path_cache = OrderedDict()
+        # ตำแหน่ง dropoff -> pid ตัวแรก, ตำแหน่ง pickup -> list ของ pid (สร้างใหม่เมื่อจำนวน package เปลี่ยน)
+        self._dropoff_at = {}
+        self._pickup_at = {}
+        self._package_index_size = None
+        # bounds + obstacles เป็น bitmap เดียว (copy แล้วเติม blocked ทุกครั้งที่ค้นหา)
+        self.obstacle_bits = CellBitmap(settings.ROWS, settings.COLS, obstacles, border=True)
+        # ตารางตาม index ของ obstacle_bits (obstacles/corridor_map ไม่เปลี่ยนระหว่าง simulation)
+        # ทางแคบ = ช่องที่มีเพื่อนบ้าน 4 ทิศเป็นขอบ/obstacle ตั้งแต่ 2 ช่อง (เปิดได้ไม่เกิน 2 ทิศ)
+        self._narrow_cells = bytes(n >= 2 for n in self.obstacle_bits.neighbor_counts())
+        self._corridor_scores = [0] * len(self.obstacle_bits.bits)
+        for pos, score in corridor_map.items():
+            if GridUtils.in_bounds(*pos):
+                self._corridor_scores[self.obstacle_bits.index(pos)] = score
     
     def find_path(self, start, goal, start_time, robot, blocked=None):
         """
@@ -140,20 +240,33 @@ class TimeSpaceAStar:
         
         # A* Search in Time-Space
         # State: (position, time, last_direction)
-        # Priority queue: (f_score, g_score, position, time, last_dir, path)
-        
-        open_set = [(0, 0, start, start_time, robot["last_dir"], [])]
-        came_from = {}
-        g_score = {(start, start_time, robot["last_dir"]): 0}
+        # Priority queue: (f_score, g_score, position, time, last_dir, node)
+        # node = index ใน workspace สำหรับย้อน path (state เดียวกันจะไม่มี g ซ้ำ จึงไม่ถูกใช้เทียบลำดับ)
+        ws = self.workspace
+        ws.reset()
+        open_set = ws.open_set
+        came_from = ws.closed
+        g_score = ws.g_score
+        blocked_bits, stride = self._blocked_bits(blocked, robot, goal)
+        profile = self._cost_profile(robot)
+        open_set.append((0, 0, start, start_time, robot["last_dir"], -1))
+        g_score[(start, start_time, robot["last_dir"])] = 0
         
         max_time = start_time + settings.TIME_HORIZON
+        max_waits = settings.MAX_WAIT_ACTIONS
+        direction_order = NEIGHBORS4_BY_PREFERENCE
+        heappush, heappop = heapq.heappush, heapq.heappop
+        add_node = ws.add_node
         
         while open_set:
-            _, g, current, current_time, last_dir, path = heapq.heappop(open_set)
+            _, g, current, current_time, last_dir, node = heappop(open_set)
             
             # ถึงเป้าหมายแล้ว
             if current == goal:
-                result_path = path + [current] if current != start else path
+                # path_to สร้าง list ใหม่อยู่แล้ว ต่อท้ายได้เลยไม่ต้อง copy
+                result_path = ws.path_to(node)
+                if current != start:
+                    result_path.append(current)
                 
                 # Cache the result
                 if self.route_cache and len(result_path) > 0 and not is_stuck:
@@ -168,21 +281,15 @@ class TimeSpaceAStar:
             state = (current, current_time, last_dir)
             if state in came_from:
                 continue
-            came_from[state] = True
+            came_from.add(state)
             
             # Generate successors: 4 directions + WAIT
             # Actions: MOVE_UP, MOVE_DOWN, MOVE_LEFT, MOVE_RIGHT, WAIT
-            directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]
-            
-            # ใช้ RouteAnalyzer เฉพาะเมื่อไม่ติดขัด
+            # ใช้ RouteAnalyzer เฉพาะเมื่อไม่ติดขัด (ทิศ preferred ก่อน แล้ว last_dir)
+            preferred = (0, 0)
             if use_route_system:
                 preferred = self.route_analyzer.get_preferred_direction(current, goal, robot.get("state", "IDLE"))
-                if preferred != (0, 0):
-                    directions.sort(key=lambda d: 0 if d == preferred else (1 if d == last_dir else 2))
-                elif last_dir != (0, 0):
-                    directions.sort(key=lambda d: 0 if d == last_dir else 1)
-            elif last_dir != (0, 0):
-                directions.sort(key=lambda d: 0 if d == last_dir else 1)
+            directions = direction_order.get((preferred, last_dir)) or ordered_neighbors(preferred, last_dir)
             
             next_time = current_time + 1
             
@@ -192,14 +299,8 @@ class TimeSpaceAStar:
                 nxt = (nr, nc)
                 new_dir = (dr, dc)
                 
-                # ตรวจสอบ bounds และ obstacles
-                if not GridUtils.in_bounds(nr, nc) or nxt in self.obstacles or nxt in blocked:
-                    continue
-                
-                # ตรวจสอบสิทธิ์เข้า dropoff/pickup
-                if nxt != goal and not self.can_enter_dropoff(robot, nxt):
-                    continue
-                if nxt != goal and not self.can_enter_pickup(robot, nxt):
+                # ตรวจสอบ bounds, obstacles, blocked และสิทธิ์เข้า dropoff/pickup (รวมใน bitmap แล้ว)
+                if blocked_bits[(nr + 1) * stride + nc + 1]:
                     continue
                 
                 # ตรวจสอบ reservation (Time-Space collision avoidance)
@@ -212,14 +313,14 @@ class TimeSpaceAStar:
                     continue
                 
                 # คำนวณ cost
-                move_cost = self._calculate_move_cost(robot, current, nxt, last_dir, new_dir, use_route_system)
+                move_cost = self._calculate_move_cost(profile, nxt, last_dir, new_dir, use_route_system)
                 
                 new_g = g + move_cost
                 new_state = (nxt, next_time, new_dir)
                 
                 if new_state not in g_score or new_g < g_score[new_state]:
                     g_score[new_state] = new_g
-                    h = GridUtils.manhattan(nxt, goal)
+                    h = manhattan(nxt, goal)
                     
                     # Heuristic improvements
                     goal_dir = (
@@ -233,20 +334,14 @@ class TimeSpaceAStar:
                         h *= 0.95
                     
                     f = new_g + h
-                    new_path = path + [nxt]
-                    heapq.heappush(open_set, (f, new_g, nxt, next_time, new_dir, new_path))
+                    heappush(open_set, (f, new_g, nxt, next_time, new_dir, add_node(nxt, node)))
             
             # === WAIT Action ===
             # นับจำนวน consecutive waits ใน path
-            consecutive_waits = 0
-            for p in reversed(path):
-                if p == current:
-                    consecutive_waits += 1
-                else:
-                    break
+            consecutive_waits = ws.trailing_count(node, current, max_waits)
             
             # ถ้ายังไม่เกิน MAX_WAIT_ACTIONS ให้ลอง WAIT
-            if consecutive_waits < settings.MAX_WAIT_ACTIONS:
+            if consecutive_waits < max_waits:
                 # WAIT = อยู่ที่เดิม ไปเวลาถัดไป
                 # ตรวจสอบว่ายังอยู่ที่เดิมได้หรือไม่
                 if not self.reservation_table.is_reserved(current, next_time, robot["id"]):
@@ -256,13 +351,12 @@ class TimeSpaceAStar:
                     
                     if wait_state not in g_score or new_g_wait < g_score[wait_state]:
                         g_score[wait_state] = new_g_wait
-                        h = GridUtils.manhattan(current, goal)
+                        h = manhattan(current, goal)
                         f = new_g_wait + h
                         
                         # path ยังคงเป็น current (WAIT ไม่เพิ่ม position ใหม่ แต่อยู่ที่เดิม)
                         # เราจะเก็บ current ซ้ำเพื่อแสดงว่า WAIT
-                        new_path_wait = path + [current]
-                        heapq.heappush(open_set, (f, new_g_wait, current, next_time, last_dir, new_path_wait))
+                        heappush(open_set, (f, new_g_wait, current, next_time, last_dir, add_node(current, node)))
         
         # ถ้าหาไม่เจอใน time-space ให้ fallback ไป basic A*
         return self._fallback_astar(start, goal, robot, blocked)
@@ -277,20 +371,32 @@ class TimeSpaceAStar:
                 return True
         return False
     
-    def _calculate_move_cost(self, robot, current, nxt, last_dir, new_dir, use_route_system):
-        """คำนวณ cost ของการเคลื่อนที่ (เหมือน smart_astar เดิม)"""
-        move_cost = 1.0
-        
+    def _cost_profile(self, robot):
+        """
+        ค่าของ robot ที่คงที่ตลอดการค้นหาหนึ่งครั้ง คำนวณครั้งเดียวก่อนเริ่ม A*
+        คืน (cost ตั้งต้น + robot bias, turn penalty, ตัวคูณ momentum หรือ None, priority < 2000)
+        """
+        momentum = robot["momentum"]
+        return (
+            1.0 + (robot["id"] % 3) * 0.15,
+            settings.TURN_PENALTY * 0.7,
+            max(0.65, 1.0 - momentum * 0.06) if momentum > 0 else None,
+            self._get_robot_priority(robot) < 2000,
+        )
+
+    def _calculate_move_cost(self, profile, nxt, last_dir, new_dir, use_route_system):
+        """คำนวณ cost ของการเคลื่อนที่ (เหมือน smart_astar เดิม) profile มาจาก _cost_profile"""
         # 1. Robot-specific bias
-        robot_bias = (robot["id"] % 3) * 0.15
-        move_cost += robot_bias
+        move_cost, turn_penalty, momentum_factor, low_priority = profile
         
         # 2. Turn Penalty
-        if GridUtils.is_turn(last_dir, new_dir) and last_dir != (0, 0):
-            move_cost += settings.TURN_PENALTY * 0.7
+        turning = last_dir != new_dir and last_dir != (0, 0)
+        if turning:
+            move_cost += turn_penalty
         
-        # 3. Corridor Bonus
-        corridor_score = self.corridor_map.get(nxt, 0)
+        # 3. Corridor Bonus (nxt ผ่านการเช็ค bounds มาแล้ว อ่านจากตารางได้เลย)
+        i = (nxt[0] + 1) * self.obstacle_bits.stride + nxt[1] + 1
+        corridor_score = self._corridor_scores[i]
         if corridor_score >= 6:
             move_cost *= settings.CORRIDOR_BONUS
         elif corridor_score <= 2:
@@ -306,22 +412,22 @@ class TimeSpaceAStar:
                 move_cost *= 0.92
         
         # 5. Momentum Bonus
-        if not GridUtils.is_turn(last_dir, new_dir) and robot["momentum"] > 0:
-            move_cost *= max(0.65, 1.0 - robot["momentum"] * 0.06)
+        if not turning and momentum_factor is not None:
+            move_cost *= momentum_factor
         
         # 6. Narrow Passage Detection
-        if self._is_narrow_passage(nxt):
-            priority = self._get_robot_priority(robot)
-            if priority < 2000:
-                move_cost *= 1.5
+        if low_priority and self._narrow_cells[i]:
+            move_cost *= 1.5
         
         return move_cost
     
-    def _is_narrow_passage(self, pos):
+    def is_narrow_passage(self, pos):
         """ตรวจสอบว่าตำแหน่งนี้เป็นทางแคบหรือไม่"""
         r, c = pos
+        if GridUtils.in_bounds(r, c):
+            return self._narrow_cells[self.obstacle_bits.index(pos)] == 1
         open_count = 0
-        for dr, dc in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+        for dr, dc in NEIGHBORS4:
             nr, nc = r + dr, c + dc
             if GridUtils.in_bounds(nr, nc) and (nr, nc) not in self.obstacles:
                 open_count += 1
@@ -344,18 +450,30 @@ class TimeSpaceAStar:
         momentum_bonus = robot.get("momentum", 0) * 50
         return base + wait_bonus + dist_bonus + momentum_bonus
     
+    def _package_index(self):
+        """
+        (dropoff -> pid, pickup -> [pid, ...]) ของ packages
+        ตำแหน่งของ package ไม่เปลี่ยน จึงสร้างใหม่เฉพาะเมื่อมี package เพิ่ม/ลด
+        """
+        packages = self.packages
+        if self._package_index_size != len(packages):
+            dropoff_at, pickup_at = {}, {}
+            for pid, pkg in packages.items():
+                # can_enter_dropoff ตัดสินจาก package ตัวแรกที่ dropoff ตรงกัน
+                dropoff_at.setdefault(pkg["dropoff"], pid)
+                pickup_at.setdefault(pkg["pickup"], []).append(pid)
+            self._dropoff_at, self._pickup_at = dropoff_at, pickup_at
+            self._package_index_size = len(packages)
+        return self._dropoff_at, self._pickup_at
+    
     def can_enter_dropoff(self, robot, pos):
         """ตรวจสอบสิทธิ์การเข้าจุด Dropoff"""
-        for pid, pkg in self.packages.items():
-            if pkg["dropoff"] == pos:
-                if robot["package"] == pid and robot["state"] == "TO_DROPOFF":
-                    return True
-                if pkg["status"] == "DELIVERED":
-                    return True
-                if pkg["status"] == "WAITING":
-                    return True
-                return False
-        return True
+        pid = self._package_index()[0].get(pos)
+        if pid is None:
+            return True
+        if robot["package"] == pid and robot["state"] == "TO_DROPOFF":
+            return True
+        return self.packages[pid]["status"] in ("DELIVERED", "WAITING")
     
     def can_enter_pickup(self, robot, pos):
         """ตรวจสอบสิทธิ์การเข้าจุด Pickup"""
@@ -364,54 +482,116 @@ class TimeSpaceAStar:
             if my_pkg["pickup"] == pos and robot["state"] == "TO_PICKUP":
                 return True
         
-        for pid, pkg in self.packages.items():
-            if pkg["pickup"] == pos:
-                if pkg["status"] == "WAITING":
+        pids = self._package_index()[1].get(pos)
+        if pids:
+            packages = self.packages
+            for pid in pids:
+                if packages[pid]["status"] == "WAITING":
                     return False
         return True
     
+    def _blocked_bits(self, blocked, robot, goal):
+        """
+        bitmap ของ bounds + obstacles + blocked สำหรับการค้นหาหนึ่งครั้ง คืน (bits, stride)
+        รวมจุด dropoff/pickup ที่ robot เข้าไม่ได้ (ยกเว้น goal) เพราะสถานะ package ไม่เปลี่ยนระหว่างค้นหา
+        """
+        return self._search_bits(set(blocked).difference(self.obstacles), self._restricted_cells(robot, goal))
+
+    def _search_bits(self, extra_blocked, restricted):
+        """copy ของ obstacle_bits ที่เติม blocked (นอกเหนือ obstacles) และจุดที่เข้าไม่ได้ คืน (bits, stride)"""
+        bits = self.obstacle_bits.copy()
+        bits.update(extra_blocked)
+        bits.update(restricted)
+        return bits.bits, bits.stride
+
+    def _restricted_cells(self, robot, goal):
+        """จุด dropoff/pickup (ไม่รวม goal) ที่ can_enter_dropoff หรือ can_enter_pickup ไม่อนุญาต"""
+        dropoff_at, pickup_at = self._package_index()
+        cells = dropoff_at.keys() | pickup_at.keys()
+        cells.discard(goal)
+        return [
+            pos for pos in cells
+            if not self.can_enter_dropoff(robot, pos) or not self.can_enter_pickup(robot, pos)
+        ]
+
     def _fallback_astar(self, start, goal, robot, blocked):
-        """Fallback A* แบบเดิม (ไม่มี time dimension)"""
+        """
+        Fallback A* แบบเดิม (ไม่มี time dimension)
+        ผลขึ้นกับ input ใน key เท่านั้น (obstacles/corridor_map คงที่) จึง cache ไว้ใช้ข้าม tick ได้
+        """
         if start == goal:
             return []
         
-        open_set = [(0, 0, start, robot["last_dir"], [])]
-        came_from = {}
-        g_score = {(start, robot["last_dir"]): 0}
+        extra_blocked = frozenset(blocked).difference(self.obstacles)
+        restricted = frozenset(self._restricted_cells(robot, goal))
+        profile = self._cost_profile(robot)
+        key = (start, goal, robot["last_dir"], profile, extra_blocked, restricted)
+        cache = self._path_cache
+        cached = cache.get(key)
+        if cached is not None:
+            cache.move_to_end(key)
+            return list(cached)
+        
+        path = self._search_fallback(start, goal, robot["last_dir"], profile,
+                                     self._search_bits(extra_blocked, restricted))
+        cache[key] = tuple(path)
+        if len(cache) > self.PATH_CACHE_SIZE:
+            cache.popitem(last=False)
+        return path
+
+    def _search_fallback(self, start, goal, start_dir, profile, search_bits):
+        """
+        A* บน grid (state = ตำแหน่ง + ทิศล่าสุด) ด้วย bitmap และ cost profile ที่เตรียมไว้
+        state index = index ของช่องใน bitmap * 5 + รหัสทิศ (0 = ทิศเริ่มต้นที่ไม่ใช่ 4 ทิศ)
+        """
+        ws = self.workspace
+        ws.reset()
+        open_set = ws.open_set
+        blocked_bits, stride = search_bits
+        g_best, seen, closed, gen = ws.begin_indexed(len(blocked_bits) * 5)
+        dir_codes = DIRECTION_CODES
+        start_state = ((start[0] + 1) * stride + start[1] + 1) * 5 + dir_codes.get(start_dir, 0)
+        g_best[start_state] = 0
+        seen[start_state] = gen
+        # state ต่อท้าย node (node ไม่ซ้ำกัน จึงไม่ถูกใช้เทียบลำดับใน heap)
+        open_set.append((0, 0, start, start_dir, -1, start_state))
+        heappush, heappop = heapq.heappush, heapq.heappop
+        add_node = ws.add_node
+        move_cost_of = self._calculate_move_cost
         
         while open_set:
-            _, g, current, last_dir, path = heapq.heappop(open_set)
+            _, g, current, last_dir, node, state = heappop(open_set)
             
             if current == goal:
-                return path + [current] if current != start else path
+                path = ws.path_to(node)
+                if current != start:
+                    path.append(current)
+                return path
             
-            state = (current, last_dir)
-            if state in came_from:
+            if closed[state] == gen:
                 continue
-            came_from[state] = True
+            closed[state] = gen
             
-            for dr, dc in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                nr, nc = current[0] + dr, current[1] + dc
-                nxt = (nr, nc)
-                new_dir = (dr, dc)
+            r, c = current
+            for new_dir, code in dir_codes.items():
+                dr, dc = new_dir
+                nr, nc = r + dr, c + dc
+                cell = (nr + 1) * stride + nc + 1
                 
-                if not GridUtils.in_bounds(nr, nc) or nxt in self.obstacles or nxt in blocked:
-                    continue
-                if nxt != goal and not self.can_enter_dropoff(robot, nxt):
-                    continue
-                if nxt != goal and not self.can_enter_pickup(robot, nxt):
+                if blocked_bits[cell]:
                     continue
                 
-                move_cost = self._calculate_move_cost(robot, current, nxt, last_dir, new_dir, False)
+                nxt = (nr, nc)
+                move_cost = move_cost_of(profile, nxt, last_dir, new_dir, False)
                 new_g = g + move_cost
-                new_state = (nxt, new_dir)
+                new_state = cell * 5 + code
                 
-                if new_state not in g_score or new_g < g_score[new_state]:
-                    g_score[new_state] = new_g
-                    h = GridUtils.manhattan(nxt, goal)
+                if seen[new_state] != gen or new_g < g_best[new_state]:
+                    seen[new_state] = gen
+                    g_best[new_state] = new_g
+                    h = manhattan(nxt, goal)
                     f = new_g + h
-                    new_path = path + [nxt]
-                    heapq.heappush(open_set, (f, new_g, nxt, new_dir, new_path))
+                    heappush(open_set, (f, new_g, nxt, new_dir, add_node(nxt, node), new_state))
         
         return []
     